@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Song, Ranking, RankingEntry
+from . import search
+from .models import Song, Ranking, RankingChange, RankingEntry, RankingSnapshot
 
 
 @admin.register(Song)
@@ -7,6 +8,12 @@ class SongAdmin(admin.ModelAdmin):
     list_display = ("s_yt_id", "s_title", "s_artist", "s_released", "s_created_on", "s_last_updated")
     search_fields = ("s_yt_id", "s_title", "s_artist")
 
+    def get_search_results(self, request, queryset, search_term):
+        # The full-text index instead of a LIKE '%...%' scan over every song
+        if not search_term or not search.is_available():
+            return super().get_search_results(request, queryset, search_term)
+        return search.filter_matching(queryset, search_term) | queryset.filter(s_yt_id=search_term.strip()), False
+
 
 @admin.register(Ranking)
 class RankingAdmin(admin.ModelAdmin):
@@ -16,5 +23,20 @@ class RankingAdmin(admin.ModelAdmin):
 
 @admin.register(RankingEntry)
 class RankingEntryAdmin(admin.ModelAdmin):
-    list_display = ("ranking", "song", "r_rank", "r_last_updated")
+    list_display = ("ranking", "song", "r_key", "r_last_updated")
     list_filter = ("ranking",)
+    list_select_related = ("ranking", "song")
+
+
+@admin.register(RankingChange)
+class RankingChangeAdmin(admin.ModelAdmin):
+    list_display = ("ranking", "version", "kind", "song_id", "created_on")
+    list_filter = ("ranking", "kind")
+    list_select_related = ("ranking",)
+
+
+@admin.register(RankingSnapshot)
+class RankingSnapshotAdmin(admin.ModelAdmin):
+    list_display = ("ranking", "version", "reason", "size", "created_on")
+    list_filter = ("ranking", "reason")
+    list_select_related = ("ranking",)
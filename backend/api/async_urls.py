@@ -0,0 +1,22 @@
+# async_urls.py
+"""
+URLconf of the api app for requests served under ASGI (see api.middleware):
+api.urls with the GETs of the hot read endpoints served by api.async_views.
+"""
+from django.urls import path
+from . import async_views, urls
+from .views import SongList, song_lookup, RankingList, RankingDetail
+
+songs = async_views.async_reads(SongList.as_view())(async_views.song_list)
+lookup = async_views.async_reads(song_lookup)(async_views.song_lookup)
+rankings = async_views.async_reads(RankingList.as_view())(async_views.ranking_list)
+ranking_detail = async_views.async_reads(RankingDetail.as_view())(async_views.ranking_detail)
+
+# Listed first, so they take precedence over the same routes in api.urls
+urlpatterns = [
+    path("songs/", songs),  # accepts ?list=<slug>
+    path("songs/lookup/", lookup),
+    path("rankings/", rankings),
+    path("rankings/<int:pk>/", ranking_detail),
+    *urls.urlpatterns,
+]
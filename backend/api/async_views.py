@@ -0,0 +1,156 @@
+# async_views.py
+"""
+Async versions of the hot read endpoints, for running under ASGI.
+
+DRF views are synchronous, so each of songs/, songs/lookup/, rankings/ and
+rankings/<pk>/ is served by a plain Django coroutine view built with
+``async_reads``: GETs it can answer on its own (the plain JSON responses) are
+handled with the async ORM, everything else (writes, paginated or browsable
+API requests) is passed on to the DRF view, which Django runs in a thread.
+Response bodies and status codes are the same as the DRF views'.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+from . import compression, response_cache
+from .models import Ranking, Song
+from .pagination import RankKeysetPagination
+from .renderers import COLUMNAR_RENDERERS, render_json
+from .serializers import RankingSerializer, SongSerializer, song_representer
+from .views import (
+    EXPORT_CHUNK_SIZE,
+    RANKINGS_STATE,
+    SongList,
+    _ranking_rows,
+    _rankings_etag,
+    _selected_slug,
+    _with_validators,
+)
+
+JSON = "application/json"
+
+
+def async_reads(sync_view):
+    """Serve GETs with the decorated coroutine; it returns None to hand a request over to ``sync_view``."""
+
+    def decorator(handler):
+        fallback = sync_to_async(sync_view)
+
+        @functools.wraps(handler)
+        async def view(request, *args, **kwargs):
+            if request.method == "GET" and _wants_json(request):
+                response = await handler(request, *args, **kwargs)
+                if response is not None:
+                    return response
+            return await fallback(request, *args, **kwargs)
+
+        # Like DRF views; they authenticate with JWT, not sessions
+        view.csrf_exempt = True
+        return view
+
+    return decorator
+
+
+def _wants_json(request) -> bool:
+    # DRF would pick its browsable API renderer for these
+    return "format" not in request.GET and "text/html" not in request.headers.get("Accept", "")
+
+
+def _json(body: bytes, hit: bool) -> HttpResponse:
+    response = HttpResponse(body, content_type=JSON)
+    response.headers["X-Cache"] = "hit" if hit else "miss"
+    return response
+
+
+def _not_found(detail: str) -> HttpResponse:
+    # As DRF renders NotFound
+    return HttpResponse(render_json({"detail": detail}), content_type=JSON, status=404)
+
+
+async def _conditional_get(request, etag: str, last_modified, respond):
+    # Async counterpart of views._conditional_get; ``respond`` is a coroutine function
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = await respond()
+    return _with_validators(response, etag, timestamp)
+
+
+async def song_list(request):
+    # Columnar formats and lists of some fields are left to the DRF view
+    if not SongList.fast_json or RankKeysetPagination.is_requested(request) or "fields" in request.GET:
+        return None
+    if any(renderer.media_type in request.headers.get("Accept", "") for renderer in COLUMNAR_RENDERERS):
+        return None
+    slug = _selected_slug(request)
+    ranking = await Ranking.objects.filter(slug=slug).afirst()
+    if ranking is None:
+        return _not_found(f"Ranking '{slug}' does not exist.")
+
+    async def render():
+        represent = song_representer()
+        # Named rows: Django 5.0.1 runs the query of a plain values_list().aiterator() in the event loop
+        rows = _ranking_rows(ranking, named=True).aiterator(chunk_size=EXPORT_CHUNK_SIZE)
+        return render_json([represent(row + (rank,)) async for rank, row in _aenumerate(rows, start=1)])
+
+    async def respond():
+        encoding = compression.negotiate(request.headers.get("Accept-Encoding", "")) if SongList.precompressed else None
+        body, hit = await compression.acached(response_cache.ranking_key(ranking.pk), render, ranking.version, encoding)
+        return compression.encoded(_json(body, hit), encoding)
+
+    response = await _conditional_get(request, ranking.etag, ranking.updated_on, respond)
+    # As in SongList.get: the representation depends on Accept
+    patch_vary_headers(response, ["Accept"])
+    return response
+
+
+async def _aenumerate(rows, start=0):
+    index = start
+    async for row in rows:
+        yield index, row
+        index += 1
+
+
+async def song_lookup(request):
+    yt_id = request.GET.get("yt_id")
+    if not yt_id:
+        return JsonResponse({"detail": "yt_id is required"}, status=400)
+
+    async def render():
+        song = await Song.objects.filter(s_yt_id=yt_id).afirst()
+        return dict(SongSerializer(song).data) if song else None
+
+    data, hit = await response_cache.aget_or_render(response_cache.song_key(yt_id), render)
+    if data is None:
+        return JsonResponse({"detail": "not found"}, status=404)
+    response = JsonResponse(data, safe=False)
+    response.headers["X-Cache"] = "hit" if hit else "miss"
+    return response
+
+
+async def ranking_list(request):
+    etag = _rankings_etag(await Ranking.objects.aaggregate(**RANKINGS_STATE))
+
+    async def render():
+        rankings = Ranking.objects.order_by("created_on")
+        return render_json([RankingSerializer(ranking).data async for ranking in rankings])
+
+    async def respond():
+        body, hit = await response_cache.aget_or_render(response_cache.RANKINGS_KEY, render, tag=etag)
+        return _json(body, hit)
+
+    return await _conditional_get(request, etag, None, respond)
+
+
+async def ranking_detail(request, pk):
+    ranking = await Ranking.objects.filter(pk=pk).afirst()
+    if ranking is None:
+        return _not_found("Not found.")
+
+    async def respond():
+        return HttpResponse(render_json(RankingSerializer(ranking).data), content_type=JSON)
+
+    return await _conditional_get(request, ranking.etag, ranking.updated_on, respond)
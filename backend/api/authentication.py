@@ -0,0 +1,117 @@
+# authentication.py
+"""
+JWT authentication without a User query per request.
+
+``StatelessJWTAuthentication`` verifies the access token and builds the user
+from its claims (a simplejwt TokenUser with the token's user id and
+``is_staff``), where simplejwt's JWTAuthentication loads the User row on
+every request. ``tokens_for`` issues tokens carrying these claims.
+
+Revocation is checked against a process-local cache of each user's state
+(active, staff, password hash), loaded from the database at most once per
+TTL seconds per user. A token is refused once its user is deleted or
+deactivated, loses staff status while the token claims it, or changes
+password (the token's ``hash_password`` claim no longer matches, see
+SIMPLE_JWT["CHECK_REVOKE_TOKEN"]; tokens issued without the claim are let
+through until they expire). Changes saved in this process apply
+when they commit; changes made by other processes after at most TTL
+seconds. Refreshing a token goes through the same check.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+TTL = 30
+MAX_USERS = 1000
+STAFF_CLAIM = "is_staff"
+
+# user id -> (expiry, (is_active, is_staff, password hash)); None for a user that doesn't exist
+_users: dict = {}
+
+
+def tokens_for(user) -> RefreshToken:
+    """A refresh token for ``user`` whose access tokens carry the claims StatelessJWTAuthentication needs."""
+    refresh = RefreshToken.for_user(user)
+    refresh[STAFF_CLAIM] = user.is_staff
+    return refresh
+
+
+def _state(user_id):
+    cached = _users.get(user_id)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    User = get_user_model()
+    row = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values_list("is_active", "is_staff", "password").first()
+    state = None if row is None else (row[0], row[1], get_md5_hash_password(row[2]))
+    if len(_users) >= MAX_USERS:
+        # Rarely reached with a handful of editors; starting over is simpler than LRU bookkeeping
+        _users.clear()
+    _users[user_id] = (time.monotonic() + TTL, state)
+    return state
+
+
+def check_revocation(token) -> bool:
+    """
+    Raise AuthenticationFailed if ``token`` (access or refresh) no longer stands
+    for an active user. Returns whether the user is staff.
+    """
+    try:
+        user_id = token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken(_("Token contained no recognizable user identification"))
+    state = _state(user_id)
+    if state is None:
+        raise AuthenticationFailed(_("User not found"), code="user_not_found")
+    is_active, is_staff, password_hash = state
+    if not is_active:
+        raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+    if token.get(STAFF_CLAIM) and not is_staff:
+        raise AuthenticationFailed(_("The user's permissions have changed."), code="permissions_changed")
+    claimed_hash = token.get(api_settings.REVOKE_TOKEN_CLAIM)
+    if api_settings.CHECK_REVOKE_TOKEN and claimed_hash is not None and claimed_hash != password_hash:
+        raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+    return is_staff
+
+
+def forget(user_id) -> None:
+    """Drop a user's cached state once the current transaction commits, or right away outside of one."""
+    transaction.on_commit(lambda: _users.pop(user_id, None))
+
+
+def clear() -> None:
+    _users.clear()
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL, dispatch_uid="api.authentication.forget")
+def _user_changed(sender, instance, **kwargs):
+    forget(instance.pk)
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """JWTAuthentication building the user from the token's claims; see the module docstring."""
+
+    def get_user(self, validated_token):
+        is_staff = check_revocation(validated_token)
+        if STAFF_CLAIM not in validated_token:
+            # Issued before the claim was added (by RefreshToken.for_user): go by the user's current status
+            validated_token[STAFF_CLAIM] = is_staff
+        return super().get_user(validated_token)
+
+
+class RevocationCheckingTokenRefreshSerializer(TokenRefreshSerializer):
+    """TokenRefreshSerializer refusing refresh tokens of revoked users, see check_revocation."""
+
+    def validate(self, attrs):
+        check_revocation(self.token_class(attrs["refresh"]))
+        return super().validate(attrs)
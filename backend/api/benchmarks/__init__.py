@@ -0,0 +1,139 @@
+"""
+Benchmarks for the api app.
+
+Run them with ``python manage.py benchmark <name>``; see that command for the
+available options. Every benchmark runs against a throwaway test database
+created for the run, never against the configured one.
+"""
+import contextlib
+import csv
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api import resolver, response_cache
+from api.importer import REQUIRED_COLUMNS
+from api.models import OrphanCandidate, Song, Ranking, RankingEntry
+from api.ordering import key_for_rank
+
+BATCH_SIZE = 1000
+
+
+@contextlib.contextmanager
+def isolated_database(on_disk: bool = False):
+    """
+    Create a fresh test database for the duration of a benchmark run.
+
+    SQLite test databases live in memory; ``on_disk`` puts it in a temporary
+    file instead, so it can be shared by several processes.
+    """
+    setup_test_environment()
+    with contextlib.ExitStack() as stack:
+        if on_disk and connection.vendor == "sqlite":
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+            test_settings = connection.settings_dict.setdefault("TEST", {})
+            old_test_name = test_settings.get("NAME")
+            test_settings["NAME"] = os.path.join(directory, "benchmark.sqlite3")
+            stack.callback(test_settings.__setitem__, "NAME", old_test_name)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+
+def seed_ranking(slug: str, size: int, *, offset: int = 0, key=key_for_rank) -> Ranking:
+    """
+    Create a ranking with ``size`` songs ranked 1..size.
+
+    Songs get yt_ids derived from ``offset + i``, so rankings seeded with
+    overlapping offsets share songs. Existing songs are reused.
+    """
+    ranking, _ = Ranking.objects.get_or_create(slug=slug, defaults={"name": slug})
+    yt_ids = [f"{offset + i:011d}" for i in range(size)]
+    existing = Song.objects.in_bulk(yt_ids, field_name="s_yt_id")
+    Song.objects.bulk_create(
+        [
+            Song(s_yt_id=yt_id, s_artist=f"Artist {i % 997}", s_title=f"Title {offset + i}", s_album=f"Album {i % 331}")
+            for i, yt_id in enumerate(yt_ids)
+            if yt_id not in existing
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    song_ids = Song.objects.in_bulk(yt_ids, field_name="s_yt_id")
+    RankingEntry.objects.bulk_create(
+        [RankingEntry(ranking=ranking, song=song_ids[yt_id], r_key=key(i)) for i, yt_id in enumerate(yt_ids, start=1)],
+        batch_size=BATCH_SIZE,
+    )
+    return ranking
+
+
+def generate_dataset(size: int, rankings: int = 3, shared: float = 0.5, prefix: str = "synthetic") -> list[Ranking]:
+    """
+    Create ``rankings`` rankings of ``size`` songs each, named ``<prefix>-0``, ``<prefix>-1``, ...
+
+    Each ranking shares the ``shared`` fraction of its songs with the next
+    one, so songs belong to one or more rankings as in real data.
+    """
+    step = max(1, round(size * (1 - shared)))
+    return [seed_ranking(f"{prefix}-{index}", size, offset=index * step) for index in range(rankings)]
+
+
+def write_csv(path, size: int, *, offset: int = 0) -> None:
+    """Write a CSV of ``size`` songs ranked 1..size in the format import_songs reads."""
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(REQUIRED_COLUMNS)
+        for i in range(size):
+            writer.writerow([f"{offset + i:011d}", f"Artist {i % 997}", f"Title {offset + i}", f"Album {i % 331}", 2000 + i % 25, "", "", i + 1])
+
+
+def clear() -> None:
+    """Remove all benchmark data, keeping the schema."""
+    RankingEntry.objects.all().delete()
+    Ranking.objects.all().delete()
+    Song.objects.all().delete()
+    OrphanCandidate.objects.all().delete()
+    # Recreated rankings may reuse slugs and ids
+    resolver.clear()
+    caches[response_cache.CACHE_ALIAS].clear()
+
+
+def measure(fn, repeat: int) -> list[float]:
+    """Call ``fn`` ``repeat`` times and return the wall-clock durations in seconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: list[float]) -> dict:
+    """Mean, median and p99 of ``samples`` in milliseconds."""
+    return {
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+
+def format_table(headers: list[str], rows: list[list]) -> str:
+    """Render rows as a plain-text table; floats are shown with two decimals."""
+    cells = [headers] + [[f"{c:.2f}" if isinstance(c, float) else str(c) for c in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    lines = ["  ".join(c.rjust(w) for c, w in zip(row, widths)) for row in cells]
+    lines.insert(1, "  ".join("-" * w for w in widths))
+    return "\n".join(lines)
@@ -0,0 +1,93 @@
+"""
+Throughput and latency of the read endpoints with 500 concurrent clients,
+served synchronously (WSGI handler, one thread per client as in a threaded
+server) and asynchronously (ASGI handler, one event loop), on the same data.
+
+Requests go straight to Django's handlers through the test clients, so no
+network or server is involved. Each client sends ``--repeat`` requests,
+cycling through songs/, rankings/<pk>/ and songs/lookup/ for varying songs.
+"""
+import asyncio
+import threading
+import time
+
+from django.core.cache import caches
+from django.db import connections
+from django.test import AsyncClient, Client
+
+from api import response_cache
+
+from . import clear, format_table, seed_ranking, summarize
+
+DEFAULT_SIZES = (1_000,)
+ON_DISK = True  # connections from many threads
+CLIENTS = 500
+
+
+def _paths(ranking, yt_ids, client_index, repeat):
+    for request_index in range(repeat):
+        kind = (client_index + request_index) % 3
+        if kind == 0:
+            yield "/api/songs/?list=bench"
+        elif kind == 1:
+            yield f"/api/rankings/{ranking.pk}/"
+        else:
+            yield f"/api/songs/lookup/?yt_id={yt_ids[(client_index * repeat + request_index) % len(yt_ids)]}"
+
+
+def _wsgi(ranking, yt_ids, repeat):
+    latencies, errors = [], []
+
+    def client_loop(index):
+        client = Client()
+        for path in _paths(ranking, yt_ids, index, repeat):
+            start = time.perf_counter()
+            response = client.get(path)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(path)
+        connections.close_all()
+
+    threads = [threading.Thread(target=client_loop, args=(index,)) for index in range(CLIENTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def _asgi(ranking, yt_ids, repeat):
+    latencies, errors = [], []
+
+    async def client_loop(index):
+        client = AsyncClient()
+        for path in _paths(ranking, yt_ids, index, repeat):
+            start = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(path)
+
+    async def main():
+        await asyncio.gather(*(client_loop(index) for index in range(CLIENTS)))
+
+    asyncio.run(main())
+    return latencies, errors
+
+
+def run(stdout, sizes, repeat):
+    rows = []
+    for size in sizes:
+        clear()
+        ranking = seed_ranking("bench", size)
+        yt_ids = list(ranking.entries.values_list("song__s_yt_id", flat=True))
+        for label, serve in (("wsgi", _wsgi), ("asgi", _asgi)):
+            caches[response_cache.CACHE_ALIAS].clear()
+            start = time.perf_counter()
+            latencies, errors = serve(ranking, yt_ids, repeat)
+            elapsed = time.perf_counter() - start
+            timing = summarize(latencies)
+            rows.append([size, label, len(latencies), len(latencies) / elapsed, timing["p50_ms"], timing["p99_ms"], len(errors)])
+
+    stdout.write(format_table(["songs", "server", "requests", "req/s", "p50 ms", "p99 ms", "errors"], rows) + "\n")
+    return rows
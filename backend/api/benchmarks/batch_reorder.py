@@ -0,0 +1,46 @@
+"""
+100 rank moves sent as 100 ``update/rank/`` PATCHes against the same moves
+sent as one ``update/rank/batch/`` call, through the full request stack.
+"""
+import random
+
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+from . import clear, format_table, measure, seed_ranking, summarize
+
+DEFAULT_SIZES = (1_000, 10_000)
+MOVES = 100
+
+
+def authenticated_client() -> APIClient:
+    user, _ = User.objects.get_or_create(username="bench", defaults={"is_staff": True})
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def run(stdout, sizes, repeat):
+    client = authenticated_client()
+    rows = []
+    for size in sizes:
+        clear()
+        ranking = seed_ranking("bench", size)
+        song_ids = list(ranking.entries.values_list("song_id", flat=True))
+        rng = random.Random(size)
+
+        def moves():
+            return [{"songId": rng.choice(song_ids), "newRank": rng.randint(1, size)} for _ in range(MOVES)]
+
+        def singles():
+            for move in moves():
+                client.patch("/api/update/rank/?list=bench", move, format="json")
+
+        def batch():
+            client.patch("/api/update/rank/batch/?list=bench", {"moves": moves()}, format="json")
+
+        for label, fn in ((f"{MOVES} x update/rank/", singles), ("1 x update/rank/batch/", batch)):
+            rows.append([size, label, *summarize(measure(fn, repeat)).values()])
+
+    stdout.write(format_table(["entries", "requests", "mean ms", "p50 ms", "p99 ms"], rows) + "\n")
+    return rows
@@ -0,0 +1,73 @@
+"""
+Latency of the cross-ranking queries of api.comparison on 50 rankings of
+``--sizes`` entries each (sharing most of their songs), against doing the
+same in Python from each ranking's song ids in rank order (what a client
+downloading the lists would do, minus the transfer).
+"""
+import statistics
+from collections import defaultdict
+
+from api import comparison
+from api.models import RankingEntry, Song
+
+from . import clear, format_table, generate_dataset, measure, summarize
+
+DEFAULT_SIZES = (10_000,)
+RANKINGS = 50
+SHARED = 0.9
+
+
+def _orders(rankings) -> list[list[int]]:
+    return [list(RankingEntry.objects.filter(ranking=ranking).order_by("r_key").values_list("song_id", flat=True)) for ranking in rankings]
+
+
+def python_diff(a, b) -> list[dict]:
+    order_a, order_b = _orders([a, b])
+    rank_a = {song_id: rank for rank, song_id in enumerate(order_a, start=1)}
+    rank_b = {song_id: rank for rank, song_id in enumerate(order_b, start=1)}
+    changed = [song_id for song_id in order_b if rank_a.get(song_id) != rank_b[song_id]]
+    changed += [song_id for song_id in order_a if song_id not in rank_b]
+    # The SQL diff returns the changed songs' details too
+    songs = Song.objects.in_bulk(changed)
+    return [{"id": song_id, "s_title": songs[song_id].s_title, "from": rank_a.get(song_id), "to": rank_b.get(song_id)} for song_id in changed]
+
+
+def python_aggregate(rankings, limit=100) -> list[int]:
+    points, ranks = defaultdict(int), defaultdict(list)
+    for order in _orders(rankings):
+        for rank, song_id in enumerate(order, start=1):
+            points[song_id] += len(order) - rank + 1
+            ranks[song_id].append(rank)
+    return sorted(points, key=lambda song_id: (-points[song_id], statistics.fmean(ranks[song_id]), song_id))[:limit]
+
+
+def python_memberships(song_id, rankings) -> list[tuple[int, int]]:
+    return [(ranking.pk, order.index(song_id) + 1) for ranking, order in zip(rankings, _orders(rankings)) if song_id in order]
+
+
+def run(stdout, sizes, repeat):
+    rows = []
+    for size in sizes:
+        clear()
+        rankings = generate_dataset(size, rankings=RANKINGS, shared=SHARED, prefix="bench")
+        a, b = rankings[0], rankings[1]
+        # A song listed by most rankings
+        song_id = RankingEntry.objects.filter(ranking=rankings[RANKINGS // 2]).order_by("r_key").values_list("song_id", flat=True)[0]
+        cases = (
+            ("diff 2 rankings", "sql", lambda: comparison.diff(a, b)),
+            ("diff 2 rankings", "python", lambda: python_diff(a, b)),
+            (f"borda {RANKINGS} rankings", "sql", lambda: comparison.aggregate(rankings, "borda")),
+            (f"borda {RANKINGS} rankings", "python", lambda: python_aggregate(rankings)),
+            (f"mean {RANKINGS} rankings", "sql", lambda: comparison.aggregate(rankings, "mean", min_lists=1)),
+            ("song memberships", "sql", lambda: comparison.memberships(song_id)),
+            ("song memberships", "python", lambda: python_memberships(song_id, rankings)),
+        )
+        if [row["id"] for row in comparison.aggregate(rankings, "borda")] != python_aggregate(rankings):
+            stdout.write(f"WARNING: Borda orders differ at {size} entries\n")
+        for label, path, fn in cases:
+            fn()
+            timing = summarize(measure(fn, repeat))
+            rows.append([size, label, path, timing["mean_ms"], timing["p50_ms"], timing["p99_ms"]])
+
+    stdout.write(format_table(["entries", "query", "path", "mean ms", "p50 ms", "p99 ms"], rows) + "\n")
+    return rows
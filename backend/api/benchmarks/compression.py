@@ -0,0 +1,66 @@
+"""
+Bytes sent and CPU spent per request for the cached songs/ list under load:
+uncompressed, compressed by the middleware on every request (SongList with
+precompressed off), and served from the compressed copies kept in the cache
+(api.compression), in gzip and, if installed, brotli.
+
+``--sizes`` are ranking sizes; THREADS clients send ``--repeat`` requests
+each. CPU time is the process's, divided by the number of requests, so it
+includes the test client's share, which is the same for every row.
+"""
+import threading
+import time
+
+from django.test import Client
+
+from api import compression
+from api.views import SongList
+
+from . import clear, format_table, seed_ranking
+
+DEFAULT_SIZES = (20_000,)
+THREADS = 4
+PATH = "/api/songs/?list=bench"
+
+
+def _load(accept_encoding: str, repeat: int) -> tuple[float, float, int]:
+    """Requests/s, CPU ms per request and the body size of the last response."""
+    sizes = []
+
+    def client_thread():
+        client = Client(HTTP_ACCEPT_ENCODING=accept_encoding)
+        for _ in range(repeat):
+            sizes.append(len(client.get(PATH).content))
+
+    threads = [threading.Thread(target=client_thread) for _ in range(THREADS)]
+    started, cpu_started = time.perf_counter(), time.process_time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+    requests = THREADS * repeat
+    return requests / elapsed, cpu / requests * 1000, sizes[-1]
+
+
+def run(stdout, sizes, repeat):
+    rows = []
+    scenarios = [("identity", "", True)]
+    for encoding in reversed(compression.ENCODINGS):
+        scenarios += [(f"{encoding} per request", encoding, False), (f"{encoding} precompressed", encoding, True)]
+    try:
+        for size in sizes:
+            clear()
+            seed_ranking("bench", size)
+            plain = None
+            for label, accept_encoding, precompressed in scenarios:
+                SongList.precompressed = precompressed
+                Client(HTTP_ACCEPT_ENCODING=accept_encoding).get(PATH)  # warm the cache
+                per_second, cpu_ms, body = _load(accept_encoding, repeat)
+                plain = plain or body
+                rows.append([size, label, body / 1000, 1 - body / plain, per_second, cpu_ms])
+    finally:
+        SongList.precompressed = True
+
+    stdout.write(format_table(["songs", "response", "body KB", "saved", "req/s", "CPU ms/req"], rows) + "\n")
+    return rows
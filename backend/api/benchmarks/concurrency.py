@@ -0,0 +1,117 @@
+"""
+N reader processes requesting the full songs/ list while one writer process
+sends ``update/rank/`` PATCHes, with Django's default SQLite settings against
+the production profile in settings.DATABASES (WAL, pragmas, BEGIN IMMEDIATE).
+
+``--sizes`` is the number of readers; the writer sends ``--repeat`` moves
+(at least 50) and the readers run until it is done. Reports throughput,
+latency and the share of requests that failed with "database is locked".
+The response cache is cleared before every read, so reads hit the database.
+"""
+import copy
+import multiprocessing
+import random
+import time
+
+from django.core.cache import caches
+from django.db import OperationalError, connection, connections
+from django.test import Client
+
+from api import response_cache
+
+from . import clear, format_table, seed_ranking, summarize
+from .batch_reorder import authenticated_client
+
+DEFAULT_SIZES = (1, 4, 8)
+ON_DISK = True  # the processes share the database file
+SONGS = 1_000
+MIN_WRITES = 50
+PATH = "?list=bench"
+
+# Django's SQLite defaults: rollback journal and deferred transactions
+DEFAULT_PROFILE = {"pragmas": {"journal_mode": "DELETE"}}
+
+
+def _is_lock_error(error) -> bool:
+    return "database is locked" in str(error)
+
+
+def _reader(done, results):
+    client = Client()
+    latencies, errors = [], 0
+    while not done.is_set():
+        caches[response_cache.CACHE_ALIAS].clear()
+        start = time.perf_counter()
+        try:
+            response = client.get(f"/api/songs/{PATH}")
+            failed = response.status_code != 200
+        except OperationalError as e:
+            failed = _is_lock_error(e)
+        latencies.append(time.perf_counter() - start)
+        errors += failed
+    results.put(("read", latencies, errors))
+
+
+def _writer(moves, song_ids, done, results):
+    client = authenticated_client()
+    rng = random.Random(moves)
+    latencies, errors = [], 0
+    try:
+        for _ in range(moves):
+            move = {"songId": rng.choice(song_ids), "newRank": rng.randint(1, len(song_ids))}
+            start = time.perf_counter()
+            response = client.patch(f"/api/update/rank/{PATH}", move, format="json")
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code != 200 and _is_lock_error(response.content)
+    finally:
+        done.set()
+    results.put(("write", latencies, errors))
+
+
+def _use_profile(options: dict) -> None:
+    # New connections pick up the options; the journal mode is a property of the database file
+    connection.settings_dict["OPTIONS"] = options
+    connections.close_all()
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA journal_mode = {options.get('pragmas', {}).get('journal_mode', 'DELETE')}")
+    connections.close_all()
+
+
+def _row(profile, readers, kind, latencies, errors, elapsed):
+    timing = summarize(latencies) if latencies else {"p50_ms": 0.0, "p99_ms": 0.0}
+    rate = 100 * errors / len(latencies) if latencies else 0.0
+    return [profile, readers, kind, len(latencies), len(latencies) / elapsed, timing["p50_ms"], timing["p99_ms"], rate]
+
+
+def run(stdout, sizes, repeat):
+    clear()
+    ranking = seed_ranking("bench", SONGS)
+    song_ids = list(ranking.entries.values_list("song_id", flat=True))
+    production = copy.deepcopy(connection.settings_dict["OPTIONS"])
+    context = multiprocessing.get_context("fork")
+    rows = []
+    try:
+        for profile, options in (("default", DEFAULT_PROFILE), ("production", production)):
+            _use_profile(options)
+            for readers in sizes:
+                done, results = context.Event(), context.Queue()
+                processes = [context.Process(target=_reader, args=(done, results)) for _ in range(readers)]
+                processes.append(context.Process(target=_writer, args=(max(repeat, MIN_WRITES), song_ids, done, results)))
+                start = time.perf_counter()
+                for process in processes:
+                    process.start()
+                collected = {"read": ([], 0), "write": ([], 0)}
+                for _ in processes:
+                    kind, latencies, errors = results.get()
+                    collected[kind] = (collected[kind][0] + latencies, collected[kind][1] + errors)
+                elapsed = time.perf_counter() - start
+                for process in processes:
+                    process.join()
+                for kind, (latencies, errors) in collected.items():
+                    rows.append(_row(profile, readers, kind, latencies, errors, elapsed))
+    finally:
+        _use_profile(production)
+
+    headers = ["profile", "readers", "requests", "count", "req/s", "p50 ms", "p99 ms", "locked %"]
+    stdout.write(format_table(headers, rows) + "\n")
+    return rows
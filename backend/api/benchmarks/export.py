@@ -0,0 +1,49 @@
+"""
+Time and peak Python memory of downloading a whole ranking: the songs/ list
+the frontend exported from, against the streaming export/ endpoint as CSV
+and NDJSON. Memory is measured with tracemalloc in a separate, untimed pass.
+"""
+import tracemalloc
+
+from django.test import Client
+
+from . import clear, format_table, measure, seed_ranking, summarize
+
+DEFAULT_SIZES = (100_000,)
+PATHS = (
+    ("songs/", "/api/songs/?list=bench"),
+    ("export/ csv", "/api/export/?list=bench"),
+    ("export/ ndjson", "/api/export/?list=bench&type=ndjson"),
+)
+
+
+def download(client: Client, path: str) -> int:
+    response = client.get(path)
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def peak_memory(fn) -> float:
+    """Peak traced allocation in MB while running ``fn``."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1_000_000
+    finally:
+        tracemalloc.stop()
+
+
+def run(stdout, sizes, repeat):
+    client = Client()
+    rows = []
+    for size in sizes:
+        clear()
+        seed_ranking("bench", size)
+        for label, path in PATHS:
+            size_mb = download(client, path) / 1_000_000
+            timing = summarize(measure(lambda: download(client, path), repeat))
+            rows.append([size, label, size_mb, timing["mean_ms"], timing["p99_ms"], peak_memory(lambda: download(client, path))])
+
+    stdout.write(format_table(["songs", "endpoint", "body MB", "mean ms", "p99 ms", "peak MB"], rows) + "\n")
+    return rows
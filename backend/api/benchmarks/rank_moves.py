@@ -0,0 +1,72 @@
+"""
+Latency of a single rank move: the sparse-key move against the previous
+dense-rank algorithm, which shifted every entry between the old and new rank.
+
+The dense variant is replayed on a ranking seeded with consecutive keys, so it
+issues exactly the range UPDATEs the old ``update_rank`` did.
+"""
+import random
+
+from django.db import transaction
+from django.db.models import F
+
+from api.models import RankingEntry
+from api.ordering import key_for_rank, move_entry, rank_of
+
+from . import clear, format_table, measure, seed_ranking, summarize
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+TEMP_SHIFT = 1_000_000
+
+
+def dense_move(entry: RankingEntry, new_rank: int) -> None:
+    # The pre-sparse update_rank: bump the affected range away, place, collapse back
+    entries = RankingEntry.objects.filter(ranking_id=entry.ranking_id)
+    old_rank = entry.r_key
+    if old_rank < new_rank:
+        entries.filter(r_key__gt=old_rank, r_key__lte=new_rank).update(r_key=F("r_key") + TEMP_SHIFT)
+        entry.r_key = new_rank
+        entry.save(update_fields=["r_key"])
+        entries.filter(r_key__gt=old_rank + TEMP_SHIFT, r_key__lte=new_rank + TEMP_SHIFT).update(
+            r_key=F("r_key") - (TEMP_SHIFT + 1)
+        )
+    elif old_rank > new_rank:
+        entries.filter(r_key__gte=new_rank, r_key__lt=old_rank).update(r_key=F("r_key") + TEMP_SHIFT)
+        entry.r_key = new_rank
+        entry.save(update_fields=["r_key"])
+        entries.filter(r_key__gte=new_rank + TEMP_SHIFT, r_key__lt=old_rank + TEMP_SHIFT).update(
+            r_key=F("r_key") - (TEMP_SHIFT - 1)
+        )
+
+
+def sparse_move(entry: RankingEntry, new_rank: int, total: int) -> None:
+    if rank_of(entry) != new_rank:
+        move_entry(entry, new_rank, total)
+
+
+def run(stdout, sizes, repeat):
+    rows = []
+    for size in sizes:
+        rng = random.Random(size)
+        moves = [(rng.randrange(size), rng.randint(1, size)) for _ in range(repeat)]
+        for scheme in ("dense", "sparse"):
+            clear()
+            ranking = seed_ranking("bench", size, key=(lambda rank: rank) if scheme == "dense" else key_for_rank)
+            entries = RankingEntry.objects.filter(ranking=ranking)
+            song_ids = list(entries.order_by("r_key").values_list("song_id", flat=True))
+            pending = iter(moves)
+
+            def one_move():
+                index, new_rank = next(pending)
+                with transaction.atomic():
+                    entry = entries.select_for_update().get(song_id=song_ids[index])
+                    if scheme == "dense":
+                        dense_move(entry, new_rank)
+                    else:
+                        sparse_move(entry, new_rank, size)
+
+            samples = measure(one_move, repeat)
+            rows.append([size, scheme, *summarize(samples).values()])
+
+    stdout.write(format_table(["entries", "scheme", "mean ms", "p50 ms", "p99 ms"], rows) + "\n")
+    return rows
@@ -0,0 +1,40 @@
+"""
+Latency of picking 50 random songs: downloading the full songs/ list (what
+the frontend did before, rendered without the response cache) against
+songs/sample/, uniform and weighted, at growing ranking sizes.
+"""
+from django.core.cache import caches
+from django.test import Client
+
+from api import response_cache
+
+from . import clear, format_table, measure, seed_ranking, summarize
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+SAMPLE = "/api/songs/sample/?list=bench&n=50"
+
+
+def run(stdout, sizes, repeat):
+    client = Client()
+    rows = []
+    for size in sizes:
+        clear()
+        seed_ranking("bench", size)
+
+        def full_list():
+            caches[response_cache.CACHE_ALIAS].clear()
+            client.get("/api/songs/?list=bench")
+
+        seeds = iter(range(10**9))
+        cases = (
+            ("songs/ (full list)", full_list),
+            ("sample", lambda: client.get(f"{SAMPLE}&seed={next(seeds)}")),
+            ("sample weight=zipf", lambda: client.get(f"{SAMPLE}&seed={next(seeds)}&weight=zipf")),
+        )
+        for label, fn in cases:
+            fn()
+            timing = summarize(measure(fn, repeat))
+            rows.append([size, label, timing["mean_ms"], timing["p50_ms"], timing["p99_ms"]])
+
+    stdout.write(format_table(["songs", "request", "mean ms", "p50 ms", "p99 ms"], rows) + "\n")
+    return rows
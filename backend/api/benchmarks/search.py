@@ -0,0 +1,58 @@
+"""
+Latency of searching songs: the ``icontains`` filter the admin used (a
+LIKE '%...%' scan of every song) against the FTS5 index of api.search, for
+queries matching one song, none, a few hundred (by prefix) and every song,
+with and without a ranking filter. Both return the first 20 matches.
+
+LIKE stops scanning once it has 20 rows, so it is fast for words found in
+most songs; FTS5 has to score every match to order them by relevance, so it
+is slowest there, and fast wherever LIKE has to read the whole table.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+from api import search
+from api.models import Song
+
+from . import clear, format_table, measure, seed_ranking, summarize
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+LIMIT = 20
+FIELDS = ("s_artist", "s_title", "s_album", "s_comment")
+# The seeded songs are "Artist <n>" - "Title <n>" on "Album <n>"
+QUERIES = ("title 54321", "zeppelin", "alb 33", "artist")
+
+
+def icontains(query: str, ranking=None) -> list:
+    # Every word in any of the fields, as ModelAdmin.search_fields does it
+    songs = Song.objects.all()
+    for word in query.split():
+        songs = songs.filter(reduce(or_, (Q(**{f"{field}__icontains": word}) for field in FIELDS)))
+    if ranking is not None:
+        songs = songs.filter(memberships__ranking=ranking)
+    return list(songs[:LIMIT])
+
+
+def run(stdout, sizes, repeat):
+    rows = []
+    for size in sizes:
+        clear()
+        ranking = seed_ranking("bench", size)
+        # A second ranking over half of the songs, so the filter has something to drop
+        seed_ranking("other", size // 2, offset=size // 4)
+        for query in QUERIES:
+            cases = (
+                ("icontains", lambda: icontains(query)),
+                ("fts", lambda: search.search_songs(query, limit=LIMIT)),
+                ("icontains list=bench", lambda: icontains(query, ranking)),
+                ("fts list=bench", lambda: search.search_songs(query, ranking.pk, LIMIT)),
+            )
+            for label, fn in cases:
+                found = len(fn())
+                timing = summarize(measure(fn, repeat))
+                rows.append([size, query, label, found, timing["mean_ms"], timing["p50_ms"], timing["p99_ms"]])
+
+    stdout.write(format_table(["songs", "query", "search", "found", "mean ms", "p50 ms", "p99 ms"], rows) + "\n")
+    return rows
@@ -0,0 +1,47 @@
+"""
+Requests/s and latency of the full songs/ list: the DRF SongSerializer path
+("before") against the values_list() + render_json path ("after"), rendered
+on every request, and the same response served from api.response_cache.
+All must return the same bytes; the benchmark checks that for every size.
+"""
+import statistics
+
+from django.core.cache import caches
+from django.test import Client
+
+from api import response_cache
+from api.views import SongList
+
+from . import clear, format_table, measure, seed_ranking, summarize
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+PATH = "/api/songs/?list=bench"
+
+
+def run(stdout, sizes, repeat):
+    client = Client()
+    rows = []
+    try:
+        for size in sizes:
+            clear()
+            seed_ranking("bench", size)
+            bodies = {}
+            for label, fast_json, cached in (("serializer", False, False), ("fast", True, False), ("cached", True, True)):
+                SongList.fast_json = fast_json
+
+                def request():
+                    if not cached:
+                        caches[response_cache.CACHE_ALIAS].clear()
+                    return client.get(PATH)
+
+                bodies[label] = request().content
+                samples = measure(request, repeat)
+                timing = summarize(samples)
+                rows.append([size, label, 1 / statistics.fmean(samples), timing["p50_ms"], timing["p99_ms"]])
+            if len(set(bodies.values())) > 1:
+                stdout.write(f"WARNING: responses differ at {size} songs\n")
+    finally:
+        SongList.fast_json = True
+
+    stdout.write(format_table(["songs", "path", "req/s", "p50 ms", "p99 ms"], rows) + "\n")
+    return rows
@@ -0,0 +1,56 @@
+"""
+Body size and encode time of the songs/ list in each wire format: the plain
+JSON list against the columnar JSON and MessagePack formats (api.columnar),
+with all fields and with the few a playlist needs (?fields=). Rows are read
+once per size; only building and encoding the body is timed. Sizes are also
+given gzip-compressed, since that is how most of them travel.
+"""
+import gzip
+
+from api import columnar
+from api.renderers import COLUMNAR_RENDERERS, render_json
+from api.serializers import SONG_FIELDS, song_representer
+from api.views import _iter_ranking_rows
+
+from . import clear, format_table, measure, seed_ranking, summarize
+
+DEFAULT_SIZES = (20_000,)
+PLAYLIST_FIELDS = ["s_yt_id", "s_title", "r_rank"]
+
+
+def _plain(fields, rows) -> bytes:
+    represent = song_representer(fields)
+    return render_json([represent(row) for row in rows])
+
+
+def _formats():
+    yield "json", _plain
+    for renderer_class in COLUMNAR_RENDERERS:
+        renderer = renderer_class()
+        yield renderer.format, lambda fields, rows, renderer=renderer: renderer.encode(columnar.build(fields, rows))
+
+
+def run(stdout, sizes, repeat):
+    rows = []
+    for size in sizes:
+        clear()
+        ranking = seed_ranking("bench", size)
+        for fields in (SONG_FIELDS, PLAYLIST_FIELDS):
+            values = list(_iter_ranking_rows(ranking, fields))
+            baseline = None
+            for label, encode in _formats():
+                body = encode(fields, values)
+                baseline = baseline or len(body)
+                timing = summarize(measure(lambda: encode(fields, values), repeat))
+                rows.append([
+                    size,
+                    "all" if fields == SONG_FIELDS else "playlist",
+                    label,
+                    len(body) / 1000,
+                    len(body) / baseline,
+                    len(gzip.compress(body, 6)) / 1000,
+                    timing["p50_ms"],
+                ])
+
+    stdout.write(format_table(["songs", "fields", "format", "body KB", "vs json", "gzip KB", "encode p50 ms"], rows) + "\n")
+    return rows
@@ -0,0 +1,130 @@
+# changes.py
+"""
+Change log of rankings, for clients that sync a ranking incrementally.
+
+Every mutation goes through ``record``: it bumps the versions of the affected
+rankings and appends one RankingChange per affected song. ``changes_since``
+compacts the log after a client's version into the smallest set of changes
+that brings it up to date, or tells it to reload the ranking when the log no
+longer reaches back that far (see Ranking.changes_floor).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from . import response_cache
+from .models import Ranking, RankingChange, RankingEntry
+from .ordering import ranks_of_keys
+from .serializers import SONG_FIELDS, RankingSerializer, song_representer
+
+
+def record(rankings, kind: str, song_ids=(None,)) -> None:
+    """
+    Bump the version of ``rankings`` (a Ranking queryset) and log ``kind`` for each of ``song_ids``.
+    Their cached responses are dropped once the transaction commits.
+
+    A RESET (the ranking was replaced wholesale) also drops the ranking's
+    older log, which can no longer be replayed past it. Call inside the
+    transaction that makes the change.
+    """
+    rankings.bump_version()
+    versions = list(rankings.values_list("id", "version"))
+    RankingChange.objects.bulk_create(
+        [
+            RankingChange(ranking_id=ranking_id, version=version, kind=kind, song_id=song_id)
+            for ranking_id, version in versions
+            for song_id in song_ids
+        ],
+        batch_size=500,
+    )
+    if kind == RankingChange.RESET:
+        for ranking_id, version in versions:
+            prune(ranking_id, version - 1)
+    response_cache.invalidate([ranking_id for ranking_id, _ in versions])
+
+
+def prune(ranking_id: int, through_version: int) -> int:
+    """Drop the log up to and including ``through_version``. Returns the number of rows deleted."""
+    Ranking.objects.filter(pk=ranking_id, changes_floor__lt=through_version).update(changes_floor=through_version)
+    deleted, _ = RankingChange.objects.filter(ranking_id=ranking_id, version__lte=through_version).delete()
+    return deleted
+
+
+def compact(ranking: Ranking, max_age: timedelta | None = None, max_rows: int | None = None) -> int:
+    """
+    Apply the retention policy to one ranking's log: keep changes younger than
+    ``max_age`` and at most ``max_rows`` rows (defaults from settings.RANKING_CHANGES).
+    Returns the number of rows deleted.
+    """
+    policy = settings.RANKING_CHANGES
+    max_age = policy["MAX_AGE"] if max_age is None else max_age
+    max_rows = policy["MAX_ROWS"] if max_rows is None else max_rows
+    log = RankingChange.objects.filter(ranking=ranking)
+
+    through = log.filter(created_on__lt=timezone.now() - max_age).aggregate(Max("version"))["version__max"] or 0
+    overflow = log.order_by("-version", "-id").values_list("version", flat=True)[max_rows : max_rows + 1]
+    for version in overflow:
+        # Versions are dropped whole, so a client is never left with half of one
+        through = max(through, version)
+    return prune(ranking.id, through) if through else 0
+
+
+def changes_since(ranking: Ranking, since: int) -> dict:
+    """
+    Compact the changes after version ``since`` into what a client holding that
+    version needs:
+
+    - ``inserted``/``updated``: full song objects (as in songs/) with their current r_rank
+    - ``moved``: ``{"id", "r_rank"}`` of songs whose only change is their position
+    - ``deleted``: ids of songs no longer in the ranking
+    - ``ranking``: the ranking's details, if they changed
+
+    To apply it, remove every listed song from the local list, then insert the
+    inserted, updated and moved songs at their r_rank in ascending rank order.
+    If the log doesn't reach back to ``since``, returns ``{"resync": true}``.
+    """
+    response = {"version": ranking.version, "resync": False}
+    if since < ranking.changes_floor or since > ranking.version:
+        return {**response, "resync": True}
+
+    first_kind, kinds, renamed = {}, {}, False
+    log = RankingChange.objects.filter(ranking=ranking, version__gt=since).order_by("version", "id")
+    for kind, song_id in log.values_list("kind", "song_id").iterator():
+        if kind == RankingChange.RESET:
+            return {**response, "resync": True}
+        if kind == RankingChange.RENAME:
+            renamed = True
+            continue
+        first_kind.setdefault(song_id, kind)
+        kinds.setdefault(song_id, set()).add(kind)
+
+    keys = dict(RankingEntry.objects.filter(ranking=ranking, song_id__in=list(first_kind)).values_list("song_id", "r_key"))
+    ranks = ranks_of_keys(ranking.pk, keys)
+
+    full, moved, deleted = {}, [], []
+    for song_id, first in first_kind.items():
+        existed = first != RankingChange.INSERT
+        if song_id not in keys:
+            if existed:
+                deleted.append(song_id)
+        elif not existed:
+            full[song_id] = "inserted"
+        elif kinds[song_id] & {RankingChange.UPDATE, RankingChange.INSERT}:
+            full[song_id] = "updated"
+        else:
+            moved.append({"id": song_id, "r_rank": ranks[song_id]})
+
+    response.update(inserted=[], updated=[], moved=sorted(moved, key=lambda song: song["r_rank"]), deleted=deleted)
+    represent = song_representer()
+    fields = [name for name in SONG_FIELDS if name != "r_rank"]
+    rows = RankingEntry.objects.filter(ranking=ranking, song_id__in=list(full)).values_list(*[f"song__{name}" for name in fields])
+    for row in rows.iterator():
+        song_id = row[fields.index("id")]
+        response[full[song_id]].append(represent(row + (ranks[song_id],)))
+    for group in ("inserted", "updated"):
+        response[group].sort(key=lambda song: song["r_rank"])
+    if renamed:
+        response["ranking"] = RankingSerializer(ranking).data
+    return response
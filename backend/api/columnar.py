@@ -0,0 +1,52 @@
+# columnar.py
+"""
+Columnar song lists, served by songs/ to clients that ask for them (see
+api.renderers.COLUMNAR_RENDERERS).
+
+The plain list repeats every field name in every row, which is most of its
+size. A columnar list has one array of values per field instead:
+
+    {
+        "count": 2,
+        "fields": ["s_yt_id", "s_artist", "s_last_updated", "r_rank"],
+        "columns": [
+            ["dQw4w9WgXcQ", "kJQP7kiw5Fk"],
+            [0, 0],
+            [1700000000000000, 1700000000123456],
+            [1, 2]
+        ],
+        "strings": ["Artist"]
+    }
+
+Values of the fields in DICTIONARY_FIELDS (artists, albums and the like,
+repeated across many songs) are indices into ``strings``, which lists each
+distinct value once. Datetimes are integer microseconds since the Unix
+epoch (UTC). Nulls stay null.
+"""
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+
+from .serializers import DATETIME_FIELDS
+
+DICTIONARY_FIELDS = ("s_artist", "s_album", "s_discovered")
+
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _epoch() -> datetime:
+    return datetime(1970, 1, 1, tzinfo=timezone.utc if settings.USE_TZ else None)
+
+
+def build(fields: list[str], rows) -> dict:
+    """The columnar list of ``rows``, value tuples of ``fields``."""
+    rows = list(rows)
+    columns = [list(column) for column in zip(*rows)] if rows else [[] for _ in fields]
+    strings = {}
+    epoch = _epoch()
+    for index, name in enumerate(fields):
+        if name in DICTIONARY_FIELDS:
+            columns[index] = [None if value is None else strings.setdefault(value, len(strings)) for value in columns[index]]
+        elif name in DATETIME_FIELDS:
+            columns[index] = [None if value is None else (value - epoch) // _MICROSECOND for value in columns[index]]
+    return {"count": len(rows), "fields": list(fields), "columns": columns, "strings": list(strings)}
@@ -0,0 +1,144 @@
+# comparison.py
+"""
+Queries across rankings: the difference between two rankings, aggregate
+positions over several and the rankings a song belongs to.
+
+Each is one grouped SQL statement. Dense ranks are computed inside it with
+ROW_NUMBER() over the (ranking, r_key, song) index, so no ranking is loaded
+into Python. Rows identify songs by id, yt_id, artist and title; the full
+song objects are in songs/.
+"""
+from django.db import connection
+
+from .models import Ranking, RankingEntry, Song
+
+ENTRY_TABLE = RankingEntry._meta.db_table
+SONG_TABLE = Song._meta.db_table
+RANKING_TABLE = Ranking._meta.db_table
+SONG_COLUMNS = ("id", "s_yt_id", "s_artist", "s_title")
+METHODS = ("mean", "borda")
+MAX_AGGREGATE = 1000
+
+
+def _ranked(ranking_ids) -> tuple[str, list]:
+    # CTE numbering the entries of each ranking 1..n
+    placeholders = ", ".join(["%s"] * len(ranking_ids))
+    sql = (
+        "ranked AS ("
+        "SELECT ranking_id, song_id, ROW_NUMBER() OVER (PARTITION BY ranking_id ORDER BY r_key) AS r_rank "
+        f"FROM {ENTRY_TABLE} WHERE ranking_id IN ({placeholders}))"
+    )
+    return sql, list(ranking_ids)
+
+
+def _sizes(ranking_ids) -> tuple[str, list]:
+    # A COUNT(*) OVER in ``ranked`` would buffer every partition; counting on the index is cheaper
+    placeholders = ", ".join(["%s"] * len(ranking_ids))
+    sql = f"sizes AS (SELECT ranking_id, COUNT(*) AS size FROM {ENTRY_TABLE} WHERE ranking_id IN ({placeholders}) GROUP BY ranking_id)"
+    return sql, list(ranking_ids)
+
+
+def _song_columns(alias: str = "s") -> str:
+    return ", ".join(f"{alias}.{column}" for column in SONG_COLUMNS)
+
+
+def _fetch(sql: str, params: list, names: tuple) -> list[dict]:
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+def diff_query(a_id: int, b_id: int) -> tuple[str, list]:
+    """SQL and params of the songs whose rank differs between rankings ``a_id`` and ``b_id``, for ``diff``."""
+    ranked, params = _ranked([a_id, b_id])
+    sql = (
+        f"WITH {ranked}, pairs AS ("
+        "SELECT song_id, "
+        "MAX(CASE WHEN ranking_id = %s THEN r_rank END) AS rank_a, "
+        "MAX(CASE WHEN ranking_id = %s THEN r_rank END) AS rank_b "
+        "FROM ranked GROUP BY song_id) "
+        f"SELECT {_song_columns()}, p.rank_a, p.rank_b FROM pairs p JOIN {SONG_TABLE} s ON s.id = p.song_id "
+        "WHERE p.rank_a IS NOT p.rank_b ORDER BY p.rank_b IS NULL, p.rank_b, p.rank_a"
+    )
+    return sql, params + [a_id, b_id]
+
+
+def diff(a: Ranking, b: Ranking) -> dict:
+    """
+    What changed from ranking ``a`` to ranking ``b``.
+
+    ``added``: songs only in b, with their rank there; ``removed``: songs only
+    in a; ``moved``: songs at different ranks, with ``from``/``to`` ranks and
+    ``delta`` (positive: moved up). ``unchanged`` counts the songs at the same
+    rank in both. Lists are in b's order (removed: in a's).
+    """
+    rows = _fetch(*diff_query(a.pk, b.pk), SONG_COLUMNS + ("from", "to"))
+    result = {"from": a.slug, "to": b.slug, "added": [], "removed": [], "moved": [], "unchanged": 0}
+    for row in rows:
+        if row["from"] is None:
+            del row["from"]
+            result["added"].append(row)
+        elif row["to"] is None:
+            del row["to"]
+            result["removed"].append(row)
+        else:
+            row["delta"] = row["from"] - row["to"]
+            result["moved"].append(row)
+    result["removed"].sort(key=lambda row: row["from"])
+    # Songs at the same rank in both: those of b that were neither added nor moved
+    result["unchanged"] = b.entries.count() - len(result["added"]) - len(result["moved"])
+    return result
+
+
+def aggregate_query(ranking_ids: list[int], method: str, limit: int, min_lists: int | None) -> tuple[str, list]:
+    """SQL and params of ``aggregate``."""
+    ranked, params = _ranked(ranking_ids)
+    sizes, size_params = _sizes(ranking_ids)
+    params += size_params
+    if method == "mean":
+        having, order = "HAVING COUNT(*) >= %s", ["mean_rank", "borda DESC", "song_id"]
+        params.append(len(ranking_ids) if min_lists is None else min_lists)
+    else:
+        having, order = "", ["borda DESC", "mean_rank", "song_id"]
+    sql = (
+        f"WITH {ranked}, {sizes}, totals AS ("
+        "SELECT song_id, COUNT(*) AS appearances, AVG(r_rank) AS mean_rank, SUM(size - r_rank + 1) AS borda "
+        f"FROM ranked JOIN sizes USING (ranking_id) GROUP BY song_id {having} ORDER BY {', '.join(order)} LIMIT %s) "
+        f"SELECT {_song_columns()}, t.appearances, t.mean_rank, t.borda FROM totals t JOIN {SONG_TABLE} s ON s.id = t.song_id "
+        f"ORDER BY {', '.join(f't.{term}' for term in order)}"
+    )
+    return sql, params + [limit]
+
+
+def aggregate(rankings: list[Ranking], method: str = "mean", limit: int = 100, min_lists: int | None = None) -> list[dict]:
+    """
+    Combined order of the songs of ``rankings``, best first, with each song's
+    ``position`` in it, ``appearances`` (number of rankings listing it),
+    ``mean_rank`` over those rankings and ``borda`` points.
+
+    ``mean`` orders by mean rank among the songs in at least ``min_lists``
+    of the rankings (default: all of them). ``borda`` orders all songs by
+    points: a ranking of n songs gives n points to its first, 1 to its last.
+    """
+    sql, params = aggregate_query([ranking.pk for ranking in rankings], method, limit, min_lists)
+    rows = _fetch(sql, params, SONG_COLUMNS + ("appearances", "mean_rank", "borda"))
+    for position, row in enumerate(rows, start=1):
+        row["position"] = position
+        row["mean_rank"] = round(row["mean_rank"], 2)
+    return rows
+
+
+def memberships_query(song_id: int) -> tuple[str, list]:
+    """SQL and params of ``memberships``."""
+    sql = (
+        f"SELECT r.id, r.name, r.slug, "
+        f"(SELECT COUNT(*) FROM {ENTRY_TABLE} x WHERE x.ranking_id = e.ranking_id AND x.r_key < e.r_key) + 1 "
+        f"FROM {ENTRY_TABLE} e JOIN {RANKING_TABLE} r ON r.id = e.ranking_id "
+        "WHERE e.song_id = %s ORDER BY r.created_on, r.id"
+    )
+    return sql, [song_id]
+
+
+def memberships(song_id: int) -> list[dict]:
+    """The rankings listing a song, oldest first, with its rank in each."""
+    return _fetch(*memberships_query(song_id), ("id", "name", "slug", "r_rank"))
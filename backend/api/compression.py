@@ -0,0 +1,123 @@
+# compression.py
+"""
+Compressed response bodies, in gzip and (when the brotli package is
+installed) brotli, chosen by the request's Accept-Encoding.
+
+The songs/ lists are compressed once per ranking version: ``cached`` keeps
+each encoding's bytes in the response cache next to the plain body (under
+``response_cache.encoded_key``, with the same version tag) and serves them
+as they are, so a cached list costs no compression at all. Everything else
+is compressed as it is sent by middleware.CompressionMiddleware: streaming
+responses (export/) chunk by chunk, others in one go.
+"""
+import zlib
+
+from django.utils.cache import patch_vary_headers
+
+from . import response_cache
+
+try:
+    import brotli
+except ImportError:  # optional dependency, only gzip is offered without it
+    brotli = None
+
+GZIP_LEVEL = 6  # as django's GZipMiddleware
+# Precompressed bodies are compressed once per version; quality 5 is where brotli gets
+# denser than gzip by a wide margin (11 takes seconds for a large ranking)
+BROTLI_QUALITY = 5
+BROTLI_STREAM_QUALITY = 4
+# In order of preference when the client accepts several equally
+ENCODINGS = (["br"] if brotli is not None else []) + ["gzip"]
+
+
+def negotiate(accept_encoding: str) -> str | None:
+    """The encoding of ENCODINGS to answer a request with ``accept_encoding`` in, or None for none."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime 0 like django.utils.text.compress_string, so a body always compresses to the same bytes
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def _compressor(encoding: str):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_STREAM_QUALITY)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def compress_stream(chunks, encoding: str):
+    """Compress an iterable of byte chunks as they come."""
+    process, finish = _compressor(encoding)
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+async def acompress_stream(chunks, encoding: str):
+    process, finish = _compressor(encoding)
+    async for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def cached(key: str, render, tag, encoding: str | None) -> tuple[bytes, bool]:
+    """
+    Like response_cache.get_or_render, for a body in ``encoding`` (None for
+    the plain body): the compressed copy is made from the cached plain body
+    the first time it's requested and cached along with it.
+    """
+    if encoding is None:
+        return response_cache.get_or_render(key, render, tag=tag)
+
+    def render_encoded():
+        body, _ = response_cache.get_or_render(key, render, tag=tag)
+        return compress(body, encoding)
+
+    return response_cache.get_or_render(response_cache.encoded_key(key, encoding), render_encoded, tag=tag)
+
+
+async def acached(key: str, render, tag, encoding: str | None) -> tuple[bytes, bool]:
+    """Async cached(): ``render`` is a coroutine function."""
+    if encoding is None:
+        return await response_cache.aget_or_render(key, render, tag=tag)
+
+    async def render_encoded():
+        body, _ = await response_cache.aget_or_render(key, render, tag=tag)
+        return compress(body, encoding)
+
+    return await response_cache.aget_or_render(response_cache.encoded_key(key, encoding), render_encoded, tag=tag)
+
+
+def encoded(response, encoding: str | None):
+    """Mark ``response``, whose body is in ``encoding``, as such. Returns it."""
+    patch_vary_headers(response, ["Accept-Encoding"])
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
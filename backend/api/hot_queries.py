@@ -0,0 +1,186 @@
+# hot_queries.py
+"""
+The queries the busy endpoints and jobs run, for ``manage.py explain_hot_queries``.
+
+Each is built from sample ids by the function that builds it for the code
+(the ``*_query`` functions of the modules running plain SQL) or as the same
+queryset; only the rankings/ state aggregate is written out as the SQL the
+ORM produces for it. ``explain`` runs SQLite's EXPLAIN QUERY PLAN on it.
+Plan steps that read a whole table (a SCAN not using an index) or sort
+through a temporary B-tree are flagged, except where a query's ``allow``
+says they're expected, so a dropped index or a rewritten query that can no
+longer use one shows up before it reaches production.
+"""
+import re
+
+from django.db import connection
+
+from . import comparison, ordering, orphans, search
+from .models import Ranking, RankingChange, RankingEntry, RankingSnapshot, Song
+from .ordering import dense_rank
+from .serializers import SONG_FIELDS
+
+FULL_SCAN = "full scan"
+TEMP_BTREE = "temp b-tree"
+
+QUERIES = {}
+
+
+def hot_query(name: str, allow: tuple = ()):
+    """Register a query: a function of (ranking_id, other_ranking_id, song_id) returning a queryset or (sql, params)."""
+
+    def register(build):
+        QUERIES[name] = (build, frozenset(allow))
+        return build
+
+    return register
+
+
+@hot_query("songs/ list")
+def songs_list(ranking_id, other_id, song_id):
+    fields = [f"song__{name}" for name in SONG_FIELDS if name != "r_rank"]
+    return RankingEntry.objects.filter(ranking_id=ranking_id).order_by("r_key").values_list(*fields)
+
+
+@hot_query("songs/ list (serializer)")
+def songs_list_serializer(ranking_id, other_id, song_id):
+    songs = Song.objects.filter(memberships__ranking_id=ranking_id).order_by("memberships__r_key")
+    return songs.annotate(r_rank=dense_rank("memberships__r_key"))
+
+
+@hot_query("songs/ page")
+def songs_page(ranking_id, other_id, song_id):
+    return Song.objects.filter(memberships__ranking_id=ranking_id, memberships__r_key__gt=0).order_by("memberships__r_key")[:100]
+
+
+@hot_query("rank of an entry")
+def rank_of(ranking_id, other_id, song_id):
+    return ordering.rank_query(ranking_id, 0)
+
+
+@hot_query("entry of a song")
+def entry_of_song(ranking_id, other_id, song_id):
+    return RankingEntry.objects.filter(ranking_id=ranking_id, song_id=song_id)
+
+
+@hot_query("neighbour keys of a move")
+def neighbour_keys(ranking_id, other_id, song_id):
+    others = RankingEntry.objects.filter(ranking_id=ranking_id).exclude(pk=0).order_by("r_key").values_list("r_key", flat=True)
+    return others[10:12]
+
+
+@hot_query("songs at ranks (songs/sample/)", allow=(TEMP_BTREE,))  # ordering the sampled songs by rank
+def songs_at_ranks(ranking_id, other_id, song_id):
+    return ordering.songs_at_ranks_query(ranking_id, [1, 5, 10])
+
+
+@hot_query("last key (songs/add/)")
+def last_key(ranking_id, other_id, song_id):
+    return ordering.last_key_query(ranking_id)
+
+
+@hot_query("queue a ranking's songs for gc_songs")
+def enqueue_ranking(ranking_id, other_id, song_id):
+    return orphans.enqueue_ranking_query(ranking_id, "2000-01-01")
+
+
+@hot_query("rankings listing a song (update_song)")
+def rankings_of_song(ranking_id, other_id, song_id):
+    return Ranking.objects.filter(entries__song_id=song_id).values_list("id", "version")
+
+
+@hot_query("orphaned songs (gc_songs)")
+def orphaned_songs(ranking_id, other_id, song_id):
+    return Song.objects.filter(pk__in=[song_id, song_id + 1], memberships__isnull=True).values_list("pk", "s_yt_id")
+
+
+@hot_query("rankings of a song", allow=(TEMP_BTREE,))  # ordering the few rankings by creation
+def song_rankings(ranking_id, other_id, song_id):
+    return comparison.memberships_query(song_id)
+
+
+@hot_query("diff of two rankings", allow=(TEMP_BTREE,))  # grouping by song and ordering the result
+def ranking_diff(ranking_id, other_id, song_id):
+    return comparison.diff_query(ranking_id, other_id)
+
+
+@hot_query("aggregate of rankings", allow=(TEMP_BTREE,))  # grouping by song and ordering by score
+def ranking_aggregate(ranking_id, other_id, song_id):
+    return comparison.aggregate_query([ranking_id, other_id], "borda", 100, None)
+
+
+@hot_query("change log since a version")
+def changes_since(ranking_id, other_id, song_id):
+    return RankingChange.objects.filter(ranking_id=ranking_id, version__gt=0).order_by("version", "id").values_list("kind", "song_id")
+
+
+@hot_query("newest snapshot")
+def newest_snapshot(ranking_id, other_id, song_id):
+    return RankingSnapshot.objects.filter(ranking_id=ranking_id).order_by("-created_on", "-id").values_list("id", "version")[:1]
+
+
+@hot_query("full-text search", allow=(TEMP_BTREE,))  # ordering matches by relevance
+def song_search(ranking_id, other_id, song_id):
+    if not search.is_available():
+        return None
+    return search.match_query("title", ranking_id, search.MAX_RESULTS)
+
+
+@hot_query("rankings/ state", allow=(FULL_SCAN,))  # one row per ranking
+def rankings_state(ranking_id, other_id, song_id):
+    # views.RankingList.list: aggregate(**RANKINGS_STATE) for the ETag, on every request
+    return f"SELECT COUNT(id), SUM(version), MAX(updated_on) FROM {Ranking._meta.db_table}", []
+
+
+def _sql(query) -> tuple[str, list]:
+    if isinstance(query, tuple):
+        return query
+    sql, params = query.query.sql_with_params()
+    return sql, list(params)
+
+
+def explain(sql: str, params: list) -> list[str]:
+    """EXPLAIN QUERY PLAN of ``sql``, one line per step."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def _tables(sql: str) -> set[str]:
+    # Names a plan may use for tables of the query: table names and their aliases (not CTEs or subqueries)
+    tables = set(connection.introspection.table_names())
+    names = set()
+    for table, alias in _TABLE_REFERENCE.findall(sql):
+        if table in tables:
+            names.update(name for name in (table, alias) if name)
+    return names
+
+
+_TABLE_REFERENCE = re.compile(r'(?:FROM|JOIN)\s+"?(\w+)"?(?:\s+(?:AS\s+)?"?(\w+)"?)?', re.IGNORECASE)
+
+
+def problems(plan: list[str], sql: str) -> set[str]:
+    """The kinds of flagged steps in the plan of ``sql``."""
+    found = set()
+    tables = _tables(sql)
+    for step in plan:
+        words = step.split()
+        # A virtual table (full-text index) SCAN reads through its own index
+        if words[0] == "SCAN" and words[1] in tables and "USING" not in words and "VIRTUAL" not in words:
+            found.add(FULL_SCAN)
+        if "USE TEMP B-TREE" in step:
+            found.add(TEMP_BTREE)
+    return found
+
+
+def audit(ranking_id: int = 1, other_id: int = 2, song_id: int = 1) -> list[dict]:
+    """Plan of every hot query, with its unexpected ``problems``."""
+    report = []
+    for name, (build, allow) in QUERIES.items():
+        query = build(ranking_id, other_id, song_id)
+        if query is None:
+            continue
+        sql, params = _sql(query)
+        plan = explain(sql, params)
+        report.append({"name": name, "plan": plan, "problems": sorted(problems(plan, sql) - allow)})
+    return report
@@ -0,0 +1,184 @@
+# instrumentation.py
+"""
+Per-endpoint request statistics: number of requests and SQL queries, time
+spent in the database, encoding JSON and in total.
+
+Opt-in with settings.INSTRUMENTATION["ENABLED"]; when it is off,
+``api.middleware.instrumentation_middleware`` removes itself and no query
+wrapper is installed, so the only cost left is ``timed`` checking a context
+variable. When on, every request gets a ``Collector`` (in a context
+variable, so queries run in sync_to_async threads are counted too), the
+middleware adds its totals to the stats of the request's URL pattern and
+sends them in a ``Server-Timing`` header. ``snapshot`` is served at
+api/_stats/.
+
+Timings are kept in fixed-size histograms with logarithmic buckets: memory
+doesn't grow with traffic, and percentiles are exact to within a bucket
+(about 19%).
+"""
+import contextlib
+import contextvars
+import math
+import threading
+import time
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Bucket i holds durations up to MIN_MS * GROWTH ** i; the last one everything above
+MIN_MS = 0.01
+GROWTH = 2 ** 0.25
+BUCKETS = 96  # up to about 170 s
+PERCENTILES = (50, 90, 99)
+
+
+class Histogram:
+    """Counts of durations (ms) in logarithmic buckets."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms: float) -> None:
+        index = 0 if ms <= MIN_MS else min(BUCKETS - 1, math.ceil(math.log(ms / MIN_MS, GROWTH)))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, pct: float) -> float:
+        """Upper bound of the bucket holding the ``pct``-th percentile (never above the maximum)."""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(pct / 100 * self.count)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(MIN_MS * GROWTH**index, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        summary = {"mean": round(self.total / self.count, 3) if self.count else 0.0}
+        summary.update({f"p{pct}": round(self.percentile(pct), 3) for pct in PERCENTILES})
+        summary["max"] = round(self.max, 3)
+        return summary
+
+
+class EndpointStats:
+    __slots__ = ("requests", "queries", "max_queries", "total", "db", "serialize")
+
+    def __init__(self):
+        self.requests = self.queries = self.max_queries = 0
+        self.total, self.db, self.serialize = Histogram(), Histogram(), Histogram()
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "queries": {"total": self.queries, "mean": round(self.queries / self.requests, 2), "max": self.max_queries},
+            "total_ms": self.total.summary(),
+            "db_ms": self.db.summary(),
+            "serialize_ms": self.serialize.summary(),
+        }
+
+
+class Collector:
+    """What one request spent, filled in while it runs."""
+
+    __slots__ = ("queries", "db", "serialize")
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+
+
+_collector: contextvars.ContextVar[Collector | None] = contextvars.ContextVar("api_instrumentation", default=None)
+_endpoints: dict[str, EndpointStats] = {}
+_lock = threading.Lock()
+
+
+def start() -> tuple[Collector, contextvars.Token]:
+    """Start collecting for the current request."""
+    collector = Collector()
+    return collector, _collector.set(collector)
+
+
+def finish(token: contextvars.Token, collector: Collector, endpoint: str, total_ms: float) -> None:
+    """Stop collecting and add the request to the stats of ``endpoint``."""
+    _collector.reset(token)
+    with _lock:
+        stats = _endpoints.get(endpoint)
+        if stats is None:
+            stats = _endpoints[endpoint] = EndpointStats()
+        stats.requests += 1
+        stats.queries += collector.queries
+        stats.max_queries = max(stats.max_queries, collector.queries)
+        stats.total.record(total_ms)
+        stats.db.record(collector.db)
+        stats.serialize.record(collector.serialize)
+
+
+def server_timing(collector: Collector, total_ms: float) -> str:
+    return (
+        f'db;dur={collector.db:.2f};desc="{collector.queries} queries", '
+        f"serialize;dur={collector.serialize:.2f}, total;dur={total_ms:.2f}"
+    )
+
+
+@contextlib.contextmanager
+def _timing(collector: Collector):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        collector.serialize += (time.perf_counter() - start) * 1000
+
+
+_untimed = contextlib.nullcontext()
+
+
+def timed_serialization():
+    """Context manager adding its duration to the current request's serialization time, if collecting."""
+    collector = _collector.get()
+    return _untimed if collector is None else _timing(collector)
+
+
+def _record_query(execute, sql, params, many, context):
+    collector = _collector.get()
+    if collector is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        collector.queries += 1
+        collector.db += (time.perf_counter() - start) * 1000
+
+
+def _install(sender=None, connection=None, **kwargs) -> None:
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def install() -> None:
+    """Count the queries of every database connection, current and future."""
+    connection_created.connect(_install, dispatch_uid="api.instrumentation")
+    for connection in connections.all(initialized_only=True):
+        _install(connection=connection)
+
+
+def snapshot() -> dict:
+    """Stats of every endpoint seen by this process, busiest first."""
+    with _lock:
+        endpoints = {endpoint: stats.as_dict() for endpoint, stats in _endpoints.items()}
+    return dict(sorted(endpoints.items(), key=lambda item: -item[1]["requests"]))
+
+
+def reset() -> None:
+    with _lock:
+        _endpoints.clear()
@@ -0,0 +1,30 @@
+import importlib
+import pkgutil
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import benchmarks
+
+class Command(BaseCommand):
+    # Example usage:
+    # python manage.py benchmark rank_moves --sizes 1000 10000 --repeat 50
+    help = 'Run one of the api benchmarks (api/benchmarks/) against a throwaway test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', type=str, nargs='?', help='Benchmark module name; omit to list them')
+        parser.add_argument('--sizes', type=int, nargs='+', help='Dataset sizes (default: per benchmark)')
+        parser.add_argument('--repeat', type=int, default=20, help='Measurements per size (default: 20)')
+
+    def handle(self, *args, **options):
+        available = sorted(m.name for m in pkgutil.iter_modules(benchmarks.__path__))
+        name = options['name']
+        if not name:
+            self.stdout.write('Available benchmarks:\n  ' + '\n  '.join(available))
+            return
+        if name not in available:
+            raise CommandError(f'Unknown benchmark {name!r}. Available: {", ".join(available)}')
+
+        module = importlib.import_module(f'api.benchmarks.{name}')
+        sizes = options['sizes'] or module.DEFAULT_SIZES
+        with benchmarks.isolated_database(on_disk=getattr(module, 'ON_DISK', False)):
+            module.run(self.stdout, sizes, options['repeat'])
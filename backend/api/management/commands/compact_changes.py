@@ -0,0 +1,27 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from api.changes import compact
+from api.models import Ranking
+
+class Command(BaseCommand):
+    # Example usage (e.g. from cron):
+    # python manage.py compact_changes --max-age-days 30
+    help = 'Drop old entries of the ranking change logs (defaults from settings.RANKING_CHANGES).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ranking', type=str, help='Only compact the ranking with this slug')
+        parser.add_argument('--max-age-days', type=int, help='Drop changes older than this many days')
+        parser.add_argument('--max-rows', type=int, help='Keep at most this many changes per ranking')
+
+    def handle(self, *args, **options):
+        rankings = Ranking.objects.order_by('id')
+        if options['ranking']:
+            rankings = rankings.filter(slug=options['ranking'])
+        max_age = timedelta(days=options['max_age_days']) if options['max_age_days'] is not None else None
+
+        for ranking in rankings:
+            deleted = compact(ranking, max_age=max_age, max_rows=options['max_rows'])
+            if deleted:
+                self.stdout.write(self.style.SUCCESS(f'{ranking.slug}: deleted {deleted} changes'))
+            else:
+                self.stdout.write(f'{ranking.slug}: ok')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from api import hot_queries
+from api.models import RankingEntry
+
+class Command(BaseCommand):
+    # Example usage (e.g. in CI after migrating):
+    # python manage.py explain_hot_queries
+    help = ('Show the SQLite query plan of each hot query (see api.hot_queries) and fail if one '
+            'scans a whole table or sorts through a temporary B-tree where it is not expected to.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the plans of queries without problems too')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('EXPLAIN QUERY PLAN output is only understood for SQLite.')
+
+        # Sample ids from the data where there is some, so the planner sees real statistics
+        entry = RankingEntry.objects.order_by('id').values_list('ranking_id', 'song_id').first() or (1, 1)
+        other = RankingEntry.objects.exclude(ranking_id=entry[0]).values_list('ranking_id', flat=True).first() or entry[0] + 1
+
+        flagged = 0
+        for result in hot_queries.audit(ranking_id=entry[0], other_id=other, song_id=entry[1]):
+            if result['problems']:
+                flagged += 1
+                self.stdout.write(self.style.ERROR(f"{result['name']}: {', '.join(result['problems'])}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{result['name']}: ok"))
+            if result['problems'] or options['verbose_plans']:
+                for step in result['plan']:
+                    self.stdout.write(f'    {step}')
+
+        if flagged:
+            raise CommandError(f'{flagged} hot queries have unexpected full scans or temporary B-trees.')
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from api import orphans
+
+class Command(BaseCommand):
+    # Example usage (e.g. from cron, outside request latency):
+    # python manage.py gc_songs
+    # python manage.py gc_songs --full   # also find orphans that were never queued
+    help = 'Delete songs that no ranking uses any more, in bounded batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=orphans.BATCH_SIZE,
+                            help=f'Songs checked per transaction (default: {orphans.BATCH_SIZE})')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop after this many batches of queued songs (default: drain the queue)')
+        parser.add_argument('--full', action='store_true',
+                            help='Check every song instead of only the queued ones')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options['full']:
+            checked, deleted = orphans.sweep(options['batch_size'])
+        else:
+            checked, deleted = orphans.collect(options['batch_size'], options['max_batches'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} songs, deleted {deleted} orphans in {elapsed:.2f}s'))
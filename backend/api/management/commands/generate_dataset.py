@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api import orphans, response_cache
+from api.benchmarks import generate_dataset
+from api.models import Ranking
+
+class Command(BaseCommand):
+    # Example usage (fill a development database for profiling):
+    # python manage.py generate_dataset --songs 100000 --rankings 3 --shared 0.5
+    help = 'Generate synthetic rankings sharing part of their songs, e.g. to profile the API with realistic sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--songs', type=int, default=10_000, help='Songs per ranking (default: 10000)')
+        parser.add_argument('--rankings', type=int, default=3, help='Number of rankings (default: 3)')
+        parser.add_argument('--shared', type=float, default=0.5,
+                            help='Fraction of its songs a ranking shares with the next one (default: 0.5)')
+        parser.add_argument('--prefix', type=str, default='synthetic',
+                            help='Rankings are named <prefix>-0, <prefix>-1, ... (default: synthetic)')
+        parser.add_argument('--replace', action='store_true',
+                            help='Delete existing rankings with this prefix first')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['shared'] < 1:
+            raise CommandError('--shared must be at least 0 and less than 1.')
+        prefix = options['prefix']
+        existing = Ranking.objects.filter(slug__startswith=f'{prefix}-')
+        if existing.exists():
+            if not options['replace']:
+                raise CommandError(f'Rankings named {prefix}-* already exist; use --replace or another --prefix.')
+            with transaction.atomic():
+                for ranking in existing:
+                    orphans.enqueue_ranking(ranking.id)
+                existing.delete()
+            orphans.collect()
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            rankings = generate_dataset(options['songs'], options['rankings'], options['shared'], prefix)
+        response_cache.invalidate([ranking.id for ranking in rankings])
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(rankings)} rankings of {options["songs"]} songs in {time.perf_counter() - start:.2f}s: '
+            + ', '.join(ranking.slug for ranking in rankings)
+        ))
@@ -1,21 +1,32 @@
 import csv
+import time
 from django.core.management.base import BaseCommand
-from django.db import IntegrityError, DataError, transaction
-from api.models import Song, Ranking, RankingEntry
+from django.db import transaction
+from api import changes, metadata, orphans, snapshots
+from api.importer import REQUIRED_COLUMNS, bulk_create, metadata_from_row, song_from_row, stream_import, validate_row
+from api.models import Song, Ranking, RankingChange, RankingEntry, RankingSnapshot
+from api.ordering import key_for_rank
 
 class Command(BaseCommand):
     help = 'Import songs and ranks from a CSV into a specific ranking (does not wipe global songs).'
 
     def print_usage(self):
         usage_text = """
-        Usage: python manage.py import_songs path/to/file.csv [--ranking <slug>]
+        Usage: python manage.py import_songs path/to/file.csv [--ranking <slug>] [--batch-size <rows>] [--stream | --upsert]
 
         This command imports songs and their ranks into a given ranking (default: 'main').
         The CSV must include headers: yt_id, Artist, Title, Album, released, discovered, comment, rank.
 
         Behavior:
           - Deletes existing entries only within the target ranking, keeping global Song data intact.
+            The ranking's previous order is kept as a snapshot that can be restored.
           - Creates missing songs by yt_id; does not update global metadata for existing songs.
+          - With --upsert, also updates the metadata of existing songs to the file's, writing only
+            the songs whose values differ, and reports how many were unchanged, updated or rejected.
+          - Inserts songs and entries with bulk inserts of --batch-size rows (default: 1000)
+            and reports per-phase timings and throughput.
+          - With --stream, reads and validates the file batch by batch with flat memory use;
+            the ranking is replaced in one step once the whole file has been staged.
 
         Example:
             python manage.py import_songs path/to/songs.csv --ranking 2025
@@ -25,6 +36,12 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('csv_file_path', type=str, nargs='?', help='The path to the CSV file')
         parser.add_argument('--ranking', type=str, default='main', help='Ranking slug to import into (default: main)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert (default: 1000)')
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument('--stream', action='store_true',
+                          help='Validate and stage the file batch by batch instead of loading it into memory first')
+        mode.add_argument('--upsert', action='store_true',
+                          help='Also update the metadata of existing songs where the file differs')
 
     def handle(self, *args, **kwargs):
         csv_file_path = kwargs['csv_file_path']
@@ -34,15 +51,20 @@ class Command(BaseCommand):
             self.print_usage()
             return  # Exit the command if no CSV file path is provided
 
-        required_columns = ['yt_id', 'Artist', 'Title', 'Album', 'released', 'discovered', 'comment', 'rank']
-        
+        if kwargs['stream']:
+            self.handle_stream(csv_file_path, ranking_slug, kwargs['batch_size'])
+            return
+
+        timings = {}
+        started = time.perf_counter()
+
         # Open the CSV file
         with open(csv_file_path, newline='', encoding='utf-8') as csvfile:
             reader = csv.DictReader(csvfile)
             columns = reader.fieldnames
 
             # Check if all required columns are in the CSV file
-            if not all(column in columns for column in required_columns):
+            if not all(column in columns for column in REQUIRED_COLUMNS):
                 self.stdout.write(self.style.ERROR('CSV file is missing one or more required columns.'))
                 return
             
@@ -52,75 +74,108 @@ class Command(BaseCommand):
             # Process each row in the CSV file and validate the data before modifying the database
             for row in reader:
                 row_number += 1
-
-                # Strip leading and trailing whitespace from each field to ensure clean data before processing.
-                for field in row:
-                    row[field] = row[field].strip()
-                    
-                # Check if the required text fields are not empty
-                for field in ['yt_id', 'Title', 'rank']:
-                    if not row[field]:
-                        raise ValueError(f"Invalid data in row {row_number}: {field} cannot be empty.")
-
-                # Check if the required integer fields are NOT empty AND valid integers
-                for field in ['rank']:
-                    try:
-                        row[field] = int(row[field])
-                    except ValueError:
-                        raise ValueError(f"Invalid data in row {row_number} in the column '{field}': {row[field]} is empty or not an integer.")
-
-                # Check if the rank is greater than 0
-                if row['rank'] <= 0:
-                    raise ValueError(f"Invalid rank in row {row_number}: {row['rank']} must be greater than 0.")
-                
-                # Check if the optional integer fields are either empty or valid integers
-                for field in ['released']:
-                    try:
-                        if row[field]:
-                            row[field] = int(row[field])
-                        else:
-                            row[field] = None
-                    except ValueError:
-                        raise ValueError(f"Invalid data in row {row_number} in the column '{field}': {row[field]} is not an integer.")
-
-                valid_rows.append(row)
+                valid_rows.append(validate_row(row, row_number))
 
             self.stdout.write(self.style.SUCCESS('Data validation passed. Proceeding with import...'))
+        timings['validate'] = time.perf_counter() - started
+
+        ranking, _ = Ranking.objects.get_or_create(slug=ranking_slug, defaults={'name': ranking_slug})
+
+        # Replace entries only in this ranking, keep global Song data intact
+        with transaction.atomic():
+            phase = time.perf_counter()
+            # Keep the current order, so the import can be undone (see api.snapshots)
+            snapshots.take(ranking, RankingSnapshot.IMPORT)
+            timings['snapshot'] = time.perf_counter() - phase
+            phase = time.perf_counter()
+            # Songs dropped from the ranking are deleted by gc_songs unless another ranking uses them
+            orphans.enqueue_ranking(ranking.id)
+            RankingEntry.objects.filter(ranking=ranking).delete()
+            timings['delete'] = time.perf_counter() - phase
+            imported, upserted = self.import_rows(ranking, valid_rows, kwargs['batch_size'], timings, kwargs['upsert'])
+            changes.record(Ranking.objects.filter(pk=ranking.pk), RankingChange.RESET)
+
+        total = sum(timings.values())
+        self.stdout.write(
+            'Timings: ' + ', '.join(f'{phase} {seconds:.3f}s' for phase, seconds in timings.items())
+            + f'; {len(valid_rows) / total if total else 0:.0f} rows/s'
+        )
+        if upserted is not None:
+            self.stdout.write(
+                f'Existing songs: {upserted["unchanged"]} unchanged, {upserted["updated"]} updated, '
+                f'{upserted["rejected"]} rejected'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Successfully imported {imported} songs into ranking {ranking_slug}'))
+
+    def import_rows(self, ranking, rows, batch_size, timings, upsert=False):
+        """
+        Insert validated rows into `ranking` with a fixed number of set-based queries.
 
-            ranking, _ = Ranking.objects.get_or_create(slug=ranking_slug, defaults={'name': ranking_slug})
-
-            # Replace entries only in this ranking, keep global Song data intact
-            with transaction.atomic():
-                RankingEntry.objects.filter(ranking=ranking).delete()
-
-                # Insert new data into database
-                for row in valid_rows:
-                    try:
-                        song, created = Song.objects.get_or_create(
-                            s_yt_id=row['yt_id'],
-                            defaults={
-                                's_artist': row['Artist'],
-                                's_title': row['Title'],
-                                's_album': row.get('Album', ''),
-                                's_released': row['released'],
-                                's_discovered': row.get('discovered', ''),
-                                's_comment': row.get('comment', ''),
-                            }
-                        )
-
-                        RankingEntry.objects.create(
-                            ranking=ranking,
-                            song=song,
-                            r_rank=row['rank']
-                        )
-
-                    except IntegrityError as e:
-                        self.stdout.write(self.style.ERROR(f'Integrity error for {row.get("yt_id")}: {e}'))
-                    except DataError as e:
-                        self.stdout.write(self.style.ERROR(f'Data error for {row.get("yt_id")}: {e}'))
-                    except ValueError as e:
-                        self.stdout.write(self.style.ERROR(f'Value error for {row.get("yt_id")}: {e}'))
-                    except Exception as e:
-                        self.stdout.write(self.style.ERROR(f'Unexpected error: {e}'))
-
-        self.stdout.write(self.style.SUCCESS(f'Successfully imported songs into ranking {ranking_slug}'))
+        Rows that would violate a constraint are reported and skipped up front;
+        if a batch is still rejected by the database it is retried row by row
+        so the offending rows can be reported individually.
+        With `upsert`, the metadata of existing songs is updated to the rows' (see api.metadata).
+        Returns the number of imported entries and the upsert counts (None without `upsert`).
+        """
+        # Conflicts within the CSV itself would fail the unique constraints on RankingEntry
+        first_rows = {}
+        seen_keys = set()
+        rows_to_import = []
+        for row in rows:
+            yt_id = row['yt_id']
+            key = key_for_rank(row['rank'])
+            if yt_id in first_rows:
+                self.report_error(
+                    f'Integrity error for {yt_id}: row {row["row_number"]} repeats the song from row {first_rows[yt_id]}'
+                )
+            elif key in seen_keys:
+                self.report_error(
+                    f'Integrity error for {yt_id}: rank {row["rank"]} in row {row["row_number"]} is already taken'
+                )
+            else:
+                first_rows[yt_id] = row['row_number']
+                seen_keys.add(key)
+                rows_to_import.append(row)
+
+        phase = time.perf_counter()
+        songs = Song.objects.in_bulk(list(first_rows), field_name='s_yt_id')
+        timings['lookup'] = time.perf_counter() - phase
+
+        upserted = None
+        if upsert:
+            phase = time.perf_counter()
+            existing = [(songs[row['yt_id']], metadata_from_row(row)) for row in rows_to_import if row['yt_id'] in songs]
+            upserted = metadata.update_songs(existing, self.report_error, batch_size)
+            timings['upsert'] = time.perf_counter() - phase
+
+        phase = time.perf_counter()
+        new_songs = [song_from_row(row) for row in rows_to_import if row['yt_id'] not in songs]
+        for song in bulk_create(Song, new_songs, batch_size, lambda song: song.s_yt_id, self.report_error):
+            songs[song.s_yt_id] = song
+        if any(song.pk is None for song in songs.values()):
+            # Backends that can't return primary keys from bulk inserts
+            songs.update(Song.objects.in_bulk(list(songs), field_name='s_yt_id'))
+        timings['songs'] = time.perf_counter() - phase
+
+        phase = time.perf_counter()
+        entries = [
+            RankingEntry(ranking=ranking, song=songs[row['yt_id']], r_key=key_for_rank(row['rank']))
+            for row in rows_to_import
+            if row['yt_id'] in songs
+        ]
+        imported = len(bulk_create(RankingEntry, entries, batch_size, lambda entry: entry.song.s_yt_id, self.report_error))
+        timings['entries'] = time.perf_counter() - phase
+        return imported, upserted
+
+    def handle_stream(self, csv_file_path, ranking_slug, batch_size):
+        started = time.perf_counter()
+        ranking, _ = Ranking.objects.get_or_create(slug=ranking_slug, defaults={'name': ranking_slug})
+        with open(csv_file_path, 'rb') as csvfile:
+            chunks = iter(lambda: csvfile.read(64 * 1024), b'')
+            imported = stream_import(ranking, chunks, self.report_error, batch_size)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'Timings: total {elapsed:.3f}s; {imported / elapsed if elapsed else 0:.0f} rows/s')
+        self.stdout.write(self.style.SUCCESS(f'Successfully imported {imported} songs into ranking {ranking_slug}'))
+
+    def report_error(self, message):
+        self.stdout.write(self.style.ERROR(message))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from api import perf
+from api.benchmarks import format_table, isolated_database
+
+class Command(BaseCommand):
+    # Example usage (keep the report of one commit as the baseline of the next):
+    # python manage.py perf_suite --sizes 1000 10000 --report perf-new.json --baseline perf-main.json
+    help = 'Time every API endpoint and import_songs on generated datasets; fail on regressions against a baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=list(perf.DEFAULT_SIZES),
+                            help=f'Songs per ranking (default: {" ".join(map(str, perf.DEFAULT_SIZES))})')
+        parser.add_argument('--repeat', type=int, default=20, help='Calls per case and size (default: 20)')
+        parser.add_argument('--case', action='append', dest='cases', help='Only run this case (repeatable)')
+        parser.add_argument('--report', type=str, help='Write the JSON report to this file')
+        parser.add_argument('--baseline', type=str, help='JSON report of a previous run to compare against')
+        parser.add_argument('--max-regression', type=float,
+                            help='Allowed relative growth of a p50 (default: settings.PERF_SUITE["MAX_REGRESSION"])')
+
+    def handle(self, *args, **options):
+        unknown = set(options['cases'] or ()) - set(perf.CASES)
+        if unknown:
+            raise CommandError(f'Unknown cases: {", ".join(sorted(unknown))}. Available: {", ".join(perf.CASES)}')
+        baseline = perf.load(options['baseline']) if options['baseline'] else None
+
+        def log(name, size, result):
+            self.stdout.write(f'{name} @ {size}: p50 {result["p50_ms"]:.2f} ms, {result["queries"]} queries')
+
+        with isolated_database(on_disk=True):
+            report = perf.run(options['sizes'], options['repeat'], options['cases'], log)
+        if options['report']:
+            perf.save(report, options['report'])
+
+        rows = [
+            [name, int(size), result['queries'], result['p50_ms'], result['p90_ms'], result['p99_ms']]
+            for name, by_size in report['results'].items()
+            for size, result in by_size.items()
+        ]
+        self.stdout.write(format_table(['case', 'songs', 'queries', 'p50 ms', 'p90 ms', 'p99 ms'], rows) + '\n')
+
+        thresholds = {'MAX_REGRESSION': options['max_regression']} if options['max_regression'] is not None else None
+        failures = perf.compare(report, baseline, thresholds)
+        if failures:
+            raise CommandError('Performance regressions:\n  ' + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS('No regressions' + (f' against {options["baseline"]}' if baseline else '')))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from api.models import Ranking
+from api.ordering import RANK_GAP, min_gap, rebalance
+
+class Command(BaseCommand):
+    # Example usage (e.g. from cron):
+    # python manage.py rebalance_rankings --min-gap 1024
+    help = 'Renumber the sparse rank keys of rankings whose smallest gap dropped below a threshold.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ranking', type=str, help='Only check the ranking with this slug')
+        parser.add_argument('--min-gap', type=int, default=RANK_GAP // 1024,
+                            help=f'Rebalance when two neighbouring keys are closer than this (default: {RANK_GAP // 1024})')
+
+    def handle(self, *args, **options):
+        rankings = Ranking.objects.order_by('id')
+        if options['ranking']:
+            rankings = rankings.filter(slug=options['ranking'])
+
+        for ranking in rankings:
+            gap = min_gap(ranking.id)
+            if gap is None or gap >= options['min_gap']:
+                self.stdout.write(f'{ranking.slug}: ok (smallest gap {gap})')
+                continue
+            count = rebalance(ranking.id)
+            self.stdout.write(self.style.SUCCESS(f'{ranking.slug}: rebalanced {count} entries (smallest gap was {gap})'))
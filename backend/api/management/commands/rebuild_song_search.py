@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from api import search
+
+class Command(BaseCommand):
+    # The index is kept in sync by triggers; rebuild it after writing api_song without them
+    # (e.g. restoring a dump taken before migration 0007):
+    # python manage.py rebuild_song_search
+    help = 'Regenerate the full-text search index of songs from the songs table.'
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Song search needs SQLite with FTS5.')
+        start = time.perf_counter()
+        count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} songs in {time.perf_counter() - start:.2f}s'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api import snapshots
+from api.models import Ranking, RankingSnapshot
+
+class Command(BaseCommand):
+    # Example usage (e.g. nightly from cron):
+    # python manage.py snapshot_rankings
+    help = 'Snapshot the order of every ranking that changed since its last snapshot (see api.snapshots).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ranking', type=str, help='Only snapshot the ranking with this slug')
+
+    def handle(self, *args, **options):
+        rankings = Ranking.objects.order_by('id')
+        if options['ranking']:
+            rankings = rankings.filter(slug=options['ranking'])
+
+        for ranking in rankings:
+            with transaction.atomic():
+                latest = ranking.snapshots.order_by('-created_on', '-id').values_list('id', flat=True).first()
+                snapshot = snapshots.take(ranking, RankingSnapshot.SCHEDULED)
+            if snapshot.pk == latest:
+                self.stdout.write(f'{ranking.slug}: unchanged since snapshot {snapshot.pk}')
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f'{ranking.slug}: snapshot {snapshot.pk} of version {snapshot.version} ({snapshot.size} songs)'
+                ))
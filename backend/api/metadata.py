@@ -0,0 +1,77 @@
+# metadata.py
+"""
+Bulk updates of song metadata, behind songs/update/batch/ and ``import_songs --upsert``.
+
+``update_songs`` compares the new values of each song with its stored ones
+and writes only the songs that change, batch by batch with one prepared
+UPDATE per set of changed fields (see api.importer.bulk_update), so fixing
+one field across thousands of songs takes a handful of round trips. Since
+song metadata is shared, every ranking listing a changed song gets one
+version bump with an UPDATE per changed song in its change log, and the
+cached lookups of the changed songs are dropped.
+"""
+from collections import defaultdict
+
+from django.utils import timezone
+
+from . import changes, response_cache
+from .importer import bulk_update
+from .models import Ranking, RankingChange, RankingEntry, Song
+from .serializers import SongMetadataSerializer
+
+METADATA_FIELDS = SongMetadataSerializer.Meta.fields
+BATCH_SIZE = 500
+
+
+def _same(stored, value) -> bool:
+    # An empty CSV column (or form field) leaves a missing value missing
+    return stored == value or (stored in ("", None) and value in ("", None))
+
+
+def changed_fields(song: Song, values: dict) -> dict:
+    """The items of ``values`` that differ from the stored ones of ``song``."""
+    return {name: value for name, value in values.items() if not _same(getattr(song, name), value)}
+
+
+def update_songs(updates, report, batch_size: int = BATCH_SIZE) -> dict:
+    """
+    Apply ``updates``, pairs of a Song and a dict of METADATA_FIELDS values for it.
+
+    Songs the database rejects are passed to ``report`` and skipped, as in
+    api.importer.bulk_update. Call inside a transaction. Returns the numbers of
+    songs ``unchanged``, ``updated`` and ``rejected``.
+    """
+    now = timezone.now()
+    unchanged = 0
+    by_fields = defaultdict(list)
+    for song, values in updates:
+        changed = changed_fields(song, values)
+        if not changed:
+            unchanged += 1
+            continue
+        for name, value in changed.items():
+            setattr(song, name, value)
+        # Written without save(), which is what applies auto_now
+        song.s_last_updated = now
+        by_fields[tuple(name for name in METADATA_FIELDS if name in changed)].append(song)
+
+    updated = []
+    for fields, songs in by_fields.items():
+        updated += bulk_update(Song, songs, [*fields, "s_last_updated"], batch_size, lambda song: song.s_yt_id, report)
+    if updated:
+        _record(updated, batch_size)
+    rejected = sum(len(songs) for songs in by_fields.values()) - len(updated)
+    return {"unchanged": unchanged, "updated": len(updated), "rejected": rejected}
+
+
+def _record(songs: list[Song], batch_size: int) -> None:
+    # Log the changed songs in each ranking listing them, one version bump per ranking
+    song_ids = [song.pk for song in songs]
+    by_ranking = defaultdict(list)
+    for start in range(0, len(song_ids), batch_size):
+        entries = RankingEntry.objects.filter(song_id__in=song_ids[start:start + batch_size])
+        for ranking_id, song_id in entries.values_list("ranking_id", "song_id"):
+            by_ranking[ranking_id].append(song_id)
+    for ranking_id, ranking_song_ids in by_ranking.items():
+        changes.record(Ranking.objects.filter(pk=ranking_id), RankingChange.UPDATE, ranking_song_ids)
+    response_cache.invalidate(yt_ids=[song.s_yt_id for song in songs])
@@ -0,0 +1,108 @@
+# middleware.py
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import sync_and_async_middleware
+from asgiref.sync import iscoroutinefunction
+
+from . import compression, instrumentation
+
+
+@sync_and_async_middleware
+def asgi_urlconf_middleware(get_response):
+    """
+    Route requests handled under ASGI with settings.ASGI_ROOT_URLCONF.
+
+    Async views only pay off under ASGI; under WSGI Django would run each of
+    them in its own event loop, so WSGI requests keep using ROOT_URLCONF.
+    """
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            request.urlconf = settings.ASGI_ROOT_URLCONF
+            return await get_response(request)
+
+    else:
+
+        def middleware(request):
+            return get_response(request)
+
+    return middleware
+
+
+@sync_and_async_middleware
+def instrumentation_middleware(get_response):
+    """
+    Record query counts and timings per URL pattern (see api.instrumentation)
+    and report them in a Server-Timing header. Only used when
+    settings.INSTRUMENTATION["ENABLED"] is set.
+    """
+    if not settings.INSTRUMENTATION["ENABLED"]:
+        raise MiddlewareNotUsed
+    instrumentation.install()
+
+    def record(request, response, collector, token, start):
+        total_ms = (time.perf_counter() - start) * 1000
+        match = request.resolver_match
+        endpoint = f"{request.method} {match.route if match else '<unresolved>'}"
+        instrumentation.finish(token, collector, endpoint, total_ms)
+        response.headers["Server-Timing"] = instrumentation.server_timing(collector, total_ms)
+        return response
+
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            start = time.perf_counter()
+            collector, token = instrumentation.start()
+            response = await get_response(request)
+            return record(request, response, collector, token, start)
+
+    else:
+
+        def middleware(request):
+            start = time.perf_counter()
+            collector, token = instrumentation.start()
+            response = get_response(request)
+            return record(request, response, collector, token, start)
+
+    return middleware
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    django's GZipMiddleware, answering in brotli instead where the client
+    prefers it (see api.compression). Responses that already have a
+    Content-Encoding, such as the precompressed songs/ lists, are left alone.
+    """
+
+    def process_response(self, request, response):
+        encoding = compression.negotiate(request.headers.get("Accept-Encoding", ""))
+        if encoding == "gzip":
+            return super().process_response(request, response)
+        if response.has_header("Content-Encoding") or (not response.streaming and len(response.content) < 200):
+            return response
+        patch_vary_headers(response, ["Accept-Encoding"])
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compression.acompress_stream(response.streaming_content, "br")
+            else:
+                response.streaming_content = compression.compress_stream(response.streaming_content, "br")
+            del response.headers["Content-Length"]
+        else:
+            compressed = compression.brotli.compress(response.content, quality=compression.BROTLI_STREAM_QUALITY)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
@@ -0,0 +1,73 @@
+# Generated by Django 5.0.1 on 2026-10-17
+
+from django.db import migrations, models
+from django.db.models import F
+
+# Frozen copy of api.ordering.RANK_GAP at the time of this migration
+RANK_GAP = 1 << 20
+
+
+def rank_to_key(apps, schema_editor):
+    RankingEntry = apps.get_model('api', 'RankingEntry')
+    RankingEntry.objects.update(r_key=F('r_rank') * RANK_GAP)
+
+
+def key_to_rank(apps, schema_editor):
+    RankingEntry = apps.get_model('api', 'RankingEntry')
+    Ranking = apps.get_model('api', 'Ranking')
+
+    # Rebuild dense 1-based ranks from the key order of each ranking
+    for ranking_id in Ranking.objects.values_list('id', flat=True):
+        entries = list(RankingEntry.objects.filter(ranking_id=ranking_id).order_by('r_key'))
+        for rank, entry in enumerate(entries, start=1):
+            entry.r_rank = rank
+        RankingEntry.objects.bulk_update(entries, ['r_rank'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_multi_ranking'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='rankingentry',
+            name='u_ranking_rank',
+        ),
+        migrations.RemoveConstraint(
+            model_name='rankingentry',
+            name='ck_rank_positive',
+        ),
+        migrations.AddField(
+            model_name='rankingentry',
+            name='r_key',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='rankingentry',
+            name='r_rank',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.RunPython(
+            code=rank_to_key,
+            reverse_code=key_to_rank,
+        ),
+        migrations.RemoveField(
+            model_name='rankingentry',
+            name='r_rank',
+        ),
+        migrations.AlterModelOptions(
+            name='rankingentry',
+            options={'ordering': ['r_key']},
+        ),
+        migrations.AddConstraint(
+            model_name='rankingentry',
+            constraint=models.UniqueConstraint(fields=('ranking', 'r_key'), name='u_ranking_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='rankingentry',
+            constraint=models.CheckConstraint(check=models.Q(('r_key__gte', 1)), name='ck_key_positive'),
+        ),
+    ]
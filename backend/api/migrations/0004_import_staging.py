@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-17 18:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_sparse_rank_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportStagingEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('import_id', models.CharField(db_index=True, max_length=32)),
+                ('r_key', models.BigIntegerField()),
+                ('row_number', models.IntegerField()),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staged_imports', to='api.song')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='importstagingentry',
+            constraint=models.UniqueConstraint(fields=('import_id', 'song'), name='u_import_song'),
+        ),
+        migrations.AddConstraint(
+            model_name='importstagingentry',
+            constraint=models.UniqueConstraint(fields=('import_id', 'r_key'), name='u_import_key'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-17 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_import_staging'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ranking',
+            name='updated_on',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='ranking',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.1 on 2026-10-17 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def start_log_at_current_version(apps, schema_editor):
+    # Earlier changes were never logged, so clients must resync from before now
+    Ranking = apps.get_model('api', 'Ranking')
+    Ranking.objects.update(changes_floor=F('version'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_ranking_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ranking',
+            name='changes_floor',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='RankingChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField()),
+                ('kind', models.CharField(choices=[('insert', 'Song added'), ('delete', 'Song removed'), ('update', 'Song metadata changed'), ('move', 'Song moved'), ('rename', 'Ranking details changed'), ('reset', 'Ranking replaced')], max_length=10)),
+                ('song_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('ranking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='api.ranking')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ranking', 'version'], name='i_change_ranking_version')],
+            },
+        ),
+        migrations.RunPython(
+            code=start_log_at_current_version,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Full-text index of songs, kept in sync with api_song by triggers (SQLite FTS5 only)
+
+from django.db import migrations
+
+CREATE = [
+    # External content table: the index stores no copy of the text, it reads api_song
+    """
+    CREATE VIRTUAL TABLE api_song_fts USING fts5(
+        s_artist, s_title, s_album, s_comment,
+        content='api_song', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER api_song_fts_insert AFTER INSERT ON api_song BEGIN
+        INSERT INTO api_song_fts(rowid, s_artist, s_title, s_album, s_comment)
+        VALUES (new.id, new.s_artist, new.s_title, new.s_album, new.s_comment);
+    END
+    """,
+    """
+    CREATE TRIGGER api_song_fts_delete AFTER DELETE ON api_song BEGIN
+        INSERT INTO api_song_fts(api_song_fts, rowid, s_artist, s_title, s_album, s_comment)
+        VALUES ('delete', old.id, old.s_artist, old.s_title, old.s_album, old.s_comment);
+    END
+    """,
+    """
+    CREATE TRIGGER api_song_fts_update AFTER UPDATE OF s_artist, s_title, s_album, s_comment ON api_song BEGIN
+        INSERT INTO api_song_fts(api_song_fts, rowid, s_artist, s_title, s_album, s_comment)
+        VALUES ('delete', old.id, old.s_artist, old.s_title, old.s_album, old.s_comment);
+        INSERT INTO api_song_fts(rowid, s_artist, s_title, s_album, s_comment)
+        VALUES (new.id, new.s_artist, new.s_title, new.s_album, new.s_comment);
+    END
+    """,
+    "INSERT INTO api_song_fts(api_song_fts) VALUES ('rebuild')",
+]
+
+DROP = [
+    "DROP TRIGGER IF EXISTS api_song_fts_update",
+    "DROP TRIGGER IF EXISTS api_song_fts_delete",
+    "DROP TRIGGER IF EXISTS api_song_fts_insert",
+    "DROP TABLE IF EXISTS api_song_fts",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_ranking_changes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE), run(DROP)),
+    ]
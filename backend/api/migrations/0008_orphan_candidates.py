@@ -0,0 +1,20 @@
+# Generated by Django 5.0.1 on 2026-10-17 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_song_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrphanCandidate',
+            fields=[
+                ('song_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('queued_on', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
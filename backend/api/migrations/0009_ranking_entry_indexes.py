@@ -0,0 +1,27 @@
+# Generated by Django 5.0.1 on 2026-10-17 19:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_orphan_candidates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rankingentry',
+            name='song',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='api.song'),
+        ),
+        migrations.AddIndex(
+            model_name='rankingentry',
+            index=models.Index(fields=['song', 'ranking', 'r_key'], name='i_entry_song_ranking_key'),
+        ),
+        migrations.AddIndex(
+            model_name='rankingentry',
+            index=models.Index(fields=['ranking', 'r_key', 'song'], name='i_entry_ranking_key_song'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-17 19:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_ranking_entry_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField()),
+                ('reason', models.CharField(choices=[('import', 'Before an import'), ('restore', 'Before a restore'), ('manual', 'Taken on request'), ('scheduled', 'Taken by snapshot_rankings')], max_length=10)),
+                ('size', models.PositiveIntegerField()),
+                ('song_ids', models.BinaryField()),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('ranking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='api.ranking')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ranking', 'created_on'], name='i_snapshot_ranking_created')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.1 on 2026-10-17 20:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_ranking_snapshots'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importstagingentry',
+            name='import_id',
+            field=models.CharField(max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='rankingchange',
+            name='ranking',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='api.ranking'),
+        ),
+        migrations.AlterField(
+            model_name='rankingentry',
+            name='ranking',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='api.ranking'),
+        ),
+        migrations.AlterField(
+            model_name='rankingsnapshot',
+            name='ranking',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='api.ranking'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
 
 
 class Song(models.Model):
@@ -17,23 +19,43 @@ class Song(models.Model):
         return f"{self.s_yt_id} - {self.s_title}"
 
 
+class RankingQuerySet(models.QuerySet):
+    def bump_version(self) -> int:
+        """Record a change to the content of these rankings. Returns the number of rankings bumped."""
+        return self.update(version=F("version") + 1, updated_on=timezone.now())
+
+
 class Ranking(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(max_length=120, unique=True)
     created_on = models.DateTimeField(auto_now_add=True)
+    # Incremented by every change to the ranking or its songs; drives ETag/Last-Modified
+    version = models.PositiveBigIntegerField(default=0)
+    updated_on = models.DateTimeField(auto_now=True)
+    # Oldest version the change log can bring a client forward from
+    changes_floor = models.PositiveBigIntegerField(default=0)
+
+    objects = RankingQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.name} ({self.slug})"
 
+    @property
+    def etag(self) -> str:
+        return f'"{self.pk}.{self.version}"'
+
 
 class RankingEntry(models.Model):
+    # Indexed by u_ranking_song, u_ranking_key and i_entry_ranking_key_song
     ranking = models.ForeignKey(
-        Ranking, on_delete=models.CASCADE, related_name="entries"
+        Ranking, on_delete=models.CASCADE, related_name="entries", db_index=False
     )
+    # Indexed by i_entry_song_ranking_key
     song = models.ForeignKey(
-        Song, on_delete=models.CASCADE, related_name="memberships"
+        Song, on_delete=models.CASCADE, related_name="memberships", db_index=False
     )
-    r_rank = models.IntegerField()
+    # Sparse sort key; the dense 1-based rank is computed at read time
+    r_key = models.BigIntegerField()
     r_last_updated = models.DateTimeField(auto_now=True)
 
     class Meta:
@@ -42,13 +64,126 @@ class RankingEntry(models.Model):
                 fields=["ranking", "song"], name="u_ranking_song"
             ),
             models.UniqueConstraint(
-                fields=["ranking", "r_rank"], name="u_ranking_rank"
+                fields=["ranking", "r_key"], name="u_ranking_key"
             ),
             models.CheckConstraint(
-                check=models.Q(r_rank__gte=1), name="ck_rank_positive"
+                check=models.Q(r_key__gte=1), name="ck_key_positive"
             ),
         ]
-        ordering = ["r_rank"]
+        indexes = [
+            # Covering indexes of the cross-ranking queries (api.comparison): the rankings
+            # of a song with its keys, and each ranking's songs in rank order
+            models.Index(fields=["song", "ranking", "r_key"], name="i_entry_song_ranking_key"),
+            models.Index(fields=["ranking", "r_key", "song"], name="i_entry_ranking_key_song"),
+        ]
+        ordering = ["r_key"]
+
+    def __str__(self):
+        return f"{self.r_key} - {self.song.s_yt_id} - {self.song.s_title} @ {self.ranking.slug}"
+
+
+class RankingChange(models.Model):
+    """Append-only log of changes to a ranking, one row per affected song and version."""
+
+    INSERT = "insert"
+    DELETE = "delete"
+    UPDATE = "update"
+    MOVE = "move"
+    RENAME = "rename"
+    RESET = "reset"
+    KIND_CHOICES = [
+        (INSERT, "Song added"),
+        (DELETE, "Song removed"),
+        (UPDATE, "Song metadata changed"),
+        (MOVE, "Song moved"),
+        (RENAME, "Ranking details changed"),
+        (RESET, "Ranking replaced"),
+    ]
+
+    # Indexed by i_change_ranking_version
+    ranking = models.ForeignKey(
+        Ranking, on_delete=models.CASCADE, related_name="changes", db_index=False
+    )
+    version = models.PositiveBigIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Not a foreign key: removed songs must stay in the log
+    song_id = models.BigIntegerField(blank=True, null=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["ranking", "version"], name="i_change_ranking_version"),
+        ]
+
+    def __str__(self):
+        return f"{self.ranking_id} v{self.version} {self.kind} {self.song_id}"
+
+
+class ImportStagingEntry(models.Model):
+    """Entries of a streaming CSV import, staged until the whole file is validated."""
+
+    # Indexed by u_import_song and u_import_key
+    import_id = models.CharField(max_length=32)
+    song = models.ForeignKey(
+        Song, on_delete=models.CASCADE, related_name="staged_imports"
+    )
+    r_key = models.BigIntegerField()
+    row_number = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["import_id", "song"], name="u_import_song"
+            ),
+            models.UniqueConstraint(
+                fields=["import_id", "r_key"], name="u_import_key"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.import_id} - row {self.row_number}"
+
+
+class OrphanCandidate(models.Model):
+    """Songs that may have lost their last ranking, queued for ``manage.py gc_songs`` to check."""
+
+    # Not a foreign key: the song is deleted while its row is still queued
+    song_id = models.BigIntegerField(primary_key=True)
+    queued_on = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.song_id} (queued {self.queued_on:%Y-%m-%d %H:%M})"
+
+
+class RankingSnapshot(models.Model):
+    """The order of a ranking's songs at one version, kept to look back at or restore (see api.snapshots)."""
+
+    IMPORT = "import"
+    RESTORE = "restore"
+    MANUAL = "manual"
+    SCHEDULED = "scheduled"
+    REASON_CHOICES = [
+        (IMPORT, "Before an import"),
+        (RESTORE, "Before a restore"),
+        (MANUAL, "Taken on request"),
+        (SCHEDULED, "Taken by snapshot_rankings"),
+    ]
+
+    # Indexed by i_snapshot_ranking_created
+    ranking = models.ForeignKey(
+        Ranking, on_delete=models.CASCADE, related_name="snapshots", db_index=False
+    )
+    version = models.PositiveBigIntegerField()
+    reason = models.CharField(max_length=10, choices=REASON_CHOICES)
+    size = models.PositiveIntegerField()
+    # Song ids in rank order, packed by api.snapshots.pack
+    song_ids = models.BinaryField()
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["ranking", "created_on"], name="i_snapshot_ranking_created"),
+        ]
 
     def __str__(self):
-        return f"{self.r_rank} - {self.song.s_yt_id} - {self.song.s_title} @ {self.ranking.slug}"
+        return f"{self.ranking_id} v{self.version} ({self.reason}, {self.size} songs)"
@@ -0,0 +1,254 @@
+# ordering.py
+"""
+Sparse ordering of ranking entries.
+
+Entries are ordered by ``RankingEntry.r_key``, a sparse integer key spaced
+``RANK_GAP`` apart. Moving or inserting an entry picks a key between its new
+neighbours, so only the moved row is written. The dense 1-based ``r_rank``
+exposed by the API is computed at read time with ``ROW_NUMBER()``.
+
+When two neighbours have no free key left between them the ranking is
+renumbered (``rebalance``); ``manage.py rebalance_rankings`` does the same
+ahead of time for rankings whose gaps are running low.
+"""
+from django.db import connection, transaction
+from django.db.models import F, Max
+from django.db.models.functions import RowNumber
+from django.db.models.expressions import Window
+
+from .models import Ranking, RankingEntry, Song
+
+ENTRY_TABLE = RankingEntry._meta.db_table
+RANK_GAP = 1 << 20
+# Above this many entries one scan of a ranking's order is cheaper than a count per entry
+RANK_SCAN_THRESHOLD = 100
+
+
+def dense_rank(key: str = "r_key") -> Window:
+    """Window expression producing the dense 1-based rank ordered by ``key``."""
+    return Window(expression=RowNumber(), order_by=F(key).asc())
+
+
+def key_for_rank(rank: int) -> int:
+    """Sort key for an entry imported at a given (1-based) rank."""
+    return rank * RANK_GAP
+
+
+def _value(sql: str, params: list):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def last_key_query(ranking_id: int) -> tuple[str, list]:
+    """SQL and params of the highest key of a ranking, for ``next_key``."""
+    return f"SELECT MAX(r_key) FROM {ENTRY_TABLE} WHERE ranking_id = %s", [ranking_id]
+
+
+def next_key(ranking: Ranking) -> int:
+    """Key placing a new entry at the bottom of the ranking."""
+    return (_value(*last_key_query(ranking.pk)) or 0) + RANK_GAP
+
+
+def key_between(lo: int | None, hi: int | None) -> int | None:
+    """Return a free key strictly between ``lo`` and ``hi``, or None if the gap is exhausted."""
+    if lo is None and hi is None:
+        return RANK_GAP
+    if hi is None:
+        return lo + RANK_GAP
+    if lo is None:
+        lo = max(hi - 2 * RANK_GAP, 0)
+    if hi - lo < 2:
+        return None
+    return lo + (hi - lo) // 2
+
+
+def rank_query(ranking_id: int, key: int) -> tuple[str, list]:
+    """SQL and params of the dense 1-based rank of the entry with ``key``, for ``rank_of``."""
+    return f"SELECT COUNT(*) + 1 FROM {ENTRY_TABLE} WHERE ranking_id = %s AND r_key < %s", [ranking_id, key]
+
+
+def rank_of(entry: RankingEntry) -> int:
+    """Dense 1-based rank of an entry within its ranking."""
+    return _value(*rank_query(entry.ranking_id, entry.r_key))
+
+
+def ranks_of_keys(ranking_id: int, keys: dict[int, int]) -> dict[int, int]:
+    """Dense 1-based ranks of the songs in ``keys`` (song id -> r_key) within a ranking."""
+    if len(keys) <= RANK_SCAN_THRESHOLD:
+        return {song_id: _value(*rank_query(ranking_id, key)) for song_id, key in keys.items()}
+    ranks = {}
+    entries = RankingEntry.objects.filter(ranking_id=ranking_id)
+    for rank, song_id in enumerate(entries.order_by("r_key").values_list("song_id", flat=True).iterator(), start=1):
+        if song_id in keys:
+            ranks[song_id] = rank
+    return ranks
+
+
+def songs_at_ranks_query(ranking_id: int, ranks: list[int]) -> tuple[str, list]:
+    """SQL and params of the songs at dense 1-based ``ranks`` of a ranking, for ``songs_at_ranks``."""
+    placeholders = ", ".join(["%s"] * len(ranks))
+    sql = (
+        f"WITH ranked AS (SELECT song_id, ROW_NUMBER() OVER (ORDER BY r_key) AS r_rank "
+        f"FROM {ENTRY_TABLE} WHERE ranking_id = %s ORDER BY r_key LIMIT %s) "
+        f"SELECT s.*, ranked.r_rank FROM ranked JOIN {Song._meta.db_table} s ON s.id = ranked.song_id "
+        f"WHERE ranked.r_rank IN ({placeholders}) ORDER BY ranked.r_rank"
+    )
+    return sql, [ranking_id, max(ranks, default=0), *ranks]
+
+
+def songs_at_ranks(ranking_id: int, ranks: list[int]):
+    """
+    The songs at dense 1-based ``ranks`` of a ranking, in rank order, each
+    annotated with its ``r_rank``. Ranks past the end of the ranking are left out.
+
+    One query: the entries are numbered walking the (ranking, r_key) index
+    alone, down to the deepest of ``ranks``, and only the songs at ``ranks``
+    are read, so the cost grows with the deepest rank, not with the number of
+    ranks.
+    """
+    return Song.objects.raw(*songs_at_ranks_query(ranking_id, ranks))
+
+
+def _neighbour_keys(entry: RankingEntry, new_rank: int, total: int) -> tuple[int | None, int | None]:
+    # Keys of the entries that will sit directly above and below `entry` at `new_rank`
+    others = (
+        RankingEntry.objects.filter(ranking_id=entry.ranking_id)
+        .exclude(pk=entry.pk)
+        .order_by("r_key")
+        .values_list("r_key", flat=True)
+    )
+    keys = list(others[max(new_rank - 2, 0) : new_rank])
+    lo = keys[0] if new_rank > 1 and keys else None
+    hi = keys[-1] if new_rank < total and keys else None
+    return lo, hi
+
+
+def move_entry(entry: RankingEntry, new_rank: int, total: int) -> None:
+    """
+    Move ``entry`` to the dense position ``new_rank`` (already clamped to [1, total]).
+
+    Only ``entry`` itself is written, unless the neighbouring keys leave no room
+    and the ranking has to be renumbered first.
+    """
+    lo, hi = _neighbour_keys(entry, new_rank, total)
+    key = key_between(lo, hi)
+    if key is None:
+        rebalance(entry.ranking_id)
+        lo, hi = _neighbour_keys(entry, new_rank, total)
+        key = key_between(lo, hi)
+    entry.r_key = key
+    entry.save(update_fields=["r_key"])
+
+
+def min_gap(ranking_id: int) -> int | None:
+    """Smallest distance between consecutive keys (the first key counts as a gap from 0)."""
+    smallest = None
+    previous = 0
+    keys = RankingEntry.objects.filter(ranking_id=ranking_id).order_by("r_key").values_list("r_key", flat=True)
+    for key in keys.iterator():
+        gap = key - previous
+        if smallest is None or gap < smallest:
+            smallest = gap
+        previous = key
+    return smallest
+
+
+def rebalance(ranking_id: int) -> int:
+    """Renumber a ranking's keys to evenly spaced multiples of RANK_GAP. Returns the number of entries."""
+    with transaction.atomic():
+        ids = list(RankingEntry.objects.filter(ranking_id=ranking_id).order_by("r_key").values_list("id", flat=True))
+        _renumber(ranking_id, ids)
+    return len(ids)
+
+
+def _renumber(ranking_id: int, ids: list[int]) -> None:
+    # Assign key_for_rank(1..n) to the entries `ids`, in that order
+    entries = RankingEntry.objects.filter(ranking_id=ranking_id)
+    if not ids:
+        return
+    # Move every key above both the old and the new range first, so the
+    # unique (ranking, r_key) constraint never sees a collision.
+    highest = entries.aggregate(Max("r_key"))["r_key__max"]
+    entries.update(r_key=F("r_key") + max(highest, key_for_rank(len(ids))) + 1)
+    RankingEntry.objects.bulk_update(
+        [RankingEntry(id=pk, r_key=key_for_rank(i)) for i, pk in enumerate(ids, start=1)],
+        ["r_key"],
+        batch_size=500,
+    )
+
+
+def _increasing_subsequence(keys: list[int]) -> set[int]:
+    # Indexes of one longest strictly increasing subsequence of `keys` (patience sorting)
+    tails: list[int] = []
+    previous = [-1] * len(keys)
+    for i, key in enumerate(keys):
+        lo, hi = 0, len(tails)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if keys[tails[mid]] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo:
+            previous[i] = tails[lo - 1]
+        if lo == len(tails):
+            tails.append(i)
+        else:
+            tails[lo] = i
+    kept = set()
+    i = tails[-1] if tails else -1
+    while i != -1:
+        kept.add(i)
+        i = previous[i]
+    return kept
+
+
+def _spread(lo: int, hi: int | None, count: int, taken: set[int]) -> list[int] | None:
+    # `count` increasing keys strictly between lo and hi that avoid `taken`, or None if they don't fit
+    step = RANK_GAP if hi is None else (hi - lo) // (count + 1)
+    if step < 1:
+        return None
+    keys = []
+    for j in range(1, count + 1):
+        key = lo + step * j
+        # Stay inside this key's slot so the result remains increasing
+        while key in taken and key < lo + step * (j + 1) - 1:
+            key += 1
+        if key in taken:
+            return None
+        keys.append(key)
+    return keys
+
+
+def apply_order(ranking_id: int, order: list[tuple[int, int]]) -> list[int]:
+    """
+    Give the ranking the order ``order``, a list of ``(entry id, current r_key)``.
+
+    The longest subsequence of entries whose keys are already in order keeps
+    its keys; only the other entries are rewritten, each with a key between
+    its kept neighbours. Falls back to renumbering the whole ranking when the
+    gaps are too small. Returns the ids of the entries whose key was rewritten.
+    """
+    keys = [key for _, key in order]
+    kept = _increasing_subsequence(keys)
+    taken = set(keys)
+    updates = []
+    lo, run = 0, []
+    for i, (pk, key) in enumerate(order + [(None, None)]):
+        if i < len(order) and i not in kept:
+            run.append(pk)
+            continue
+        if run:
+            new_keys = _spread(lo, key, len(run), taken)
+            if new_keys is None:
+                ids = [pk for pk, _ in order]
+                _renumber(ranking_id, ids)
+                return ids
+            updates.extend(RankingEntry(id=pk, r_key=new_key) for pk, new_key in zip(run, new_keys))
+            run = []
+        lo = key
+    # New keys avoid every existing key, so the bulk update cannot trip the unique constraint mid-statement
+    RankingEntry.objects.bulk_update(updates, ["r_key"], batch_size=500)
+    return [entry.id for entry in updates]
@@ -0,0 +1,97 @@
+# orphans.py
+"""
+Deferred garbage collection of songs that no ranking uses any more.
+
+Requests that remove songs from rankings don't look for orphans themselves:
+they queue the songs they touched as OrphanCandidates (``enqueue`` and
+``enqueue_ranking``) and ``manage.py gc_songs`` later deletes the ones that
+still have no ranking, a bounded batch per transaction. A song added back to
+a ranking before the collection runs is simply kept, and so are the songs of
+ranking snapshots, which a restore may bring back (see api.snapshots).
+``sweep`` checks every song instead, for orphans left behind without being
+queued.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import response_cache, snapshots
+from .models import OrphanCandidate, RankingEntry, Song
+
+BATCH_SIZE = 1000
+
+
+def enqueue(song_ids) -> None:
+    """Queue songs whose membership in a ranking was just removed."""
+    OrphanCandidate.objects.bulk_create(
+        [OrphanCandidate(song_id=song_id) for song_id in song_ids], ignore_conflicts=True, batch_size=BATCH_SIZE
+    )
+
+
+def enqueue_ranking_query(ranking_id: int, queued_on) -> tuple[str, list]:
+    """SQL and params queueing every song of a ranking, for ``enqueue_ranking``."""
+    # One INSERT ... SELECT: the songs of a large ranking never pass through Python
+    sql = (
+        f"INSERT INTO {OrphanCandidate._meta.db_table} (song_id, queued_on) "
+        f"SELECT song_id, %s FROM {RankingEntry._meta.db_table} WHERE ranking_id = %s "
+        f"ON CONFLICT DO NOTHING"
+    )
+    return sql, [queued_on, ranking_id]
+
+
+def enqueue_ranking(ranking_id: int) -> int:
+    """Queue every song of a ranking; call before its entries are deleted. Returns the number of rows queued."""
+    with connection.cursor() as cursor:
+        cursor.execute(*enqueue_ranking_query(ranking_id, timezone.now()))
+        return cursor.rowcount
+
+
+def _delete_orphans(song_ids: list[int], kept: set[int]) -> int:
+    # Call inside a transaction, so no song is added back between the check and the delete
+    song_ids = [song_id for song_id in song_ids if song_id not in kept]
+    orphans = dict(Song.objects.filter(pk__in=song_ids, memberships__isnull=True).values_list("pk", "s_yt_id"))
+    if not orphans:
+        return 0
+    response_cache.invalidate(yt_ids=list(orphans.values()))
+    Song.objects.filter(pk__in=orphans).delete()
+    return len(orphans)
+
+
+def collect(batch_size: int = BATCH_SIZE, max_batches: int | None = None) -> tuple[int, int]:
+    """
+    Delete the queued songs that are still orphaned, ``batch_size`` candidates per transaction.
+
+    Stops after ``max_batches`` batches if given. Returns ``(candidates checked, songs deleted)``.
+    """
+    checked = deleted = batches = 0
+    kept = snapshots.referenced_song_ids()
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            song_ids = list(OrphanCandidate.objects.order_by("song_id").values_list("song_id", flat=True)[:batch_size])
+            if not song_ids:
+                break
+            deleted += _delete_orphans(song_ids, kept)
+            OrphanCandidate.objects.filter(song_id__in=song_ids).delete()
+        checked += len(song_ids)
+        batches += 1
+    return checked, deleted
+
+
+def sweep(batch_size: int = BATCH_SIZE) -> tuple[int, int]:
+    """
+    Delete every orphaned song, queued or not, checking ``batch_size`` song ids per transaction.
+
+    Returns ``(songs checked, songs deleted)``.
+    """
+    checked = deleted = 0
+    last_id = 0
+    kept = snapshots.referenced_song_ids()
+    while True:
+        song_ids = list(Song.objects.filter(pk__gt=last_id).order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if not song_ids:
+            break
+        with transaction.atomic():
+            deleted += _delete_orphans(song_ids, kept)
+            OrphanCandidate.objects.filter(song_id__in=song_ids).delete()
+        checked += len(song_ids)
+        last_id = song_ids[-1]
+    return checked, deleted
@@ -0,0 +1,99 @@
+# pagination.py
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .models import RankingEntry
+
+
+class RankKeysetPagination(BasePagination):
+    """
+    Opt-in keyset pagination of a ranking's songs by rank.
+
+    - ``?after_rank=500&limit=200`` returns ranks 501..700.
+    - ``?from_rank=1&to_rank=50`` returns that window of ranks.
+
+    Without these parameters the list is not paginated. Pages are read with a
+    range scan on the (ranking, r_key) index: ``r_key > <last key> ORDER BY r_key
+    LIMIT n``. The ``next`` link carries the last key as ``after_key``, so
+    following it never counts rows; only a bare ``after_rank``/``from_rank``
+    has to step over that many index entries to find its starting key.
+    ``after_key`` is only accepted along with the ``after_rank`` it starts at.
+
+    The view must annotate the queryset with ``r_key`` and expose the
+    selected ranking as ``view.ranking``.
+    """
+
+    default_limit = 200
+    max_limit = 1000
+
+    def _int_param(self, request, name, default=None, minimum=0):
+        value = request.query_params.get(name)
+        if value in (None, ""):
+            return default
+        try:
+            number = int(value)
+        except ValueError:
+            raise ValidationError({name: "Must be an integer."})
+        if number < minimum:
+            raise ValidationError({name: f"Must be at least {minimum}."})
+        return number
+
+    @staticmethod
+    def is_requested(request) -> bool:
+        return any(name in request.GET for name in ("after_rank", "after_key", "from_rank", "to_rank", "limit"))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+        self.request = request
+
+        from_rank = self._int_param(request, "from_rank", minimum=1)
+        to_rank = self._int_param(request, "to_rank", minimum=1)
+        if from_rank is not None or to_rank is not None:
+            from_rank = from_rank or 1
+            if to_rank is None:
+                to_rank = from_rank + self.default_limit - 1
+            if to_rank < from_rank:
+                raise ValidationError({"to_rank": "Must not be lower than from_rank."})
+            after_rank = from_rank - 1
+            limit = min(to_rank - from_rank + 1, self.max_limit)
+        else:
+            after_rank = self._int_param(request, "after_rank", default=0)
+            limit = min(self._int_param(request, "limit", default=self.default_limit, minimum=1), self.max_limit)
+
+        after_key = self._int_param(request, "after_key")
+        if after_key is not None and request.query_params.get("after_rank") in (None, ""):
+            # Ranks of the page count from after_rank; the key alone doesn't tell how deep it is
+            raise ValidationError({"after_rank": "Required with after_key."})
+        if after_key is None and after_rank > 0:
+            # Key of the entry at `after_rank`, read from the (ranking, r_key) index alone
+            keys = RankingEntry.objects.filter(ranking=view.ranking).order_by("r_key").values_list("r_key", flat=True)
+            after_key = next(iter(keys[after_rank - 1 : after_rank]), None)
+            if after_key is None:
+                self.after_rank, self.page = after_rank, []
+                return self.page
+
+        if after_key is not None:
+            queryset = queryset.filter(r_key__gt=after_key)
+        self.page = list(queryset[: limit + 1])
+        self.has_next = len(self.page) > limit
+        self.page = self.page[:limit]
+        for rank, song in enumerate(self.page, start=after_rank + 1):
+            song.r_rank = rank
+        self.after_rank = after_rank
+        return self.page
+
+    def get_next_link(self):
+        if not self.page or not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        for name in ("from_rank", "to_rank"):
+            url = remove_query_param(url, name)
+        url = replace_query_param(url, "after_rank", self.after_rank + len(self.page))
+        url = replace_query_param(url, "after_key", self.page[-1].r_key)
+        return replace_query_param(url, "limit", len(self.page))
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
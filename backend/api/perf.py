@@ -0,0 +1,534 @@
+# perf.py
+"""
+Performance regression suite: every endpoint of api/urls.py and the
+import_songs command, timed on generated datasets.
+
+``run`` generates a dataset per size (three rankings sharing half of their
+songs, see api.benchmarks.generate_dataset), calls each case ``repeat``
+times and returns a report with, per case and size, the latency
+percentiles and the number of queries the first call ran. Reports are
+plain JSON, so the report of one commit can be kept and passed as the
+baseline of the next run; ``compare`` lists what regressed against it and
+against the budgets in settings.PERF_SUITE.
+
+Run it with ``manage.py perf_suite``, which uses a throwaway test database.
+"""
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, transaction
+from rest_framework.test import APIClient
+
+from . import authentication, response_cache, snapshots
+from .benchmarks import clear, generate_dataset, measure, percentile, write_csv
+from .models import Ranking, RankingSnapshot, Song
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+PREFIX = "perf"
+PASSWORD = "perf-suite"
+# Cases that process a whole ranking (or hash a password) run at most this many times per size
+HEAVY_REPEAT = 3
+
+CASES = {}
+
+
+class SuiteError(Exception):
+    pass
+
+
+def case(name: str, heavy: bool = False):
+    """Register a case: a function of the Context returning the operation to time."""
+
+    def register(factory):
+        CASES[name] = (factory, heavy)
+        return factory
+
+    return register
+
+
+class QueryCounter:
+    """Execute wrapper counting the queries run on a connection; see count_queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+
+@contextlib.contextmanager
+def count_queries(using=connection):
+    """
+    Count the queries run inside the block, requests made with the test client included.
+
+    (CaptureQueriesContext misses those: Django resets the query log when a request starts.)
+    """
+    counter = QueryCounter()
+    with using.execute_wrapper(counter):
+        yield counter
+
+
+class Context:
+    """The dataset and clients shared by the cases of one size."""
+
+    def __init__(self, size: int, directory: str):
+        self.size = size
+        self.directory = directory
+        self.rng = random.Random(size)
+        self.rankings = generate_dataset(size, prefix=PREFIX)
+        self.ranking = self.rankings[0]
+        self.song_ids = list(self.ranking.entries.values_list("song_id", flat=True))
+        self.yt_ids = list(Song.objects.filter(pk__in=self.song_ids[:1000]).values_list("s_yt_id", flat=True))
+        self.user = User.objects.create_user("perf", password=PASSWORD, is_staff=True)
+        self.anonymous = APIClient()
+        self.staff = APIClient()
+        self.staff.force_authenticate(self.user)
+        self.bearer = APIClient()
+        access = authentication.tokens_for(self.user).access_token
+        access.set_exp(lifetime=datetime.timedelta(days=1))  # outlives a run at any size
+        self.bearer.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        # Songs added by songs/add/, for songs/delete/ to remove
+        self.added_songs = []
+        self.serial = 0
+
+    def next_serial(self) -> int:
+        self.serial += 1
+        return self.serial
+
+    def csv_file(self, name: str, size: int) -> str:
+        path = os.path.join(self.directory, f"{name}-{size}.csv")
+        if not os.path.exists(path):
+            write_csv(path, size)
+        return path
+
+
+def _url(path: str, ranking: Ranking | None = None) -> str:
+    return f"/api/{path}" + (f"{'&' if '?' in path else '?'}list={ranking.slug}" if ranking else "")
+
+
+def _drop_cached_responses():
+    caches[response_cache.CACHE_ALIAS].clear()
+
+
+@case("GET songs/")
+def songs_list(ctx):
+    def call():
+        _drop_cached_responses()
+        return ctx.anonymous.get(_url("songs/", ctx.ranking))
+
+    return call
+
+
+@case("GET songs/ (cached)")
+def songs_list_cached(ctx):
+    return lambda: ctx.anonymous.get(_url("songs/", ctx.ranking))
+
+
+@case("GET songs/ (cached, gzip)")
+def songs_list_gzip(ctx):
+    return lambda: ctx.anonymous.get(_url("songs/", ctx.ranking), HTTP_ACCEPT_ENCODING="gzip")
+
+
+@case("GET songs/ (columnar)")
+def songs_list_columnar(ctx):
+    def call():
+        _drop_cached_responses()
+        return ctx.anonymous.get(_url("songs/?format=columnar", ctx.ranking))
+
+    return call
+
+
+@case("GET songs/?fields=")
+def songs_list_fields(ctx):
+    def call():
+        _drop_cached_responses()
+        return ctx.anonymous.get(_url("songs/?fields=s_yt_id,s_title,r_rank", ctx.ranking))
+
+    return call
+
+
+@case("GET songs/?limit=")
+def songs_page(ctx):
+    def call():
+        after = ctx.rng.randint(0, max(0, ctx.size - 100))
+        return ctx.anonymous.get(_url(f"songs/?after_rank={after}&limit=100", ctx.ranking))
+
+    return call
+
+
+@case("GET songs/lookup/")
+def song_lookup(ctx):
+    def call():
+        _drop_cached_responses()
+        return ctx.anonymous.get(_url(f"songs/lookup/?yt_id={ctx.rng.choice(ctx.yt_ids)}"))
+
+    return call
+
+
+@case("GET songs/sample/")
+def song_sample(ctx):
+    return lambda: ctx.anonymous.get(_url(f"songs/sample/?n=50&seed={ctx.next_serial()}", ctx.ranking))
+
+
+@case("GET songs/search/")
+def song_search(ctx):
+    return lambda: ctx.anonymous.get(_url(f"songs/search/?q=title {ctx.rng.randint(1, ctx.size)}", ctx.ranking))
+
+
+@case("PATCH update/rank/")
+def update_rank(ctx):
+    def call():
+        move = {"songId": ctx.rng.choice(ctx.song_ids), "newRank": ctx.rng.randint(1, ctx.size)}
+        return ctx.staff.patch(_url("update/rank/", ctx.ranking), move, format="json")
+
+    return call
+
+
+@case("PATCH update/rank/batch/")
+def update_rank_batch(ctx):
+    def call():
+        moves = [{"songId": ctx.rng.choice(ctx.song_ids), "newRank": ctx.rng.randint(1, ctx.size)} for _ in range(20)]
+        return ctx.staff.patch(_url("update/rank/batch/", ctx.ranking), {"moves": moves}, format="json")
+
+    return call
+
+
+@case("POST upload-csv/?stream=1", heavy=True)
+def upload_csv(ctx):
+    def call():
+        with open(ctx.csv_file("upload", ctx.size), "rb") as file:
+            return ctx.staff.post(_url("upload-csv/?stream=1", ctx.rankings[-1]), {"file": file}, format="multipart")
+
+    return call
+
+
+@case("GET export/?type=csv", heavy=True)
+def export_csv(ctx):
+    return lambda: _consume(ctx.anonymous.get(_url("export/?type=csv", ctx.ranking)))
+
+
+@case("GET export/?type=ndjson", heavy=True)
+def export_ndjson(ctx):
+    return lambda: _consume(ctx.anonymous.get(_url("export/?type=ndjson", ctx.ranking)))
+
+
+def _consume(response):
+    # The time of a streamed response is the time to produce all of it
+    b"".join(response.streaming_content)
+    return response
+
+
+@case("POST songs/add/")
+def add_song(ctx):
+    def call():
+        song = {"s_yt_id": f"perf{ctx.next_serial():07d}", "s_title": "Added", "s_artist": "Perf"}
+        response = ctx.staff.post(_url("songs/add/", ctx.ranking), song, format="json")
+        ctx.added_songs.append(response.json()["id"])
+        return response
+
+    return call
+
+
+@case("PATCH songs/update/<pk>")
+def update_song(ctx):
+    def call():
+        song_id = ctx.rng.choice(ctx.song_ids)
+        return ctx.staff.patch(_url(f"songs/update/{song_id}"), {"s_comment": f"edit {ctx.next_serial()}"}, format="json")
+
+    return call
+
+
+@case("PATCH songs/update/batch/")
+def update_song_batch(ctx):
+    def call():
+        comment = f"edit {ctx.next_serial()}"
+        songs = [{"id": song_id, "s_comment": comment} for song_id in ctx.rng.sample(ctx.song_ids, min(1000, ctx.size))]
+        return ctx.staff.patch(_url("songs/update/batch/"), {"songs": songs}, format="json")
+
+    return call
+
+
+@case("DELETE songs/delete/<pk>/")
+def delete_song(ctx):
+    def call():
+        if not ctx.added_songs:
+            add_song(ctx)()
+        return ctx.staff.delete(_url(f"songs/delete/{ctx.added_songs.pop()}/", ctx.ranking))
+
+    return call
+
+
+@case("GET rankings/")
+def ranking_list(ctx):
+    def call():
+        _drop_cached_responses()
+        return ctx.anonymous.get(_url("rankings/"))
+
+    return call
+
+
+@case("POST rankings/")
+def ranking_create(ctx):
+    def call():
+        serial = ctx.next_serial()
+        return ctx.staff.post(_url("rankings/"), {"name": f"New {serial}", "slug": f"new-{serial}"}, format="json")
+
+    return call
+
+
+@case("GET rankings/<pk>/")
+def ranking_detail(ctx):
+    return lambda: ctx.anonymous.get(_url(f"rankings/{ctx.ranking.pk}/"))
+
+
+@case("PATCH rankings/<pk>/")
+def ranking_rename(ctx):
+    return lambda: ctx.staff.patch(_url(f"rankings/{ctx.ranking.pk}/"), {"name": f"Renamed {ctx.next_serial()}"}, format="json")
+
+
+@case("DELETE rankings/<pk>/", heavy=True)
+def ranking_delete(ctx):
+    # Deletes full-size rankings, created up front so only the deletion is timed
+    doomed = [generate_dataset(ctx.size, rankings=1, prefix=f"doomed{index}")[0] for index in range(HEAVY_REPEAT + 1)]
+    return lambda: ctx.staff.delete(_url(f"rankings/{doomed.pop().pk}/"))
+
+
+@case("GET rankings/<slug>/changes/")
+def ranking_changes(ctx):
+    def call():
+        version = Ranking.objects.values_list("version", flat=True).get(pk=ctx.ranking.pk)
+        return ctx.anonymous.get(_url(f"rankings/{ctx.ranking.slug}/changes/?since={max(0, version - 20)}"))
+
+    return call
+
+
+def _snapshot(ctx):
+    with transaction.atomic():
+        return snapshots.take(ctx.ranking, RankingSnapshot.MANUAL)
+
+
+@case("GET rankings/<slug>/snapshots/")
+def ranking_snapshots(ctx):
+    _snapshot(ctx)
+    return lambda: ctx.anonymous.get(_url(f"rankings/{ctx.ranking.slug}/snapshots/"))
+
+
+@case("POST rankings/<slug>/snapshots/", heavy=True)
+def ranking_snapshot_create(ctx):
+    def call():
+        # A snapshot is only taken if the ranking changed since the last one
+        Ranking.objects.filter(pk=ctx.ranking.pk).bump_version()
+        return ctx.staff.post(_url(f"rankings/{ctx.ranking.slug}/snapshots/"))
+
+    return call
+
+
+@case("GET rankings/<slug>/snapshots/<pk>/", heavy=True)
+def ranking_snapshot(ctx):
+    snapshot = _snapshot(ctx)
+    return lambda: ctx.anonymous.get(_url(f"rankings/{ctx.ranking.slug}/snapshots/{snapshot.pk}/"))
+
+
+@case("POST rankings/<slug>/snapshots/<pk>/restore/", heavy=True)
+def restore_snapshot(ctx):
+    # Restores the ranking's current order, which leaves the dataset as it was
+    snapshot = _snapshot(ctx)
+    return lambda: ctx.staff.post(_url(f"rankings/{ctx.ranking.slug}/snapshots/{snapshot.pk}/restore/"))
+
+
+@case("GET rankings/compare/")
+def ranking_compare(ctx):
+    a, b = ctx.rankings[0], ctx.rankings[1]
+
+    def call():
+        _drop_cached_responses()
+        return ctx.anonymous.get(_url(f"rankings/compare/?from={a.slug}&to={b.slug}"))
+
+    return call
+
+
+@case("GET rankings/aggregate/", heavy=True)
+def ranking_aggregate(ctx):
+    lists = ",".join(ranking.slug for ranking in ctx.rankings)
+
+    def call():
+        _drop_cached_responses()
+        return ctx.anonymous.get(_url(f"rankings/aggregate/?lists={lists}&method=borda"))
+
+    return call
+
+
+@case("GET songs/<pk>/rankings/")
+def song_rankings(ctx):
+    return lambda: ctx.anonymous.get(_url(f"songs/{ctx.rng.choice(ctx.song_ids)}/rankings/"))
+
+
+@case("GET cache/stats/")
+def cache_stats(ctx):
+    return lambda: ctx.staff.get(_url("cache/stats/"))
+
+
+# The other cases authenticate with force_authenticate; these two send a real access token
+# to a view that runs no queries of its own, so their query counts are those of authentication.
+
+
+@case("GET cache/stats/ (JWT)")
+def cache_stats_jwt(ctx):
+    # Once the user's state is cached (see api.authentication.TTL), requests run no queries
+    ctx.bearer.get(_url("cache/stats/"))
+    return lambda: ctx.bearer.get(_url("cache/stats/"))
+
+
+@case("GET cache/stats/ (JWT, uncached user)")
+def cache_stats_jwt_uncached(ctx):
+    def call():
+        authentication.clear()
+        return ctx.bearer.get(_url("cache/stats/"))
+
+    return call
+
+
+@case("GET _stats/")
+def api_stats(ctx):
+    if not settings.INSTRUMENTATION["ENABLED"]:
+        return None
+    return lambda: ctx.staff.get(_url("_stats/"))
+
+
+@case("POST login/", heavy=True)  # password hashing is slow on purpose
+def login(ctx):
+    return lambda: ctx.anonymous.post(_url("login/"), {"username": "perf", "password": PASSWORD}, format="json")
+
+
+@case("POST token/refresh/")
+def token_refresh(ctx):
+    refresh = ctx.anonymous.post(_url("login/"), {"username": "perf", "password": PASSWORD}, format="json").json()["refresh"]
+    return lambda: ctx.anonymous.post(_url("token/refresh/"), {"refresh": refresh}, format="json")
+
+
+@case("import_songs", heavy=True)
+def import_songs(ctx):
+    return lambda: call_command("import_songs", ctx.csv_file("import", ctx.size), ranking=f"{PREFIX}-import", stdout=io.StringIO())
+
+
+@case("import_songs --upsert", heavy=True)
+def import_songs_upsert(ctx):
+    return lambda: call_command(
+        "import_songs", ctx.csv_file("import", ctx.size), ranking=f"{PREFIX}-import", upsert=True, stdout=io.StringIO()
+    )
+
+
+@case("import_songs --stream", heavy=True)
+def import_songs_stream(ctx):
+    return lambda: call_command(
+        "import_songs", ctx.csv_file("import", ctx.size), ranking=f"{PREFIX}-import", stream=True, stdout=io.StringIO()
+    )
+
+
+def _check(name: str, result) -> None:
+    status = getattr(result, "status_code", None)
+    if status is not None and status >= 400:
+        raise SuiteError(f"{name} failed with status {status}: {getattr(result, 'content', b'')[:200]!r}")
+
+
+def run_case(name: str, ctx: Context, repeat: int) -> dict | None:
+    """Time one case on ``ctx``; None if it doesn't apply to this configuration."""
+    factory, heavy = CASES[name]
+    operation = factory(ctx)
+    if operation is None:
+        return None
+    with count_queries() as queries:
+        _check(name, operation())
+    samples = measure(lambda: _check(name, operation()), min(repeat, HEAVY_REPEAT) if heavy else repeat)
+    return {
+        "queries": queries.count,
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+        **{f"p{pct}_ms": round(percentile(samples, pct) * 1000, 3) for pct in (50, 90, 99)},
+    }
+
+
+def run(sizes, repeat: int, names=None, log=None) -> dict:
+    """Run the ``names`` cases (default: all) at every size and return the report."""
+    results = {name: {} for name in names or CASES}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            clear()
+            User.objects.filter(username="perf").delete()
+            ctx = Context(size, directory)
+            for name in results:
+                result = run_case(name, ctx, repeat)
+                if result is not None:
+                    results[name][str(size)] = result
+                    if log:
+                        log(name, size, result)
+    return {"meta": _meta(sizes, repeat), "results": {name: by_size for name, by_size in results.items() if by_size}}
+
+
+def _meta(sizes, repeat: int) -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": f"{connection.vendor} {connection.Database.sqlite_version if connection.vendor == 'sqlite' else ''}".strip(),
+        "sizes": list(sizes),
+        "repeat": repeat,
+    }
+
+
+def compare(report: dict, baseline: dict | None = None, thresholds: dict | None = None) -> list[str]:
+    """
+    Regressions of ``report``: p50 latencies over their budget (settings.PERF_SUITE["BUDGETS_MS"])
+    and, against ``baseline``, p50s that grew by more than MAX_REGRESSION and MIN_DELTA_MS,
+    and cases that run more queries. Returns one message per regression.
+    """
+    thresholds = {**settings.PERF_SUITE, **(thresholds or {})}
+    previous = (baseline or {}).get("results", {})
+    failures = []
+    for name, by_size in report["results"].items():
+        budget = thresholds["BUDGETS_MS"].get(name)
+        for size, result in by_size.items():
+            label = f"{name} @ {size}"
+            if budget is not None and result["p50_ms"] > budget:
+                failures.append(f"{label}: p50 {result['p50_ms']:.2f} ms over the budget of {budget} ms")
+            before = previous.get(name, {}).get(size)
+            if before is None:
+                continue
+            growth = result["p50_ms"] - before["p50_ms"]
+            if growth > thresholds["MIN_DELTA_MS"] and growth > before["p50_ms"] * thresholds["MAX_REGRESSION"]:
+                failures.append(f"{label}: p50 {before['p50_ms']:.2f} -> {result['p50_ms']:.2f} ms")
+            if result["queries"] > before["queries"]:
+                failures.append(f"{label}: {before['queries']} -> {result['queries']} queries")
+    return failures
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save(report: dict, path: str) -> None:
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+        file.write("\n")
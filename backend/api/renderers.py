@@ -0,0 +1,78 @@
+# renderers.py
+import json
+
+from rest_framework import renderers
+
+from .instrumentation import timed_serialization
+
+try:
+    import orjson
+except ImportError:  # optional dependency, the stdlib encoder is used instead
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional dependency, MessagePack is only offered when it is installed
+    msgpack = None
+
+
+def render_json(data) -> bytes:
+    """
+    Encode plain JSON data (dicts, lists, strings, numbers, None) exactly as
+    rest_framework's JSONRenderer does with the default settings, using
+    orjson when it is installed.
+    """
+    with timed_serialization():
+        if orjson is not None:
+            ret = orjson.dumps(data)
+            # JSONRenderer escapes the JavaScript line terminators
+            return ret.replace("\u2028".encode(), b"\\u2028").replace("\u2029".encode(), b"\\u2029")
+        ret = json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+        return ret.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029").encode()
+
+
+class TimedJSONRenderer(renderers.JSONRenderer):
+    """rest_framework's JSONRenderer, counting its time as serialization in api.instrumentation."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed_serialization():
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class ColumnarRenderer(renderers.BaseRenderer):
+    """
+    Base of the columnar song list formats offered by songs/ (see api.columnar).
+
+    The view builds the columnar data; renderers only encode it, so errors
+    are encoded the same way as plain data.
+    """
+
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return self.encode(data)
+
+    def encode(self, data) -> bytes:
+        raise NotImplementedError
+
+
+class ColumnarJSONRenderer(ColumnarRenderer):
+    media_type = "application/vnd.toplista.columnar+json"
+    format = "columnar"
+
+    def encode(self, data) -> bytes:
+        return render_json(data)
+
+
+class ColumnarMessagePackRenderer(ColumnarRenderer):
+    media_type = "application/vnd.toplista.columnar+msgpack"
+    format = "msgpack"
+
+    def encode(self, data) -> bytes:
+        with timed_serialization():
+            return msgpack.packb(data)
+
+
+COLUMNAR_RENDERERS = [ColumnarJSONRenderer] + ([ColumnarMessagePackRenderer] if msgpack is not None else [])
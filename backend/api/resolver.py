@@ -0,0 +1,56 @@
+# resolver.py
+"""
+Process-local cache of the rankings selected with ``?list=<slug>``.
+
+Most requests only need to know which ranking a slug names, so ``resolve``
+answers from memory and touches the database only the first time a process
+sees a slug. The cached Ranking is a snapshot: its id, name and slug are
+reliable, its version and timestamps are not; use ``current`` where those
+matter, and for writes, which must not go to a ranking that another process
+has since renamed. Renames and deletions made in this process drop the
+affected slugs when they commit; changes made by other processes are picked
+up after at most TTL seconds.
+"""
+import time
+
+from django.db import transaction
+
+from .models import Ranking
+
+TTL = 60
+
+_rankings: dict[str, tuple[float, Ranking]] = {}
+
+
+def resolve(slug: str) -> Ranking:
+    """Return the (possibly cached) ranking named ``slug``. Raises Ranking.DoesNotExist."""
+    cached = _rankings.get(slug)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    return current(slug)
+
+
+def current(slug: str) -> Ranking:
+    """Load the ranking named ``slug`` from the database and refresh its cache entry. Raises Ranking.DoesNotExist."""
+    try:
+        ranking = Ranking.objects.get(slug=slug)
+    except Ranking.DoesNotExist:
+        # Unknown slugs aren't cached, so creating a ranking needs no invalidation
+        _rankings.pop(slug, None)
+        raise
+    _rankings[slug] = (time.monotonic() + TTL, ranking)
+    return ranking
+
+
+def forget(*slugs: str) -> None:
+    """Drop ``slugs`` from the cache once the current transaction commits, or right away outside of one."""
+
+    def drop():
+        for slug in slugs:
+            _rankings.pop(slug, None)
+
+    transaction.on_commit(drop)
+
+
+def clear() -> None:
+    _rankings.clear()
@@ -0,0 +1,170 @@
+# response_cache.py
+"""
+Cache of fully rendered read responses (the songs/ list of each ranking, the
+rankings/ list and songs/lookup/ results), kept in the "responses" cache of
+settings.CACHES.
+
+Entries of rankings are tagged with the version (or ETag) they were rendered
+from and a hit only counts if the tag still matches, so a response rendered
+while a write was committing is never served after it. Mutations additionally
+drop the affected entries once their transaction commits (see ``invalidate``),
+which keeps the cache from filling up with dead versions and is the only
+invalidation the untagged song lookups get.
+
+On a miss only one request renders the response: the others wait for it to
+appear in the cache instead of all running the same query at once.
+"""
+import asyncio
+import threading
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+
+CACHE_ALIAS = "responses"
+# How long a renderer holds the lock, and how long others wait for its result before rendering themselves
+LOCK_TIMEOUT = 30
+WAIT_TIMEOUT = 10
+WAIT_INTERVAL = 0.02
+
+_stats = {"hits": 0, "misses": 0, "waits": 0, "renders": 0}
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats() -> dict:
+    """Hit/miss counters of this process. ``waits`` counts misses served by another request's render."""
+    with _stats_lock:
+        counters = dict(_stats)
+    lookups = counters["hits"] + counters["misses"]
+    counters["hit_ratio"] = round(counters["hits"] / lookups, 4) if lookups else None
+    return counters
+
+
+def ranking_key(ranking_id: int, variant: str = "") -> str:
+    # ``variant`` names another representation of the list, see views.SongList.variant
+    return f"ranking:{ranking_id}:songs:{variant}" if variant else f"ranking:{ranking_id}:songs"
+
+
+# Variants of the full songs/ list that invalidate() drops along with the plain one; lists of
+# only some fields are left to expire by their version tag, like the comparison_key entries
+RANKING_VARIANTS = ("columnar", "msgpack")
+# Content-Encodings of the compressed copies api.compression keeps next to cached bodies
+ENCODINGS = ("br", "gzip")
+
+
+def encoded_key(key: str, encoding: str) -> str:
+    return f"{key}:{encoding}"
+
+
+def count_key(ranking_id: int) -> str:
+    return f"ranking:{ranking_id}:count"
+
+
+def song_key(yt_id: str) -> str:
+    return f"song:{yt_id}"
+
+
+def comparison_key(kind: str, *ranking_ids: int) -> str:
+    # Tagged with the rankings' versions, so these expire without invalidation
+    return f"{kind}:{':'.join(map(str, ranking_ids))}"
+
+
+RANKINGS_KEY = "rankings"
+
+
+def get_or_render(key: str, render, tag=None):
+    """
+    Return the cached value of ``key`` if it was stored with ``tag``, else ``render()`` it and cache it.
+
+    ``render`` returns the value to cache, or None for a response that must not
+    be cached (e.g. an error), which is then rendered again on every request.
+    Returns ``(value, hit)``.
+    """
+    cache = _cache()
+    cached = cache.get(key)
+    if cached is not None and cached[0] == tag:
+        _count("hits")
+        return cached[1], True
+    _count("misses")
+
+    lock_key = f"{key}:lock"
+    if not cache.add(lock_key, True, LOCK_TIMEOUT):
+        # Someone else is rendering this entry: wait for their result
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while time.monotonic() < deadline and cache.get(lock_key):
+            time.sleep(WAIT_INTERVAL)
+            cached = cache.get(key)
+            if cached is not None and cached[0] == tag:
+                _count("waits")
+                return cached[1], False
+        # The renderer gave up, failed or rendered another version; render it ourselves
+        return _render(cache, key, render, tag), False
+    try:
+        return _render(cache, key, render, tag), False
+    finally:
+        cache.delete(lock_key)
+
+
+def _render(cache, key, render, tag):
+    _count("renders")
+    value = render()
+    if value is not None:
+        cache.set(key, (tag, value))
+    return value
+
+
+async def aget_or_render(key: str, render, tag=None):
+    """Async get_or_render(): ``render`` is a coroutine function; waiting doesn't block the event loop."""
+    cache = _cache()
+    cached = await cache.aget(key)
+    if cached is not None and cached[0] == tag:
+        _count("hits")
+        return cached[1], True
+    _count("misses")
+
+    lock_key = f"{key}:lock"
+    if not await cache.aadd(lock_key, True, LOCK_TIMEOUT):
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while time.monotonic() < deadline and await cache.aget(lock_key):
+            await asyncio.sleep(WAIT_INTERVAL)
+            cached = await cache.aget(key)
+            if cached is not None and cached[0] == tag:
+                _count("waits")
+                return cached[1], False
+        return await _arender(cache, key, render, tag), False
+    try:
+        return await _arender(cache, key, render, tag), False
+    finally:
+        await cache.adelete(lock_key)
+
+
+async def _arender(cache, key, render, tag):
+    _count("renders")
+    value = await render()
+    if value is not None:
+        await cache.aset(key, (tag, value))
+    return value
+
+
+def invalidate(ranking_ids=(), yt_ids=()) -> None:
+    """
+    Drop the cached responses of ``ranking_ids`` (and the rankings/ list) and the
+    lookups of ``yt_ids`` once the current transaction commits, or right away
+    outside of one.
+    """
+    keys = [RANKINGS_KEY]
+    for ranking_id in ranking_ids:
+        lists = [ranking_key(ranking_id)] + [ranking_key(ranking_id, variant) for variant in RANKING_VARIANTS]
+        keys += lists + [encoded_key(key, encoding) for key in lists for encoding in ENCODINGS]
+        keys.append(count_key(ranking_id))
+    keys += [song_key(yt_id) for yt_id in yt_ids]
+    transaction.on_commit(lambda: _cache().delete_many(keys))
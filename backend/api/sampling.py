@@ -0,0 +1,48 @@
+# sampling.py
+"""
+Random samples of rank positions, for songs/sample/.
+
+``sample_ranks`` draws N distinct ranks out of 1..total in O(N) expected
+time, uniformly or weighted toward the top of the ranking; the ranks are then
+resolved to songs with api.ordering.songs_at_ranks.
+"""
+import math
+
+MAX_SAMPLE = 500
+# Weighted draws are retried on duplicates; past this many draws per rank the rest is drawn uniformly
+MAX_DRAWS_PER_RANK = 20
+
+
+def _linear(rng, total: int) -> int:
+    # Weight proportional to total - rank + 1: inverse CDF of the density 2(1 - x) on [0, 1)
+    return min(int((1 - math.sqrt(1 - rng.random())) * total), total - 1) + 1
+
+
+def _zipf(rng, total: int) -> int:
+    # Weight roughly proportional to 1 / rank: inverse CDF of the density 1/x on [1, total + 1)
+    return min(int(math.exp(rng.random() * math.log(total + 1))), total)
+
+
+WEIGHTS = {"linear": _linear, "zipf": _zipf}
+
+
+def sample_ranks(total: int, n: int, rng, weight: str | None = None) -> list[int]:
+    """
+    Return ``min(n, total)`` distinct ranks out of 1..total in ascending order.
+
+    ``rng`` is a random.Random; ``weight`` is None for a uniform sample or one
+    of WEIGHTS to favour higher ranks.
+    """
+    n = min(n, total)
+    if weight is None:
+        return sorted(rank + 1 for rank in rng.sample(range(total), n))
+
+    draw = WEIGHTS[weight]
+    ranks = set()
+    for _ in range(n * MAX_DRAWS_PER_RANK):
+        if len(ranks) == n:
+            break
+        ranks.add(draw(rng, total))
+    while len(ranks) < n:
+        ranks.add(rng.randrange(total) + 1)
+    return sorted(ranks)
@@ -0,0 +1,101 @@
+# search.py
+"""
+Full-text search over songs.
+
+Songs are indexed in the SQLite FTS5 table ``api_song_fts`` (artist, title,
+album and comment), which triggers on api_song keep in sync with every insert,
+update and delete; see migration 0007. ``rebuild`` regenerates it from
+api_song, e.g. after the table was written with the triggers missing, and is
+what ``manage.py rebuild_song_search`` runs.
+
+Every word of a query must match the start of a word in one of the columns,
+so ``beat lenn`` finds "The Beatles - Lennon...". Case and diacritics are
+ignored. Results are ordered by relevance (bm25), matches in the artist and
+title counting more than in the album or comment.
+"""
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import RankingEntry, Song
+
+FTS_TABLE = "api_song_fts"
+MAX_RESULTS = 100
+# bm25() column weights, in the order of the FTS table's columns
+WEIGHTS = {"s_artist": 10.0, "s_title": 10.0, "s_album": 3.0, "s_comment": 1.0}
+
+_WORD = re.compile(r"\w+")
+
+
+def is_available() -> bool:
+    """Whether the database has the search index; migration 0007 only creates it on SQLite."""
+    return connection.vendor == "sqlite"
+
+
+def match_expression(query: str) -> str | None:
+    """FTS5 MATCH expression of ``query``: a prefix query of each word, or None if it has no words."""
+    # Quoting the words keeps FTS5 operators (AND, NEAR, column filters, ...) in user input literal
+    words = _WORD.findall(query)
+    return " ".join(f'"{word}"*' for word in words) if words else None
+
+
+def match_query(query: str, ranking_id: int | None = None, limit: int | None = MAX_RESULTS) -> tuple[str, list] | None:
+    """The SQL and params of ``match_ids``, or None if ``query`` has no words."""
+    expression = match_expression(query)
+    if expression is None:
+        return None
+    weights = ", ".join(str(weight) for weight in WEIGHTS.values())
+    if ranking_id is None:
+        sql = f"SELECT rowid, NULL FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+        params = [expression]
+    else:
+        sql = (
+            f"SELECT {FTS_TABLE}.rowid, e.r_key FROM {FTS_TABLE} "
+            f"JOIN {RankingEntry._meta.db_table} e ON e.song_id = {FTS_TABLE}.rowid AND e.ranking_id = %s "
+            f"WHERE {FTS_TABLE} MATCH %s"
+        )
+        params = [ranking_id, expression]
+    sql += f" ORDER BY bm25({FTS_TABLE}, {weights})"
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    return sql, params
+
+
+def match_ids(query: str, ranking_id: int | None = None, limit: int | None = MAX_RESULTS) -> list[tuple[int, int | None]]:
+    """
+    ``(song id, r_key)`` of the songs matching ``query``, best match first.
+
+    With ``ranking_id`` only songs of that ranking are returned, with their key
+    in it; otherwise the keys are None. ``limit=None`` returns all matches.
+    """
+    match = match_query(query, ranking_id, limit)
+    if match is None:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(*match)
+        return cursor.fetchall()
+
+
+def filter_matching(queryset, query: str):
+    """Narrow a Song queryset to the songs matching ``query``, in the queryset's own order."""
+    expression = match_expression(query)
+    if expression is None:
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expression]))
+
+
+def search_songs(query: str, ranking_id: int | None = None, limit: int = MAX_RESULTS) -> list[Song]:
+    """Songs matching ``query`` in order of relevance (see match_ids)."""
+    matches = match_ids(query, ranking_id, limit)
+    songs = Song.objects.in_bulk([song_id for song_id, _ in matches])
+    return [songs[song_id] for song_id, _ in matches if song_id in songs]
+
+
+def rebuild() -> int:
+    """Regenerate the search index from api_song. Returns the number of songs indexed."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return Song.objects.count()
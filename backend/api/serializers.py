@@ -1,7 +1,9 @@
 # serializers.py
-from rest_framework import serializers
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from django.contrib.auth import authenticate
-from .models import Song, Ranking
+from django.db import models
+from .models import Song, Ranking, RankingSnapshot
 
 
 class SongSerializer(serializers.ModelSerializer):
@@ -19,10 +21,63 @@ class SongSerializer(serializers.ModelSerializer):
         return value
 
 
+class SongMetadataSerializer(serializers.ModelSerializer):
+    """The metadata of a song, without its YouTube ID; validates the items of songs/update/batch/."""
+
+    class Meta:
+        model = Song
+        fields = ["s_artist", "s_title", "s_album", "s_released", "s_discovered", "s_comment"]
+
+
+# Field order of SongSerializer output, for read paths that build it from values_list() rows
+SONG_FIELDS = SongSerializer.Meta.fields
+DATETIME_FIELDS = [field.name for field in Song._meta.fields if isinstance(field, models.DateTimeField)]
+
+
+def song_representer(fields: list[str] = SONG_FIELDS):
+    """
+    Return a function turning a row of values of ``fields`` (by default SONG_FIELDS,
+    in that order) into SongSerializer output, or the part of it with these fields.
+
+    Datetimes are formatted like serializers.DateTimeField does, but the output
+    format and current timezone are resolved once, so get one representer per
+    response rather than per row.
+    """
+    field = serializers.DateTimeField()
+    field_timezone = field.default_timezone()
+    if field_timezone is None or getattr(field, "format", api_settings.DATETIME_FORMAT) != ISO_8601:
+        to_representation = field.to_representation
+    else:
+        def to_representation(value):
+            if not value:
+                return None
+            value = value.astimezone(field_timezone).isoformat()
+            if value.endswith("+00:00"):
+                value = value[:-6] + "Z"
+            return value
+
+    datetime_fields = [name for name in DATETIME_FIELDS if name in fields]
+
+    def represent(row: tuple) -> dict:
+        data = dict(zip(fields, row))
+        for name in datetime_fields:
+            data[name] = to_representation(data[name])
+        return data
+
+    return represent
+
+
 class RankingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ranking
         fields = [field.name for field in Ranking._meta.fields]
+        read_only_fields = ["version", "updated_on", "changes_floor"]
+
+
+class RankingSnapshotSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RankingSnapshot
+        fields = ["id", "version", "reason", "size", "created_on"]
 
 
 class LoginSerializer(serializers.Serializer):
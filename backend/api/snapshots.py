@@ -0,0 +1,141 @@
+# snapshots.py
+"""
+Snapshots of the order of a ranking, to look at past versions or go back to one.
+
+A snapshot is one row holding the ranking's song ids in rank order, packed
+by ``pack``: each id is stored as its difference from the previous one
+(imported rankings mostly list songs created in the same order, so these
+are small and repetitive), as 64-bit integers compressed with zlib. A
+ranking of 100,000 songs takes a few hundred KB at most, usually far less.
+
+``take`` is called before every operation that replaces a ranking wholesale
+(imports and ``restore`` itself) and by ``manage.py snapshot_rankings``; it
+reuses the newest snapshot if that already has the ranking's version.
+Each ranking keeps its newest settings.RANKING_SNAPSHOTS["MAX_PER_RANKING"]
+snapshots.
+
+Snapshots refer to songs by id. gc_songs keeps the songs of kept snapshots
+(see api.orphans); the songs of pruned snapshots are queued for it again.
+Songs deleted anyway are left out of a restore and reported as missing.
+"""
+import zlib
+from array import array
+from itertools import accumulate
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import changes, orphans
+from .models import Ranking, RankingChange, RankingEntry, RankingSnapshot, Song
+from .ordering import key_for_rank
+
+BATCH_SIZE = 1000
+COMPRESSION_LEVEL = 6
+
+
+def pack(song_ids: list[int]) -> bytes:
+    """Encode song ids (in rank order) for RankingSnapshot.song_ids."""
+    deltas = array("q", (b - a for a, b in zip([0] + song_ids, song_ids)))
+    return zlib.compress(deltas.tobytes(), COMPRESSION_LEVEL)
+
+
+def unpack(data: bytes) -> list[int]:
+    deltas = array("q")
+    deltas.frombytes(zlib.decompress(data))
+    return list(accumulate(deltas))
+
+
+def song_ids_of(ranking: Ranking) -> list[int]:
+    return list(RankingEntry.objects.filter(ranking=ranking).order_by("r_key").values_list("song_id", flat=True))
+
+
+def take(ranking: Ranking, reason: str) -> RankingSnapshot:
+    """
+    Snapshot the current order of ``ranking``. If its newest snapshot already has
+    the ranking's version, returns that one instead of taking another.
+
+    Call inside the transaction of the change it guards, before making it.
+    """
+    version = Ranking.objects.values_list("version", flat=True).get(pk=ranking.pk)
+    latest = RankingSnapshot.objects.filter(ranking=ranking).order_by("-created_on", "-id").defer("song_ids").first()
+    if latest is not None and latest.version == version:
+        return latest
+    song_ids = song_ids_of(ranking)
+    snapshot = RankingSnapshot.objects.create(
+        ranking=ranking, version=version, reason=reason, size=len(song_ids), song_ids=pack(song_ids)
+    )
+    prune(ranking)
+    return snapshot
+
+
+def prune(ranking: Ranking, keep: int | None = None) -> int:
+    """Delete all but the newest ``keep`` snapshots of ``ranking``. Returns the number deleted."""
+    keep = settings.RANKING_SNAPSHOTS["MAX_PER_RANKING"] if keep is None else keep
+    snapshots = RankingSnapshot.objects.filter(ranking=ranking)
+    old_ids = list(snapshots.order_by("-created_on", "-id").values_list("id", flat=True)[keep:])
+    if not old_ids:
+        return 0
+    old = snapshots.filter(pk__in=old_ids)
+    # gc_songs skipped these songs while the snapshots referred to them
+    for data in old.values_list("song_ids", flat=True):
+        orphans.enqueue(unpack(data))
+    deleted, _ = old.delete()
+    return deleted
+
+
+def referenced_song_ids() -> set[int]:
+    """Ids of the songs of every snapshot."""
+    referenced = set()
+    for data in RankingSnapshot.objects.values_list("song_ids", flat=True).iterator():
+        referenced.update(unpack(data))
+    return referenced
+
+
+def _existing(song_ids: list[int], fields=("id",)):
+    # Rows of the songs still in the database, queried in batches to stay under the backend's parameter limit
+    for start in range(0, len(song_ids), BATCH_SIZE):
+        yield from Song.objects.filter(pk__in=song_ids[start:start + BATCH_SIZE]).values_list(*fields)
+
+
+def songs(snapshot: RankingSnapshot, fields: list[str]) -> tuple[list[tuple], list[int]]:
+    """
+    Rows of ``fields`` of the snapshot's songs, in its order, followed by each
+    song's rank in the snapshot; and the ids of the songs deleted since.
+    """
+    song_ids = unpack(snapshot.song_ids)
+    id_index = fields.index("id")
+    rows = {row[id_index]: row for row in _existing(song_ids, fields)}
+    listed = [rows[song_id] + (rank,) for rank, song_id in enumerate(song_ids, start=1) if song_id in rows]
+    return listed, [song_id for song_id in song_ids if song_id not in rows]
+
+
+def restore(ranking: Ranking, snapshot: RankingSnapshot) -> dict:
+    """
+    Replace the entries of ``ranking`` with the order saved in ``snapshot``, in one transaction.
+
+    The current order is snapshotted first, so a restore can itself be undone.
+    Returns the number of ``restored`` entries, the ids of ``missing`` songs
+    (deleted since the snapshot) and the id of the ``backup`` snapshot.
+    """
+    song_ids = unpack(snapshot.song_ids)
+    now = timezone.now()
+    with transaction.atomic():
+        backup = take(ranking, RankingSnapshot.RESTORE)
+        orphans.enqueue_ranking(ranking.pk)
+        RankingEntry.objects.filter(ranking=ranking).delete()
+        # One prepared INSERT ... SELECT run for every song: rows skip model instances, and songs
+        # deleted since match nothing. Their keys stay free; dense ranks close the gaps on read.
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {RankingEntry._meta.db_table} (ranking_id, song_id, r_key, r_last_updated) "
+                f"SELECT %s, id, %s, %s FROM {Song._meta.db_table} WHERE id = %s",
+                [(ranking.pk, key_for_rank(rank), now, song_id) for rank, song_id in enumerate(song_ids, start=1)],
+            )
+        restored = set(RankingEntry.objects.filter(ranking=ranking).values_list("song_id", flat=True))
+        changes.record(Ranking.objects.filter(pk=ranking.pk), RankingChange.RESET)
+    return {
+        "restored": len(restored),
+        "missing": [song_id for song_id in song_ids if song_id not in restored],
+        "backup": backup.pk,
+    }
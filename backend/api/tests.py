@@ -1,3 +1,472 @@
+import csv
+import datetime
+import gzip
+import io
+import os
+import tempfile
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from . import authentication, changes, columnar, compression, hot_queries, orphans, perf, renderers, resolver, response_cache, snapshots
+from .benchmarks import seed_ranking
+from .importer import REQUIRED_COLUMNS, stream_import
+from .models import Ranking, RankingChange, RankingSnapshot, Song
+from .renderers import ColumnarJSONRenderer
+from .serializers import DATETIME_FIELDS, song_representer
+
+
+class ResetCachesTestCase(TestCase):
+    """A TestCase starting each test with empty process-local and response caches."""
+
+    def setUp(self):
+        super().setUp()
+        authentication.clear()
+        resolver.clear()
+        caches[response_cache.CACHE_ALIAS].clear()
+
+
+class QueryCountAssertions:
+    """
+    Pin endpoints to a number of queries. Unlike assertNumQueries these also
+    count the queries of requests made with the test client.
+    """
+
+    def assertQueryCount(self, expected: int, func, *args, **kwargs):
+        """Call ``func`` and check it ran exactly ``expected`` queries. Returns its result."""
+        with perf.count_queries() as queries:
+            result = func(*args, **kwargs)
+        self.assertEqual(
+            queries.count, expected,
+            f"{queries.count} queries instead of {expected}:\n" + "\n".join(queries.statements),
+        )
+        return result
+
+    def assertQueryCountIndependentOfSize(self, expected: int, prepare, status: int = 200, sizes=(10, 200)):
+        """
+        Check that the request ``prepare(ranking)`` returns runs ``expected`` queries
+        and answers ``status`` on rankings of each of ``sizes``, i.e. that its query
+        count doesn't grow with the data (no N+1). Queries of ``prepare`` itself
+        aren't counted.
+        """
+        for size in sizes:
+            with self.subTest(size=size):
+                ranking = seed_ranking(f"size-{size}", size, offset=size * 1000)
+                response = self.assertQueryCount(expected, prepare(ranking))
+                self.assertEqual(response.status_code, status, response.content)
+
+
+class EndpointQueriesTest(QueryCountAssertions, ResetCachesTestCase):
+    # Inside a TestCase transactions are savepoints: each atomic() block adds two queries
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("editor", is_staff=True)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def first_song(self, ranking: Ranking) -> Song:
+        return ranking.entries.order_by("r_key").first().song
+
+    def test_update_rank(self):
+        def move(ranking):
+            song = self.first_song(ranking)
+            return lambda: self.client.patch(
+                f"/api/update/rank/?list={ranking.slug}", {"songId": song.pk, "newRank": 5}, format="json"
+            )
+
+        self.assertQueryCountIndependentOfSize(11, move)
+
+    def test_writes_follow_a_reused_slug(self):
+        old = seed_ranking("reused", 5)
+        resolver.resolve("reused")
+        # Renamed by another process, which can't drop this process's cached slug
+        Ranking.objects.filter(pk=old.pk).update(slug="renamed")
+        new = seed_ranking("reused", 5, offset=1000)
+        song = self.first_song(new)
+        response = self.client.patch("/api/update/rank/?list=reused", {"songId": song.pk, "newRank": 3}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(list(new.entries.order_by("r_key").values_list("song_id", flat=True))[2], song.pk)
+
+    def test_update_rank_batch(self):
+        def move(ranking):
+            songs = list(ranking.entries.order_by("r_key").values_list("song_id", flat=True)[:3])
+            moves = [{"songId": song_id, "newRank": rank} for song_id, rank in zip(songs, (9, 7, 8))]
+            return lambda: self.client.patch(f"/api/update/rank/batch/?list={ranking.slug}", {"moves": moves}, format="json")
+
+        self.assertQueryCountIndependentOfSize(8, move)
+
+    def test_add_new_song(self):
+        def add(ranking):
+            song = {"s_yt_id": f"new{ranking.pk:08d}", "s_title": "New"}
+            return lambda: self.client.post(f"/api/songs/add/?list={ranking.slug}", song, format="json")
+
+        self.assertQueryCountIndependentOfSize(12, add, status=201)
+
+    def test_add_existing_song(self):
+        other = seed_ranking("other", 5, offset=10**6)
+
+        def add(ranking):
+            song = {"s_yt_id": self.first_song(other).s_yt_id, "s_title": "Existing"}
+            return lambda: self.client.post(f"/api/songs/add/?list={ranking.slug}", song, format="json")
+
+        self.assertQueryCountIndependentOfSize(10, add, status=201)
+
+    def test_update_song_batch(self):
+        def update(ranking):
+            songs = [{"id": song_id, "s_artist": "Fixed"} for song_id in ranking.entries.values_list("song_id", flat=True)]
+            return lambda: self.client.patch("/api/songs/update/batch/", {"songs": songs}, format="json")
+
+        # Up to 199 changes per INSERT into the change log (SQLite parameter limit)
+        self.assertQueryCountIndependentOfSize(10, update, sizes=(10, 150))
+
+    def test_delete_song(self):
+        def delete(ranking):
+            song = self.first_song(ranking)
+            return lambda: self.client.delete(f"/api/songs/delete/{song.pk}/?list={ranking.slug}")
+
+        self.assertQueryCountIndependentOfSize(10, delete, status=204)
+
+    def test_delete_ranking(self):
+        def delete(ranking):
+            return lambda: self.client.delete(f"/api/rankings/{ranking.pk}/")
+
+        # One of them looks for snapshots whose songs need queueing for gc_songs
+        self.assertQueryCountIndependentOfSize(9, delete, status=204)
+
+    def test_song_list(self):
+        def songs(ranking):
+            return lambda: self.client.get(f"/api/songs/?list={ranking.slug}")
+
+        self.assertQueryCountIndependentOfSize(2, songs)
+
+    def test_song_page_after_key_needs_after_rank(self):
+        ranking = seed_ranking("paged", 10)
+        first = self.client.get(f"/api/songs/?list={ranking.slug}&limit=4").json()
+        self.assertEqual(self.client.get(first["next"]).json()["results"][0]["r_rank"], 5)
+        after_key = ranking.entries.order_by("r_key").values_list("r_key", flat=True)[3]
+        response = self.client.get(f"/api/songs/?list={ranking.slug}&after_key={after_key}&limit=4")
+        self.assertEqual(response.status_code, 400)
+
+    def test_song_list_columnar(self):
+        def songs(ranking):
+            return lambda: self.client.get(f"/api/songs/?list={ranking.slug}&format=columnar&fields=s_yt_id,s_artist,r_rank")
+
+        self.assertQueryCountIndependentOfSize(2, songs)
+
+    def test_song_sample(self):
+        # The count, then one query for all the sampled songs, see api.ordering.songs_at_ranks
+        def sample(ranking):
+            return lambda: self.client.get(f"/api/songs/sample/?list={ranking.slug}&n=5&seed=1")
+
+        self.assertQueryCountIndependentOfSize(3, sample)
+
+    def test_song_sample_after_entries_are_deleted(self):
+        ranking = seed_ranking("sampled", 10)
+        path = f"/api/songs/sample/?list={ranking.slug}&n=10&seed=1"
+        self.client.get(path)
+        # Deleted behind the cached count's back: ranks past the end have no entry
+        ranking.entries.filter(pk__in=ranking.entries.order_by("-r_key").values("pk")[:3]).delete()
+        results = self.client.get(path).json()["results"]
+        expected = dict(ranking.entries.order_by("r_key").values_list("song__s_yt_id", "r_key"))
+        self.assertEqual([song["r_rank"] for song in results], list(range(1, 8)))
+        self.assertEqual([song["s_yt_id"] for song in results], list(expected))
+
+    def test_ranking_compare(self):
+        def compare(ranking):
+            return lambda: self.client.get(f"/api/rankings/compare/?from=main&to={ranking.slug}")
+
+        self.assertQueryCountIndependentOfSize(3, compare)
+
+    def test_ranking_aggregate(self):
+        def aggregate(ranking):
+            return lambda: self.client.get(f"/api/rankings/aggregate/?lists=main,{ranking.slug}&method=borda")
+
+        self.assertQueryCountIndependentOfSize(2, aggregate)
+
+    def test_ranking_aggregate_of_a_repeated_or_reordered_set(self):
+        seed_ranking("first", 5)
+        seed_ranking("second", 5)
+        aggregate = "/api/rankings/aggregate/?method=mean&lists="
+        self.assertEqual(len(self.client.get(aggregate + "first,first").json()["results"]), 5)
+        body = self.client.get(aggregate + "first,second").content
+        response = self.client.get(aggregate + "second,first")
+        self.assertEqual((response["X-Cache"], response.content), ("hit", body))
+
+    def test_song_rankings(self):
+        def rankings(ranking):
+            song = self.first_song(ranking)
+            return lambda: self.client.get(f"/api/songs/{song.pk}/rankings/")
+
+        self.assertQueryCountIndependentOfSize(2, rankings)
+
+
+class MetadataUpdateTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("editor", is_staff=True))
+        self.ranking = seed_ranking("meta", 5)
+        self.songs = list(Song.objects.filter(memberships__ranking=self.ranking).order_by("memberships__r_key"))
+
+    def test_batch_reports_unchanged_updated_and_rejected(self):
+        songs = [
+            {"id": self.songs[0].pk, "s_artist": "Fixed"},
+            {"id": self.songs[1].pk, "s_title": self.songs[1].s_title},
+            {"id": self.songs[2].pk, "s_released": "soon"},
+            {"id": self.songs[3].pk, "s_yt_id": "xxxxxxxxxxx"},
+            {"id": 10**9, "s_artist": "Nobody"},
+        ]
+        version = self.ranking.version
+        response = self.client.patch("/api/songs/update/batch/", {"songs": songs}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([response.json()[name] for name in ("unchanged", "updated", "rejected")], [1, 1, 3])
+        self.assertEqual(Song.objects.get(pk=self.songs[0].pk).s_artist, "Fixed")
+        self.ranking.refresh_from_db()
+        self.assertEqual(self.ranking.version, version + 1)
+        self.assertEqual(changes.changes_since(self.ranking, version)["updated"][0]["s_artist"], "Fixed")
+
+    def test_batch_rejects_repeated_songs(self):
+        song = self.songs[0]
+        songs = [{"id": song.pk, "s_released": "soon"}, {"id": song.pk, "s_artist": "Second"}]
+        response = self.client.patch("/api/songs/update/batch/", {"songs": songs}, format="json")
+        self.assertEqual([response.json()[name] for name in ("updated", "rejected")], [0, 2])
+        self.assertEqual(Song.objects.get(pk=song.pk).s_artist, song.s_artist)
+
+    def test_import_upsert(self):
+        path = os.path.join(tempfile.mkdtemp(), "songs.csv")
+        with open(path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(REQUIRED_COLUMNS)
+            for rank, song in enumerate(self.songs, start=1):
+                artist = "Fixed" if rank == 1 else song.s_artist
+                writer.writerow([song.s_yt_id, artist, song.s_title, song.s_album, song.s_released, song.s_discovered, song.s_comment, rank])
+            writer.writerow(["newsong0001", "", "New", "", "", "", "", 6])
+
+        out = io.StringIO()
+        call_command("import_songs", path, ranking="copy", upsert=True, stdout=out)
+        self.assertIn("Existing songs: 4 unchanged, 1 updated, 0 rejected", out.getvalue())
+        self.assertEqual(Song.objects.get(pk=self.songs[0].pk).s_artist, "Fixed")
+        self.assertEqual(Ranking.objects.get(slug="copy").entries.count(), 6)
+
+
+class ColumnarSongListTest(ResetCachesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        seed_ranking("col", 12)
+
+    def songs(self, query="") -> list[dict]:
+        return self.client.get(f"/api/songs/?list=col{query}").json()
+
+    def decode(self, data: dict) -> list[dict]:
+        # Back to the plain list's values: strings from the dictionary, datetimes in SongSerializer's format
+        represent = song_representer(data["fields"])
+        songs = []
+        for values in zip(*data["columns"]):
+            row = []
+            for name, value in zip(data["fields"], values):
+                if name in columnar.DICTIONARY_FIELDS and value is not None:
+                    value = data["strings"][value]
+                elif name in DATETIME_FIELDS and value is not None:
+                    value = datetime.datetime.fromtimestamp(value / 1_000_000, datetime.timezone.utc)
+                row.append(value)
+            songs.append(represent(tuple(row)))
+        return songs
+
+    def test_columnar_json_holds_the_plain_list(self):
+        response = self.client.get("/api/songs/?list=col", HTTP_ACCEPT=ColumnarJSONRenderer.media_type)
+        self.assertEqual(response["Content-Type"], ColumnarJSONRenderer.media_type)
+        self.assertEqual(self.decode(response.json()), self.songs())
+
+    @skipUnless(renderers.msgpack, "msgpack is not installed")
+    def test_columnar_msgpack(self):
+        response = self.client.get("/api/songs/?list=col&format=msgpack")
+        self.assertEqual(self.decode(renderers.msgpack.unpackb(response.content)), self.songs())
+
+    def test_fields(self):
+        fields = "r_rank,s_title"
+        self.assertEqual(self.songs(f"&fields={fields}"), [{"s_title": song["s_title"], "r_rank": song["r_rank"]} for song in self.songs()])
+        page = self.songs(f"&fields={fields}&format=columnar&after_rank=10&limit=5")
+        self.assertEqual((page["fields"], page["columns"][1]), (["s_title", "r_rank"], [11, 12]))
+        self.assertEqual(self.client.get("/api/songs/?list=col&fields=s_title,nope").status_code, 400)
+
+    def test_representations_have_their_own_etags(self):
+        queries = ("", "&format=columnar", "&fields=s_title", "&fields=s_yt_id,s_title,r_rank")
+        etags = {query: self.client.get(f"/api/songs/?list=col{query}")["ETag"] for query in queries}
+        self.assertEqual(len(set(etags.values())), 4)
+        for query, etag in etags.items():
+            response = self.client.get(f"/api/songs/?list=col{query}", HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, query)
+
+
+class CompressionTest(ResetCachesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ranking = seed_ranking("zip", 50)
+
+    def get(self, path, accept_encoding):
+        return self.client.get(path, HTTP_ACCEPT_ENCODING=accept_encoding)
+
+    def test_negotiate(self):
+        self.assertEqual(compression.negotiate("gzip, deflate"), "gzip")
+        self.assertEqual(compression.negotiate("gzip;q=0, identity"), None)
+        self.assertEqual(compression.negotiate(""), None)
+        self.assertEqual(compression.negotiate("*;q=0.5, gzip;q=1"), "gzip")
+
+    def test_songs_are_served_precompressed(self):
+        plain = self.get("/api/songs/?list=zip", "").content
+        response = self.get("/api/songs/?list=zip", "gzip")
+        self.assertEqual((response["Content-Encoding"], response["X-Cache"]), ("gzip", "miss"))
+        self.assertEqual(response["ETag"], f"W/{self.ranking.etag}")
+        self.assertEqual(gzip.decompress(response.content), plain)
+        self.assertEqual(self.get("/api/songs/?list=zip", "gzip")["X-Cache"], "hit")
+
+        # The compressed copy is dropped with the plain body
+        with self.captureOnCommitCallbacks(execute=True):
+            changes.record(Ranking.objects.filter(pk=self.ranking.pk), RankingChange.RESET)
+        self.assertEqual(self.get("/api/songs/?list=zip", "gzip")["X-Cache"], "miss")
+
+    @skipUnless(compression.brotli, "brotli is not installed")
+    def test_brotli_is_preferred(self):
+        plain = self.get("/api/songs/?list=zip", "").content
+        response = self.get("/api/songs/?list=zip", "gzip, deflate, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(compression.brotli.decompress(response.content), plain)
+
+    def test_streaming_responses_are_compressed_on_the_fly(self):
+        for encoding in compression.ENCODINGS:
+            with self.subTest(encoding=encoding):
+                response = self.get("/api/export/?list=zip", encoding)
+                self.assertEqual(response["Content-Encoding"], encoding)
+                body = b"".join(response.streaming_content)
+                plain = gzip.decompress(body) if encoding == "gzip" else compression.brotli.decompress(body)
+                self.assertEqual(len(plain.splitlines()), 51)
+
+
+class PerfCompareTest(TestCase):
+    report = {"results": {"GET songs/": {"1000": {"p50_ms": 10.0, "queries": 2}}}}
+
+    def with_result(self, p50_ms, queries=2):
+        return {"results": {"GET songs/": {"1000": {"p50_ms": p50_ms, "queries": queries}}}}
+
+    def test_within_thresholds(self):
+        self.assertEqual(perf.compare(self.with_result(12.0), self.report), [])
+
+    def test_slower_than_baseline(self):
+        self.assertEqual(len(perf.compare(self.with_result(13.0), self.report)), 1)
+
+    def test_small_absolute_growth_is_noise(self):
+        fast = {"results": {"GET songs/": {"1000": {"p50_ms": 1.0, "queries": 2}}}}
+        self.assertEqual(perf.compare(self.with_result(2.5), fast), [])
+
+    def test_more_queries(self):
+        self.assertEqual(len(perf.compare(self.with_result(10.0, queries=3), self.report)), 1)
+
+    def test_budget(self):
+        failures = perf.compare(self.with_result(10.0), None, {"BUDGETS_MS": {"GET songs/": 5}})
+        self.assertEqual(len(failures), 1)
+
+
+class SnapshotTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("editor", is_staff=True))
+        self.ranking = seed_ranking("snap", 20)
+
+    def order(self) -> list[int]:
+        return snapshots.song_ids_of(self.ranking)
+
+    def test_pack_round_trip(self):
+        song_ids = [5, 3, 100, 7, 2**40]
+        self.assertEqual(snapshots.unpack(snapshots.pack(song_ids)), song_ids)
+
+    def test_restore_after_import(self):
+        before = self.order()
+        snapshot = snapshots.take(self.ranking, RankingSnapshot.MANUAL)
+        stream_import(self.ranking, [b"yt_id,Artist,Title,Album,released,discovered,comment,rank\nimported001,,T,,,,,1\n"], print)
+        self.assertEqual(self.ranking.snapshots.count(), 1, "the import reuses the snapshot of the same version")
+        orphans.collect()
+        self.assertEqual(Song.objects.filter(pk__in=before).count(), len(before), "songs of snapshots are kept")
+
+        response = self.client.post(f"/api/rankings/snap/snapshots/{snapshot.pk}/restore/")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()["restored"], len(before))
+        self.assertEqual(self.order(), before)
+        # The imported order was snapshotted before the restore
+        backup = RankingSnapshot.objects.get(pk=response.json()["backup"])
+        self.assertEqual(snapshots.unpack(backup.song_ids), list(Song.objects.filter(s_yt_id="imported001").values_list("pk", flat=True)))
+
+    def test_songs_of_deleted_snapshots_are_collected(self):
+        before = self.order()
+        snapshots.take(self.ranking, RankingSnapshot.MANUAL)
+        stream_import(self.ranking, [b"yt_id,Artist,Title,Album,released,discovered,comment,rank\nimported001,,T,,,,,1\n"], print)
+        orphans.collect()
+        self.assertEqual(Song.objects.filter(pk__in=before).count(), len(before))
+
+        self.assertEqual(self.client.delete(f"/api/rankings/{self.ranking.pk}/").status_code, 204)
+        orphans.collect()
+        self.assertFalse(Song.objects.exists())
+
+    def test_failed_import_keeps_songs_of_snapshots(self):
+        snapshot = snapshots.take(self.ranking, RankingSnapshot.MANUAL)
+        entry = self.ranking.entries.order_by("r_key").first()
+        entry.delete()
+        csv_data = f"yt_id,Artist,Title,Album,released,discovered,comment,rank\n{entry.song.s_yt_id},,T,,,,,1\nimported001,,T,,,,,x\n"
+        # The first batch is staged (and committed) before the second one fails validation
+        with self.assertRaises(ValueError):
+            stream_import(self.ranking, [csv_data.encode()], print, batch_size=1)
+        orphans.collect()
+        self.assertTrue(Song.objects.filter(pk=entry.song_id).exists())
+        self.assertEqual(snapshots.restore(self.ranking, snapshot)["missing"], [])
+
+    def test_take_is_skipped_when_unchanged(self):
+        first = snapshots.take(self.ranking, RankingSnapshot.MANUAL)
+        self.assertEqual(snapshots.take(self.ranking, RankingSnapshot.MANUAL), first)
+
+
+class StatelessAuthenticationTest(QueryCountAssertions, ResetCachesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("editor", password="secret", is_staff=True)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {authentication.tokens_for(self.user).access_token}")
+
+    def stats(self):
+        return self.client.get("/api/cache/stats/")
+
+    def test_no_queries_once_user_is_cached(self):
+        self.assertEqual(self.assertQueryCount(1, self.stats).status_code, 200)
+        self.assertEqual(self.assertQueryCount(0, self.stats).status_code, 200)
+
+    def test_deactivated_user_is_refused(self):
+        self.stats()
+        # The cached state is dropped when the change commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.stats().status_code, 401)
+
+    def test_password_change_revokes_tokens(self):
+        self.user.set_password("changed")
+        self.user.save()
+        self.assertEqual(self.stats().status_code, 401)
+
+
+class HotQueriesTest(TestCase):
+    def test_hot_queries_use_indexes(self):
+        seed_ranking("a", 10)
+        seed_ranking("b", 10)
+        for result in hot_queries.audit():
+            with self.subTest(query=result["name"]):
+                self.assertEqual(result["problems"], [], "\n".join(result["plan"]))
 
-# Create your tests here.
+    def test_table_scans_are_flagged(self):
+        sql = 'SELECT * FROM "api_rankingentry" e WHERE e.r_last_updated > %s'
+        self.assertEqual(hot_queries.problems(hot_queries.explain(sql, ["2000-01-01"]), sql), {hot_queries.FULL_SCAN})
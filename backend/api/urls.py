@@ -1,25 +1,44 @@
 # urls.py
 from django.urls import path
 from .views import SongList
-from .views import update_rank
+from .views import update_rank, update_rank_batch
 from .views import UploadCSV
 from .views import AddSong
-from .views import update_song
+from .views import update_song, update_song_batch
 from .views import delete_song
 from .views import LoginAPIView
-from .views import song_lookup, RankingList, RankingDetail
+from .views import song_lookup, song_sample, song_search, RankingList, RankingDetail, ranking_changes
+from .views import export_ranking
+from .views import ranking_compare, ranking_aggregate, song_rankings
+from .views import ranking_snapshots, ranking_snapshot, restore_snapshot
+from .views import response_cache_stats, api_stats
 from rest_framework_simplejwt.views import TokenRefreshView
+from .authentication import RevocationCheckingTokenRefreshSerializer
 
 urlpatterns = [
     path("songs/", SongList.as_view()),  # accepts ?list=<slug>
     path("songs/lookup/", song_lookup),
+    path("songs/sample/", song_sample),  # accepts ?list=<slug>&n=<int>&seed=<any>&weight=linear|zipf
+    path("songs/search/", song_search),  # accepts ?q=<words>&list=<slug>&limit=<int>
+    path("songs/<int:pk>/rankings/", song_rankings),
     path("update/rank/", update_rank),  # accepts ?list=<slug>
+    path("update/rank/batch/", update_rank_batch),  # accepts ?list=<slug>
     path("upload-csv/", UploadCSV.as_view()),
+    path("export/", export_ranking),  # accepts ?list=<slug>&type=csv|ndjson
     path("songs/add/", AddSong.as_view()),
     path("songs/update/<int:pk>", update_song, name="update_song"),
+    path("songs/update/batch/", update_song_batch),
     path("songs/delete/<int:pk>/", delete_song, name="delete_song"),  # accepts ?list=<slug>
     path("rankings/", RankingList.as_view()),
     path("rankings/<int:pk>/", RankingDetail.as_view()),
+    path("rankings/compare/", ranking_compare),  # accepts ?from=<slug>&to=<slug>
+    path("rankings/aggregate/", ranking_aggregate),  # accepts ?lists=<slug>,<slug>&method=mean|borda&limit=<int>&min_lists=<int>
+    path("rankings/<slug:slug>/changes/", ranking_changes),  # accepts ?since=<version>
+    path("rankings/<slug:slug>/snapshots/", ranking_snapshots),
+    path("rankings/<slug:slug>/snapshots/<int:pk>/", ranking_snapshot),
+    path("rankings/<slug:slug>/snapshots/<int:pk>/restore/", restore_snapshot),
+    path("cache/stats/", response_cache_stats),
+    path("_stats/", api_stats),  # only with settings.INSTRUMENTATION["ENABLED"]
     path("login/", LoginAPIView.as_view(), name="api_login"),
-    path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("token/refresh/", TokenRefreshView.as_view(serializer_class=RevocationCheckingTokenRefreshSerializer), name="token_refresh"),
 ]
@@ -1,41 +1,217 @@
 # views.py
+from django.conf import settings
 from django.core.management import call_command
 from django.db import IntegrityError, transaction
-from django.db.models import F, Max
-from django.http import JsonResponse
+from django.db.models import Count, F, Max, Sum
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+import csv
+import io
 import json
 import os
+import random
+import secrets
 
 from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import Song, Ranking, RankingEntry
-from .serializers import LoginSerializer, SongSerializer, RankingSerializer
+from . import changes, columnar, comparison, compression, instrumentation, metadata, orphans, resolver, response_cache, search, snapshots
+from .authentication import tokens_for
+from .importer import REQUIRED_COLUMNS, stream_import
+from .models import Song, Ranking, RankingChange, RankingEntry, RankingSnapshot
+from .ordering import apply_order, dense_rank, move_entry, next_key, rank_of, ranks_of_keys, songs_at_ranks
+from .pagination import RankKeysetPagination
+from .renderers import COLUMNAR_RENDERERS, ColumnarRenderer, render_json
+from .sampling import MAX_SAMPLE, WEIGHTS, sample_ranks
+from .serializers import (
+    LoginSerializer, SongSerializer, SongMetadataSerializer, RankingSerializer, RankingSnapshotSerializer, SONG_FIELDS,
+    song_representer,
+)
+
+EXPORT_CHUNK_SIZE = 2000
+# Errors listed in responses reporting rejected rows
+MAX_REPORTED_ERRORS = 100
+# Song fields written for each of the CSV columns in REQUIRED_COLUMNS
+EXPORT_CSV_FIELDS = ["s_yt_id", "s_artist", "s_title", "s_album", "s_released", "s_discovered", "s_comment", "r_rank"]
+# Aggregates of the rankings table the rankings/ ETag is built from
+RANKINGS_STATE = {"count": Count("id"), "versions": Sum("version"), "last": Max("updated_on")}
+
+
+def _selected_slug(request) -> str:
+    return request.GET.get("list") or request.GET.get("ranking") or "main"
+
+
+def _get_selected_ranking(request, current: bool = False) -> Ranking:
+    """
+    Resolve ranking from query params; default to 'main'. Raises NotFound for an unknown slug.
+
+    The ranking comes from the process-local cache in api.resolver; pass
+    ``current=True`` where its version or timestamps are needed, and on write
+    paths, so a write goes to the ranking the slug names now.
+    """
+    slug = _selected_slug(request)
+    try:
+        return resolver.current(slug) if current else resolver.resolve(slug)
+    except Ranking.DoesNotExist:
+        raise NotFound(f"Ranking '{slug}' does not exist.")
 
 
-def _get_selected_ranking(request) -> Ranking:
-    """Resolve ranking from query params; default to 'main'."""
-    slug = request.GET.get("list") or request.GET.get("ranking") or "main"
+def _get_or_create_selected_ranking(request) -> Ranking:
+    """Like _get_selected_ranking, but creates the ranking if needed; for imports only."""
+    slug = _selected_slug(request)
     ranking, _ = Ranking.objects.get_or_create(slug=slug, defaults={"name": slug})
     return ranking
 
 
+def _conditional_get(request, etag: str, last_modified, respond):
+    """
+    Answer a GET with 304 Not Modified if the client's If-None-Match/If-Modified-Since
+    still match, without calling ``respond``; otherwise return ``respond()``.
+    Either way the response carries the ETag (and Last-Modified, if given).
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = respond()
+    return _with_validators(response, etag, timestamp)
+
+
+def _with_validators(response, etag: str, timestamp: int | None):
+    if response.status_code in (200, 304):
+        # A compressed body is a different representation: weak, as django's GZipMiddleware makes it
+        response.headers["ETag"] = f"W/{etag}" if response.has_header("Content-Encoding") else etag
+        if timestamp is not None:
+            response.headers["Last-Modified"] = http_date(timestamp)
+    return response
+
+
+def _rankings_etag(state: dict) -> str:
+    # ETag of the rankings/ list from its count, version sum and latest updated_on
+    last = int(state["last"].timestamp() * 1_000_000) if state["last"] else 0
+    return f'"{state["count"]}.{state["versions"] or 0}.{last}"'
+
+
+def _requested_fields(request) -> list[str]:
+    """
+    The song fields listed in ?fields= (comma-separated), in SONG_FIELDS order;
+    all of them if the parameter is missing. Raises ValidationError for unknown
+    fields, or if no field of the song itself is listed.
+    """
+    value = request.GET.get("fields")
+    if not value:
+        return SONG_FIELDS
+    requested = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = sorted(requested - set(SONG_FIELDS))
+    if unknown:
+        raise ValidationError({"fields": [f"Unknown fields: {', '.join(unknown)}."]})
+    if not requested - {"r_rank"}:
+        raise ValidationError({"fields": ["List at least one field of the song besides r_rank."]})
+    return [name for name in SONG_FIELDS if name in requested]
+
+
 class SongList(generics.ListAPIView):
+    """
+    The songs of the selected ranking in rank order.
+
+    Besides plain JSON, the list is available in the columnar formats of
+    api.columnar (as JSON or MessagePack, see COLUMNAR_RENDERERS), chosen with
+    the Accept header or ?format=columnar|msgpack, and ?fields= limits it to
+    the listed fields. Each representation has its own ETag.
+    """
+
     serializer_class = SongSerializer
+    pagination_class = RankKeysetPagination  # opt-in, see api.pagination
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, *COLUMNAR_RENDERERS]
+    fast_json = True  # serve plain JSON lists without SongSerializer, see list()
+    precompressed = True  # serve compressed copies kept in the cache, see cached()
+    song_fields = SONG_FIELDS
+
+    def get(self, request, *args, **kwargs):
+        self.ranking = _get_selected_ranking(request, current=True)
+        self.song_fields = _requested_fields(request)
+        variant = self.variant()
+        etag = self.ranking.etag if not variant else f'"{self.ranking.pk}.{self.ranking.version}.{variant}"'
+        response = _conditional_get(
+            request, etag, self.ranking.updated_on, lambda: super(SongList, self).get(request, *args, **kwargs)
+        )
+        patch_vary_headers(response, ["Accept"])
+        return response
+
+    def variant(self) -> str:
+        """Name of the representation requested, "" for the full plain JSON list."""
+        parts = []
+        if isinstance(self.request.accepted_renderer, ColumnarRenderer):
+            parts.append(self.request.accepted_renderer.format)
+        if self.song_fields != SONG_FIELDS:
+            # A bitmask of the fields over SONG_FIELDS: the variant goes into the ETag, which can't hold commas
+            mask = sum(1 << index for index, name in enumerate(SONG_FIELDS) if name in self.song_fields)
+            parts.append(f"f{mask:x}")
+        return ":".join(parts)
 
     def get_queryset(self):
-        ranking = _get_selected_ranking(self.request)
-        # Return songs that belong to the selected ranking, annotated with r_rank
-        return (
-            Song.objects.filter(memberships__ranking=ranking)
-            .annotate(r_rank=F("memberships__r_rank"))
-            .order_by("r_rank")
+        songs = Song.objects.filter(memberships__ranking=self.ranking).order_by("memberships__r_key")
+        if RankKeysetPagination.is_requested(self.request):
+            # Ranks of a page are assigned by the paginator, counting from its starting rank
+            return songs.annotate(r_key=F("memberships__r_key"))
+        # Return songs that belong to the selected ranking, annotated with their dense r_rank
+        return songs.annotate(r_rank=dense_rank("memberships__r_key"))
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        # Lists served through SongSerializer (pages, the browsable API) leave out the fields ?fields= doesn't list
+        for name in set(SONG_FIELDS) - set(self.song_fields):
+            serializer.child.fields.pop(name)
+        return serializer
+
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if isinstance(renderer, ColumnarRenderer):
+            return self.list_columnar(request, renderer)
+        # Read-optimized path for the plain JSON list: rows come from values_list() and are
+        # encoded directly, producing the same bytes as SongSerializer + JSONRenderer
+        if (
+            not self.fast_json
+            or RankKeysetPagination.is_requested(request)
+            or request.accepted_media_type != JSONRenderer.media_type
+        ):
+            return super().list(request, *args, **kwargs)
+
+        def render():
+            represent = song_representer(self.song_fields)
+            return render_json([represent(row) for row in _iter_ranking_rows(self.ranking, self.song_fields)])
+
+        return self.cached(render, JSONRenderer.media_type)
+
+    def list_columnar(self, request, renderer):
+        page = self.paginate_queryset(self.get_queryset())
+        if page is not None:
+            rows = [tuple(getattr(song, name) for name in self.song_fields) for song in page]
+            return Response({"next": self.paginator.get_next_link(), **columnar.build(self.song_fields, rows)})
+
+        def render():
+            return renderer.encode(columnar.build(self.song_fields, _iter_ranking_rows(self.ranking, self.song_fields)))
+
+        return self.cached(render, renderer.media_type)
+
+    def cached(self, render, content_type: str):
+        # The full lists are dropped from the cache by every change to the ranking;
+        # projections expire by their version tag alone (see api.response_cache).
+        # Compressed copies are cached along with them, see api.compression
+        encoding = compression.negotiate(self.request.headers.get("Accept-Encoding", "")) if self.precompressed else None
+        body, hit = compression.cached(
+            response_cache.ranking_key(self.ranking.pk, self.variant()), render, self.ranking.version, encoding
         )
+        response = HttpResponse(body, content_type=content_type)
+        response.headers["X-Cache"] = "hit" if hit else "miss"
+        return compression.encoded(response, encoding)
 
 
 @api_view(["GET"])
@@ -44,10 +220,179 @@ def song_lookup(request):
     yt_id = request.GET.get("yt_id")
     if not yt_id:
         return JsonResponse({"detail": "yt_id is required"}, status=400)
-    song = Song.objects.filter(s_yt_id=yt_id).first()
-    if not song:
+
+    def render():
+        # Misses aren't cached, so songs created later need no invalidation
+        song = Song.objects.filter(s_yt_id=yt_id).first()
+        return dict(SongSerializer(song).data) if song else None
+
+    data, hit = response_cache.get_or_render(response_cache.song_key(yt_id), render)
+    if data is None:
         return JsonResponse({"detail": "not found"}, status=404)
-    return JsonResponse(SongSerializer(song).data, safe=False)
+    response = JsonResponse(data, safe=False)
+    response.headers["X-Cache"] = "hit" if hit else "miss"
+    return response
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def response_cache_stats(request):
+    """Hit/miss counters of the response cache in this server process."""
+    return JsonResponse(response_cache.stats())
+
+
+@api_view(["GET", "DELETE"])
+@permission_classes([IsAdminUser])
+def api_stats(request):
+    """Per-endpoint query counts and timings of this server process (see api.instrumentation); DELETE resets them."""
+    if not settings.INSTRUMENTATION["ENABLED"]:
+        return JsonResponse({"status": "error", "message": "Instrumentation is disabled"}, status=404)
+    if request.method == "DELETE":
+        instrumentation.reset()
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+    return JsonResponse(instrumentation.snapshot())
+
+
+@api_view(["GET"])
+def song_sample(request):
+    """
+    Returns ``n`` random songs of the selected ranking in rank order: ``?n=50&seed=<any>&weight=linear|zipf``.
+
+    The same seed gives the same sample while the ranking doesn't change; without
+    one a seed is generated. ``weight`` favours higher ranks (linearly, or roughly
+    as 1/rank for zipf). Only the sampled entries are read, see api.sampling.
+    """
+    ranking = _get_selected_ranking(request, current=True)
+    try:
+        n = int(request.GET.get("n", 50))
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "n must be an integer"}, status=400)
+    if not 1 <= n <= MAX_SAMPLE:
+        return JsonResponse({"status": "error", "message": f"n must be between 1 and {MAX_SAMPLE}"}, status=400)
+    weight = request.GET.get("weight") or None
+    if weight is not None and weight not in WEIGHTS:
+        return JsonResponse(
+            {"status": "error", "message": f"weight must be one of: {', '.join(WEIGHTS)}"}, status=400
+        )
+    seed = request.GET.get("seed") or secrets.token_hex(4)
+
+    total, _ = response_cache.get_or_render(
+        response_cache.count_key(ranking.pk),
+        RankingEntry.objects.filter(ranking=ranking).count,
+        tag=ranking.version,
+    )
+    ranks = sample_ranks(total, n, random.Random(seed), weight)
+    represent = song_representer()
+    # Ranks past the end (entries deleted since the count was taken) are left out
+    songs = songs_at_ranks(ranking.pk, ranks)
+    results = [represent(tuple(getattr(song, name) for name in SONG_FIELDS)) for song in songs]
+    data = {"seed": seed, "version": ranking.version, "total": total, "results": results}
+    return HttpResponse(render_json(data), content_type="application/json")
+
+
+@api_view(["GET"])
+def song_search(request):
+    """
+    Full-text search of songs by artist, title, album and comment: ``?q=<words>&limit=<int>``.
+
+    Best matches first; every word matches as a prefix (see api.search). With
+    ``?list=<slug>`` only the songs of that ranking are searched and each
+    result carries its r_rank there.
+    """
+    query = request.GET.get("q", "").strip()
+    if not query:
+        return JsonResponse({"status": "error", "message": "Missing query parameter: q"}, status=400)
+    try:
+        limit = int(request.GET.get("limit", 20))
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "limit must be an integer"}, status=400)
+    if not 1 <= limit <= search.MAX_RESULTS:
+        return JsonResponse(
+            {"status": "error", "message": f"limit must be between 1 and {search.MAX_RESULTS}"}, status=400
+        )
+    ranking = _get_selected_ranking(request) if "list" in request.GET else None
+    if not search.is_available():
+        return JsonResponse({"status": "error", "message": "Search is not available on this database"}, status=501)
+
+    matches = search.match_ids(query, ranking.pk if ranking else None, limit)
+    songs = Song.objects.in_bulk([song_id for song_id, _ in matches])
+    ranks = ranks_of_keys(ranking.pk, {song_id: key for song_id, key in matches}) if ranking else {}
+    results = []
+    for song_id, _ in matches:
+        # Skip songs deleted since the match, as search.search_songs does
+        if song_id not in songs or (ranking and song_id not in ranks):
+            continue
+        song = songs[song_id]
+        if ranking:
+            song.r_rank = ranks[song_id]
+        results.append(song)
+    return HttpResponse(render_json(SongSerializer(results, many=True).data), content_type="application/json")
+
+
+def _ranking_rows(ranking: Ranking, named: bool = False, fields: list[str] = SONG_FIELDS):
+    """Value tuples of ``fields`` (by default SONG_FIELDS), without r_rank, of a ranking's songs in rank order."""
+    columns = [f"song__{name}" for name in fields if name != "r_rank"]
+    return RankingEntry.objects.filter(ranking=ranking).order_by("r_key").values_list(*columns, named=named)
+
+
+def _iter_ranking_rows(ranking: Ranking, fields: list[str] = SONG_FIELDS):
+    """Yield value tuples of ``fields`` (in SONG_FIELDS order) for a ranking in rank order, without loading it all at once."""
+    rows = _ranking_rows(ranking, fields=fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    if "r_rank" not in fields:
+        yield from rows
+        return
+    for rank, row in enumerate(rows, start=1):
+        yield row + (rank,)
+
+
+def _export_csv(rows):
+    # Same columns import_songs expects, so an export can be imported back as-is
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(REQUIRED_COLUMNS)
+    for i, row in enumerate(rows, start=1):
+        song = dict(zip(SONG_FIELDS, row))
+        writer.writerow(["" if song[field] is None else song[field] for field in EXPORT_CSV_FIELDS])
+        if i % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _export_ndjson(rows):
+    represent = song_representer()
+    lines = []
+    for row in rows:
+        lines.append(render_json(represent(row)))
+        if len(lines) == EXPORT_CHUNK_SIZE:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+@api_view(["GET"])
+def export_ranking(request):
+    """
+    Streams the selected ranking as CSV (default) or NDJSON (?type=ndjson).
+
+    The CSV uses the column layout import_songs accepts; NDJSON lines hold the
+    same objects as songs/. Rows are read with .iterator() and written in
+    chunks, so memory use does not grow with the size of the ranking.
+    """
+    ranking = _get_selected_ranking(request)
+    export_type = request.GET.get("type", "csv")
+    if export_type == "csv":
+        response = StreamingHttpResponse(_export_csv(_iter_ranking_rows(ranking)), content_type="text/csv; charset=utf-8")
+    elif export_type == "ndjson":
+        response = StreamingHttpResponse(
+            _export_ndjson(_iter_ranking_rows(ranking)), content_type="application/x-ndjson; charset=utf-8"
+        )
+    else:
+        return JsonResponse({"status": "error", "message": "type must be 'csv' or 'ndjson'"}, status=400)
+    response["Content-Disposition"] = f'attachment; filename="{ranking.slug}.{export_type}"'
+    return response
 
 
 class RankingList(generics.ListCreateAPIView):
@@ -55,17 +400,222 @@ class RankingList(generics.ListCreateAPIView):
     serializer_class = RankingSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    def list(self, request, *args, **kwargs):
+        # Creating, changing or deleting any ranking changes at least one of these.
+        # No Last-Modified here: deleting a ranking doesn't advance any timestamp.
+        etag = _rankings_etag(Ranking.objects.aggregate(**RANKINGS_STATE))
+        return _conditional_get(request, etag, None, lambda: self.render_list(request, etag, *args, **kwargs))
+
+    def render_list(self, request, etag, *args, **kwargs):
+        if request.accepted_media_type != JSONRenderer.media_type:
+            return super().list(request, *args, **kwargs)
+        body, hit = response_cache.get_or_render(
+            response_cache.RANKINGS_KEY,
+            lambda: render_json(self.get_serializer(self.get_queryset(), many=True).data),
+            tag=etag,
+        )
+        response = HttpResponse(body, content_type=JSONRenderer.media_type)
+        response.headers["X-Cache"] = "hit" if hit else "miss"
+        return response
+
+    def perform_create(self, serializer) -> None:
+        super().perform_create(serializer)
+        response_cache.invalidate()
+
 
 class RankingDetail(generics.RetrieveUpdateDestroyAPIView):
     queryset = Ranking.objects.all()
     serializer_class = RankingSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return _conditional_get(
+            request, instance.etag, instance.updated_on, lambda: Response(self.get_serializer(instance).data)
+        )
+
+    def perform_update(self, serializer) -> None:
+        with transaction.atomic():
+            old_slug = serializer.instance.slug
+            instance = serializer.save()
+            changes.record(Ranking.objects.filter(pk=instance.pk), RankingChange.RENAME)
+            resolver.forget(old_slug, instance.slug)
+
     def perform_destroy(self, instance: Ranking) -> None:
-        # Delete the ranking (cascades to RankingEntry), then cleanup orphan Songs
+        # Delete the ranking (cascades to RankingEntry); songs left without a ranking are collected by gc_songs
+        ranking_id = instance.pk
         with transaction.atomic():
+            resolver.forget(instance.slug)
+            orphans.enqueue_ranking(ranking_id)
+            # The snapshots go with the ranking: queue their songs too, which gc_songs skipped while they existed
+            snapshots.prune(instance, keep=0)
             super().perform_destroy(instance)
-            Song.objects.filter(memberships__isnull=True).delete()
+            response_cache.invalidate([ranking_id])
+
+
+@api_view(["GET"])
+def ranking_changes(request, slug):
+    """
+    Returns what changed in a ranking since the version a client holds (``?since=<version>``).
+
+    The response carries the current ``version`` to send as ``since`` next time,
+    or ``"resync": true`` when the client has to reload the whole ranking.
+    """
+    try:
+        ranking = Ranking.objects.get(slug=slug)
+    except Ranking.DoesNotExist:
+        return JsonResponse({"status": "error", "message": "Ranking not found"}, status=404)
+    try:
+        since = int(request.query_params["since"])
+    except KeyError:
+        return JsonResponse({"status": "error", "message": "Missing query parameter: since"}, status=400)
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "since must be an integer"}, status=400)
+    return HttpResponse(render_json(changes.changes_since(ranking, since)), content_type="application/json")
+
+
+def _snapshot_of(slug, pk) -> RankingSnapshot:
+    try:
+        return RankingSnapshot.objects.select_related("ranking").get(ranking__slug=slug, pk=pk)
+    except RankingSnapshot.DoesNotExist:
+        raise NotFound(f"Ranking '{slug}' has no snapshot {pk}.")
+
+
+@api_view(["GET", "POST"])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def ranking_snapshots(request, slug):
+    """
+    Snapshots of a ranking's order, newest first; POST takes one now.
+
+    Snapshots are also taken automatically before imports and restores, see api.snapshots.
+    """
+    try:
+        ranking = Ranking.objects.get(slug=slug)
+    except Ranking.DoesNotExist:
+        return JsonResponse({"status": "error", "message": "Ranking not found"}, status=404)
+    if request.method == "POST":
+        with transaction.atomic():
+            snapshot = snapshots.take(ranking, RankingSnapshot.MANUAL)
+        return Response(RankingSnapshotSerializer(snapshot).data, status=status.HTTP_201_CREATED)
+    queryset = ranking.snapshots.order_by("-created_on", "-id").defer("song_ids")
+    return Response(RankingSnapshotSerializer(queryset, many=True).data)
+
+
+@api_view(["GET"])
+def ranking_snapshot(request, slug, pk):
+    """
+    The ranking's order when the snapshot was taken: its details plus ``songs``
+    (as in songs/, r_rank being the rank then, with the songs' current details)
+    and the ids of ``missing`` songs, deleted since.
+    """
+    snapshot = _snapshot_of(slug, pk)
+    rows, missing = snapshots.songs(snapshot, [name for name in SONG_FIELDS if name != "r_rank"])
+    represent = song_representer()
+    data = {**RankingSnapshotSerializer(snapshot).data, "songs": [represent(row) for row in rows], "missing": missing}
+    return HttpResponse(render_json(data), content_type="application/json")
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def restore_snapshot(request, slug, pk):
+    """
+    Replace the ranking's songs with the order of a snapshot. The order it had
+    before is snapshotted too; its id is returned as ``backup``.
+    """
+    snapshot = _snapshot_of(slug, pk)
+    try:
+        result = snapshots.restore(snapshot.ranking, snapshot)
+    except Exception as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+    return JsonResponse({"status": "success", **result}, status=200)
+
+
+def _rankings_named(slugs: list[str]) -> list[Ranking]:
+    """Current rankings named ``slugs``, in that order. Raises NotFound for an unknown slug."""
+    rankings = {ranking.slug: ranking for ranking in Ranking.objects.filter(slug__in=slugs)}
+    missing = [slug for slug in slugs if slug not in rankings]
+    if missing:
+        raise NotFound(f"Ranking '{missing[0]}' does not exist.")
+    return [rankings[slug] for slug in slugs]
+
+
+@api_view(["GET"])
+def ranking_compare(request):
+    """
+    Differences between two rankings: ``?from=<slug>&to=<slug>``.
+
+    Returns the songs added to and removed from ``to`` and the ones that moved,
+    with their ranks in both and the delta; see api.comparison.diff.
+    """
+    slugs = [request.GET.get("from"), request.GET.get("to")]
+    if not all(slugs):
+        return JsonResponse({"status": "error", "message": "Both from and to are required"}, status=400)
+    a, b = _rankings_named(slugs)
+    body, hit = response_cache.get_or_render(
+        response_cache.comparison_key("diff", a.pk, b.pk),
+        lambda: render_json(comparison.diff(a, b)),
+        tag=(a.version, b.version),
+    )
+    response = HttpResponse(body, content_type="application/json")
+    response.headers["X-Cache"] = "hit" if hit else "miss"
+    return response
+
+
+@api_view(["GET"])
+def ranking_aggregate(request):
+    """
+    Songs ordered by their positions across rankings: ``?lists=<slug>,<slug>&method=mean|borda&limit=<int>``.
+
+    Without ``lists`` all rankings are combined. ``mean`` (the default) orders by
+    mean rank the songs found in at least ``min_lists`` of them (default: all);
+    ``borda`` by Borda count. See api.comparison.aggregate.
+    """
+    # A ranking listed twice still counts once
+    slugs = list(dict.fromkeys(slug for slug in request.GET.get("lists", "").split(",") if slug))
+    rankings = _rankings_named(slugs) if slugs else list(Ranking.objects.all())
+    # The result doesn't depend on their order: one order for every request of the same set, so it's cached once
+    rankings.sort(key=lambda ranking: ranking.pk)
+    if not rankings:
+        return JsonResponse({"status": "error", "message": "There are no rankings to aggregate"}, status=400)
+    method = request.GET.get("method", "mean")
+    if method not in comparison.METHODS:
+        return JsonResponse(
+            {"status": "error", "message": f"method must be one of: {', '.join(comparison.METHODS)}"}, status=400
+        )
+    try:
+        limit = int(request.GET.get("limit", 100))
+        min_lists = int(request.GET["min_lists"]) if request.GET.get("min_lists") else None
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "limit and min_lists must be integers"}, status=400)
+    if not 1 <= limit <= comparison.MAX_AGGREGATE:
+        return JsonResponse(
+            {"status": "error", "message": f"limit must be between 1 and {comparison.MAX_AGGREGATE}"}, status=400
+        )
+
+    def render():
+        data = {
+            "lists": [ranking.slug for ranking in rankings],
+            "method": method,
+            "results": comparison.aggregate(rankings, method, limit, min_lists),
+        }
+        return render_json(data)
+
+    body, hit = response_cache.get_or_render(
+        response_cache.comparison_key("aggregate", *(ranking.pk for ranking in rankings)),
+        render,
+        tag=(method, limit, min_lists, tuple((ranking.pk, ranking.version) for ranking in rankings)),
+    )
+    response = HttpResponse(body, content_type="application/json")
+    response.headers["X-Cache"] = "hit" if hit else "miss"
+    return response
+
+
+@api_view(["GET"])
+def song_rankings(request, pk):
+    """The rankings a song belongs to, with its rank in each."""
+    if not Song.objects.filter(pk=pk).exists():
+        return JsonResponse({"status": "error", "message": "Song not found."}, status=404)
+    return HttpResponse(render_json(comparison.memberships(pk)), content_type="application/json")
 
 
 @api_view(["PATCH"])
@@ -74,10 +624,10 @@ def update_rank(request):
     """
     Updates the ranking of a song based on the provided song ID and new rank.
 
-    This function shifts the ranks of all songs affected in the process to maintain
-    a consistent and gapless ranking order. It handles the rank adjustment logic
-    to ensure that all songs between the old and new rank of the updated song
-    are correctly re-ranked.
+    Entries are ordered by a sparse key (see api.ordering), so the move only
+    rewrites the updated entry: it receives a key between the entries that
+    become its neighbours at the new rank. The ranks of all other songs shift
+    implicitly, and the dense rank returned by the API stays gapless.
 
     This endpoint expects a PATCH request with a JSON body.
     Expected JSON request format:
@@ -95,7 +645,7 @@ def update_rank(request):
     if request.method == "PATCH":
         try:
             data = json.loads(request.body)
-            ranking = _get_selected_ranking(request)
+            ranking = _get_selected_ranking(request, current=True)
 
             # Ensure newRank stays within [1, total_songs]
             total_songs = RankingEntry.objects.filter(ranking=ranking).count()
@@ -108,43 +658,16 @@ def update_rank(request):
             # Retrieve the ranking entry for the provided song within the selected ranking
             with transaction.atomic():
                 entry = RankingEntry.objects.select_for_update().get(ranking=ranking, song__id=data["songId"])
-                oldRank: int = entry.r_rank
-
-                if oldRank == newRank:
-                    return JsonResponse({"status": "success", "song_id": entry.song.id, "r_rank": entry.r_rank})
+                oldRank: int = rank_of(entry)
 
-                TEMP_SHIFT = 1_000_000
+                if oldRank != newRank:
+                    # Give the entry a key between its new neighbours; no other row is rewritten
+                    move_entry(entry, newRank, total_songs)
+                    changes.record(Ranking.objects.filter(pk=ranking.pk), RankingChange.MOVE, [entry.song_id])
 
-                if oldRank < newRank:
-                    # Bump the affected range far away to create space
-                    RankingEntry.objects.filter(ranking=ranking, r_rank__gt=oldRank, r_rank__lte=newRank).update(
-                        r_rank=F("r_rank") + TEMP_SHIFT
-                    )
-
-                    # Place the entry into target slot
-                    entry.r_rank = newRank
-                    entry.save(update_fields=["r_rank"])
-
-                    # Collapse the bumped range back by TEMP_SHIFT+1, effectively shifting -1
-                    RankingEntry.objects.filter(
-                        ranking=ranking, r_rank__gt=oldRank + TEMP_SHIFT, r_rank__lte=newRank + TEMP_SHIFT
-                    ).update(r_rank=F("r_rank") - (TEMP_SHIFT + 1))
-                else:
-                    # Bump the affected range far away to create space
-                    RankingEntry.objects.filter(ranking=ranking, r_rank__gte=newRank, r_rank__lt=oldRank).update(
-                        r_rank=F("r_rank") + TEMP_SHIFT
-                    )
-
-                    # Place the entry into target slot
-                    entry.r_rank = newRank
-                    entry.save(update_fields=["r_rank"])
-
-                    # Collapse the bumped range back by TEMP_SHIFT-1, effectively shifting +1
-                    RankingEntry.objects.filter(
-                        ranking=ranking, r_rank__gte=newRank + TEMP_SHIFT, r_rank__lt=oldRank + TEMP_SHIFT
-                    ).update(r_rank=F("r_rank") - (TEMP_SHIFT - 1))
-
-            return JsonResponse({"status": "success", "song_id": entry.song.id, "r_rank": entry.r_rank})
+            return JsonResponse({"status": "success", "song_id": entry.song_id, "r_rank": newRank})
+        except NotFound as e:
+            return JsonResponse({"status": "error", "message": str(e.detail)}, status=404)
         except RankingEntry.DoesNotExist:
             return JsonResponse({"status": "error", "message": "Song is not part of the selected ranking"}, status=404)
         except KeyError as e:
@@ -155,6 +678,82 @@ def update_rank(request):
         return JsonResponse({"status": "error", "message": "Invalid request method"}, status=405)
 
 
+@api_view(["PATCH"])
+@permission_classes([IsAuthenticated])
+def update_rank_batch(request):
+    """
+    Applies many rank changes to the selected ranking in a single transaction.
+
+    The entries of the ranking are read once, the requested changes are applied
+    to that order in memory, and only the entries whose position can't be kept
+    with their current key are written (see api.ordering.apply_order).
+
+    This endpoint expects a PATCH request with a JSON body in one of two forms.
+    A list of moves, applied in order with the same clamping as update/rank/:
+    {
+        "moves": [{"songId": <int>, "newRank": <int>}, ...]
+    }
+    Or the complete new order of the ranking, as a permutation of its song IDs:
+    {
+        "order": [<int>, ...]
+    }
+
+    Returns:
+    - A JSON response with a status of 'success', the number of entries in the
+      ranking and the number of rows written.
+    - A JSON response with a status of 'error' and an error message if the request
+      is malformed or references a song that is not part of the ranking.
+    """
+    try:
+        data = json.loads(request.body)
+        ranking = _get_selected_ranking(request, current=True)
+
+        with transaction.atomic():
+            rows = list(
+                RankingEntry.objects.select_for_update()
+                .filter(ranking=ranking)
+                .order_by("r_key")
+                .values_list("song_id", "id", "r_key")
+            )
+            by_song = {song_id: (pk, key) for song_id, pk, key in rows}
+
+            if "order" in data:
+                song_ids = [int(song_id) for song_id in data["order"]]
+                if len(song_ids) != len(by_song) or set(song_ids) != by_song.keys():
+                    return JsonResponse(
+                        {"status": "error", "message": "order must list every song of the ranking exactly once"},
+                        status=400,
+                    )
+            else:
+                song_ids = [song_id for song_id, _, _ in rows]
+                for move in data["moves"]:
+                    song_id = int(move["songId"])
+                    if song_id not in by_song:
+                        return JsonResponse(
+                            {"status": "error", "message": f"Song {song_id} is not part of the selected ranking"},
+                            status=404,
+                        )
+                    # Clamp into [1, total_songs] like update_rank does
+                    new_rank = min(max(int(move["newRank"]), 1), len(song_ids))
+                    song_ids.remove(song_id)
+                    song_ids.insert(new_rank - 1, song_id)
+
+            rewritten = set(apply_order(ranking.id, [by_song[song_id] for song_id in song_ids]))
+            if rewritten:
+                moved = [song_id for song_id, (pk, _) in by_song.items() if pk in rewritten]
+                changes.record(Ranking.objects.filter(pk=ranking.pk), RankingChange.MOVE, moved)
+
+        return JsonResponse({"status": "success", "total": len(song_ids), "written": len(rewritten)})
+    except NotFound as e:
+        return JsonResponse({"status": "error", "message": str(e.detail)}, status=404)
+    except KeyError as e:
+        return JsonResponse({"status": "error", "message": f"Missing key in request: {str(e)}"}, status=400)
+    except (TypeError, ValueError) as e:
+        return JsonResponse({"status": "error", "message": f"Invalid request: {str(e)}"}, status=400)
+    except Exception as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+
 class UploadCSV(APIView):
     """
     A view that handles CSV file uploads for importing songs into the database via POST requests.
@@ -162,9 +761,11 @@ class UploadCSV(APIView):
     This class uses the MultiPartParser and FormParser to handle file uploads
     in multipart/form-data format. It expects a POST request with a file named 'file'.
     Upon receiving the file, it checks the file size.
-    If the size is within limits, it saves the file to a backup directory and calls
-    the 'import_songs' Django management command to import the songs from the CSV into
-    the database.
+    Files up to 1MB are saved to a backup directory and imported by calling the
+    'import_songs' Django management command.
+    Larger files (up to settings.CSV_STREAM_MAX_SIZE), or any file when the request
+    has ?stream=1, are imported in streaming mode straight from the upload chunks
+    (see api.importer.stream_import), without a backup copy and with flat memory use.
 
     If the import is successful, it returns a JSON response with a status of 'success'.
     If an error occurs during the import process, it returns a JSON response with a status
@@ -178,8 +779,13 @@ class UploadCSV(APIView):
     def post(self, request, *args, **kwargs):
         csv_file = request.FILES.get("file")
         if csv_file:
-            if csv_file.size > 1048576:  # 1MB
-                return JsonResponse({"error": "The file is too large. The maximum size is 1MB."}, status=400)
+            if csv_file.size > settings.CSV_STREAM_MAX_SIZE:
+                return JsonResponse(
+                    {"error": f"The file is too large. The maximum size is {settings.CSV_STREAM_MAX_SIZE // 1048576}MB."},
+                    status=400,
+                )
+            if csv_file.size > 1048576 or request.GET.get("stream"):  # 1MB
+                return self.post_stream(request, csv_file)
             backup_dir = ".backup"
             os.makedirs(backup_dir, exist_ok=True)  # Ensure the backup directory exists
             file_path = os.path.join(backup_dir, "songs_import.csv")
@@ -189,8 +795,8 @@ class UploadCSV(APIView):
                     destination.write(chunk)
 
             try:
-                # Choose ranking from query params, default to 'main'
-                ranking = _get_selected_ranking(request)
+                # Choose ranking from query params, default to 'main'; imports may create it
+                ranking = _get_or_create_selected_ranking(request)
                 call_command("import_songs", file_path, ranking=ranking.slug)
                 return JsonResponse({"status": "success"}, status=200)
             except Exception as e:
@@ -199,12 +805,25 @@ class UploadCSV(APIView):
         else:
             return JsonResponse({"status": "error", "message": "No file provided"}, status=400)
 
+    def post_stream(self, request, csv_file):
+        errors = []
+        try:
+            ranking = _get_or_create_selected_ranking(request)
+            imported = stream_import(ranking, csv_file.chunks(), errors.append)
+        except Exception as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=500)
+        # Skipped rows are reported like import_songs does; keep the response bounded
+        return JsonResponse(
+            {"status": "success", "imported": imported, "skipped": len(errors), "errors": errors[:MAX_REPORTED_ERRORS]},
+            status=200,
+        )
+
 
 class AddSong(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
-        ranking = _get_selected_ranking(request)
+        ranking = _get_selected_ranking(request, current=True)
 
         data = request.data.copy()
         yt_id = data.get("s_yt_id")
@@ -232,9 +851,8 @@ class AddSong(APIView):
                         {"error": "Song already exists in this ranking."},
                         status=status.HTTP_400_BAD_REQUEST,
                     )
-                highest = RankingEntry.objects.filter(ranking=ranking).aggregate(Max("r_rank"))["r_rank__max"] or 0
-                new_rank_value = highest + 1
-                RankingEntry.objects.create(ranking=ranking, song=song, r_rank=new_rank_value)
+                RankingEntry.objects.create(ranking=ranking, song=song, r_key=next_key(ranking))
+                changes.record(Ranking.objects.filter(pk=ranking.pk), RankingChange.INSERT, [song.id])
         except IntegrityError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -250,31 +868,102 @@ def update_song(request, pk):
     except Song.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
+    old_yt_id = song.s_yt_id
     serializer = SongSerializer(song, data=request.data, partial=True)
     if serializer.is_valid():
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
+            # Song metadata is shared, so every ranking listing the song changes
+            changes.record(Ranking.objects.filter(entries__song=song), RankingChange.UPDATE, [song.id])
+            response_cache.invalidate(yt_ids={old_yt_id, song.s_yt_id})
         return JsonResponse(serializer.data)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(["PATCH"])
+@permission_classes([IsAuthenticated])
+def update_song_batch(request):
+    """
+    Updates the metadata of many songs in a single transaction.
+
+    This endpoint expects a PATCH request with a JSON body listing partial
+    updates of songs, identified by their IDs:
+    {
+        "songs": [{"id": <int>, "s_artist": <str>, ...}, ...]
+    }
+    Each update is validated like songs/update/<pk> does, except that YouTube
+    IDs can't be changed here. Updates that are invalid, list a field that
+    can't be changed or name a song that doesn't exist are rejected; the rest
+    are applied, writing only the songs whose values change (see api.metadata).
+
+    Returns:
+    - A JSON response with a status of 'success', the numbers of songs
+      unchanged, updated and rejected, and the errors of the first rejected ones.
+    - A JSON response with a status of 'error' and an error message if the
+      request is malformed.
+    """
+    try:
+        items = json.loads(request.body)["songs"]
+        errors = []
+        valid = {}
+        seen = set()
+        # One serializer validates every item: building its fields costs more than validating one
+        serializer = SongMetadataSerializer(partial=True)
+        for item in items:
+            song_id = int(item["id"])
+            unknown = sorted(set(item) - {"id", *metadata.METADATA_FIELDS})
+            if song_id in seen:
+                errors.append({"id": song_id, "errors": {"id": ["Song listed more than once."]}})
+                continue
+            seen.add(song_id)
+            if unknown:
+                errors.append({"id": song_id, "errors": {name: ["This field can't be changed here."] for name in unknown}})
+                continue
+            try:
+                valid[song_id] = serializer.run_validation(item)
+            except ValidationError as e:
+                errors.append({"id": song_id, "errors": e.detail})
+
+        songs = Song.objects.in_bulk(list(valid))
+        for song_id in valid.keys() - songs.keys():
+            errors.append({"id": song_id, "errors": {"id": ["Song not found."]}})
+
+        with transaction.atomic():
+            result = metadata.update_songs(
+                [(song, valid[song_id]) for song_id, song in songs.items()],
+                lambda message: errors.append({"errors": {"non_field_errors": [message]}}),
+            )
+        return JsonResponse(
+            {
+                "status": "success",
+                "unchanged": result["unchanged"],
+                "updated": result["updated"],
+                "rejected": len(errors),
+                "errors": errors[:MAX_REPORTED_ERRORS],
+            }
+        )
+    except KeyError as e:
+        return JsonResponse({"status": "error", "message": f"Missing key in request: {str(e)}"}, status=400)
+    except (TypeError, ValueError) as e:
+        return JsonResponse({"status": "error", "message": f"Invalid request: {str(e)}"}, status=400)
+    except Exception as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+
 @api_view(["DELETE"])
 @permission_classes([IsAuthenticated])
 def delete_song(request, pk):
-    ranking = _get_selected_ranking(request)
+    ranking = _get_selected_ranking(request, current=True)
     try:
         with transaction.atomic():
             song = Song.objects.get(pk=pk)
             # Remove only from the selected ranking
+            # The remaining entries keep their keys; their dense ranks close the gap on read
             entry = RankingEntry.objects.get(ranking=ranking, song=song)
-            deleted_rank = entry.r_rank
             entry.delete()
-
-            # Update ranks of remaining songs in this ranking
-            RankingEntry.objects.filter(ranking=ranking, r_rank__gt=deleted_rank).update(r_rank=F("r_rank") - 1)
-
-            # If song is no longer used in any ranking, delete it
-            if not song.memberships.exists():
-                song.delete()
+            changes.record(Ranking.objects.filter(pk=ranking.pk), RankingChange.DELETE, [song.id])
+            # gc_songs deletes the song if no other ranking uses it
+            orphans.enqueue([song.id])
 
         return JsonResponse(
             {"status": "success", "message": f"Song with id {pk} removed from ranking {ranking.slug}."},
@@ -295,7 +984,7 @@ class LoginAPIView(APIView):
         serializer = LoginSerializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
             user = serializer.validated_data
-            refresh = RefreshToken.for_user(user)
+            refresh = tokens_for(user)
             return Response(
                 {
                     "refresh": str(refresh),
@@ -0,0 +1,14 @@
+"""
+URL configuration for requests served through toplista.asgi.
+
+Selected per request by api.middleware.asgi_urlconf_middleware; the same as
+toplista.urls, with the api routes from api.async_urls.
+"""
+from django.urls import path, include
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/', include('api.async_urls')),
+    *sync_urlpatterns,
+]
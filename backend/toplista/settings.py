@@ -51,27 +51,45 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Users are built from the token's claims, without a query (see api.authentication)
+        'api.authentication.StatelessJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
 }
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=5),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    # Tokens carry a hash of the password they were issued for; changing it revokes them
+    "CHECK_REVOKE_TOKEN": True,
 }
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',    # needs to be on top of the list, per cors-headers documentation
+    'api.middleware.instrumentation_middleware',  # removes itself unless INSTRUMENTATION['ENABLED']
     'django.middleware.security.SecurityMiddleware',
+    # Compresses responses not served precompressed (see api.compression), with brotli if installed
+    'api.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.asgi_urlconf_middleware',
 ]
 
+# Per-endpoint query counts and timings, served at api/_stats/ and in Server-Timing headers (see api.instrumentation)
+INSTRUMENTATION = {
+    'ENABLED': False,
+}
+
 ROOT_URLCONF = 'toplista.urls'
+# Used instead of ROOT_URLCONF for requests served under ASGI (see api.middleware)
+ASGI_ROOT_URLCONF = 'toplista.asgi_urls'
 
 TEMPLATES = [
     {
@@ -92,13 +110,52 @@ TEMPLATES = [
 WSGI_APPLICATION = 'toplista.wsgi.application'
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# "responses" holds rendered read responses (see api.response_cache). The local-memory
+# backend evicts least recently used entries past MAX_ENTRIES but is private to each
+# worker process; to share one cache between workers, use a file-based cache instead:
+#     'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#     'LOCATION': BASE_DIR / 'cache' / 'responses',
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 500,
+        },
+    },
+}
+
+
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Production profile for SQLite (see toplista/sqlite/base.py): in WAL mode readers and
+# the writer don't block each other, and write transactions queue for the write lock
+# at BEGIN instead of failing halfway. Connections are kept for CONN_MAX_AGE seconds.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'toplista.sqlite',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',  # durable at checkpoints; safe from corruption in WAL mode
+                'busy_timeout': 5000,  # ms to wait for the write lock
+                'mmap_size': 256 * 1048576,
+                'cache_size': -64000,  # KiB, per connection
+                'temp_store': 'MEMORY',
+            },
+        },
     }
 }
 
@@ -146,3 +203,22 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 FILE_UPLOAD_MAX_MEMORY_SIZE = 1048576  # 1MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 1048576  # 1MB
+CSV_STREAM_MAX_SIZE = 512 * 1048576  # 512MB, larger CSV uploads are rejected
+
+# Retention of the per-ranking change log behind rankings/<slug>/changes (see api.changes.compact)
+RANKING_CHANGES = {
+    "MAX_AGE": timedelta(days=30),
+    "MAX_ROWS": 10_000,
+}
+
+# Snapshots kept per ranking, newest first (see api.snapshots)
+RANKING_SNAPSHOTS = {
+    "MAX_PER_RANKING": 20,
+}
+
+# Regression thresholds of manage.py perf_suite (see api.perf.compare)
+PERF_SUITE = {
+    "MAX_REGRESSION": 0.25,  # a p50 may grow by this fraction of the baseline's...
+    "MIN_DELTA_MS": 2.0,  # ...or by this many ms, whichever is larger (timer noise)
+    "BUDGETS_MS": {},  # p50 limits per case at every size, e.g. {"GET songs/sample/": 50}
+}
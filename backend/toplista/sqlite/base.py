@@ -0,0 +1,47 @@
+"""
+SQLite database backend for production use.
+
+It is Django's SQLite backend with two additions, configured through
+DATABASES OPTIONS:
+
+- ``pragmas``: PRAGMA statements run on every new connection, from a
+  connection_created handler (e.g. WAL journal mode, busy_timeout).
+- ``transaction_mode``: "DEFERRED" (SQLite's default), "IMMEDIATE" or
+  "EXCLUSIVE", used for the BEGIN of every transaction.atomic() block.
+  With IMMEDIATE a transaction takes the write lock when it starts and waits
+  for it (up to busy_timeout) instead of failing with "database is locked"
+  when it tries to upgrade a read lock to a write lock mid-transaction.
+
+Django 5.1 supports ``transaction_mode`` natively, as does ``init_command``
+for the pragmas.
+"""
+from django.db.backends.signals import connection_created
+from django.db.backends.sqlite3 import base
+
+BACKEND_OPTIONS = ("pragmas", "transaction_mode")
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Not arguments of sqlite3.connect()
+        for option in BACKEND_OPTIONS:
+            params.pop(option, None)
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict["OPTIONS"].get("transaction_mode")
+        self.cursor().execute(f"BEGIN {mode}" if mode else "BEGIN")
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """Run the connection's configured PRAGMAs."""
+    if connection.vendor != "sqlite":
+        return
+    pragmas = connection.settings_dict["OPTIONS"].get("pragmas", {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+connection_created.connect(apply_pragmas)
@@ -18,7 +18,23 @@ export const fetchSongs = async (slugParam?: string): Promise<Song[]> => {
   }
 };
 
-interface SongUpdate {
+// Random songs of the current ranking, picked by the server and returned in rank order
+export const fetchSongSample = async (n: number): Promise<Song[]> => {
+  try {
+    const slug = getCurrentRankingSlug();
+    const response = await fetch(`${process.env.REACT_APP_API_URL}songs/sample/?list=${encodeURIComponent(slug)}&n=${n}`);
+    if (!response.ok) {
+      throw new Error("Network response was not ok");
+    }
+    const sample: { results: Song[] } = await response.json();
+    return sample.results;
+  } catch (error) {
+    console.error("Error getting song sample:", error);
+    throw error;
+  }
+};
+
+export interface SongUpdate {
   songId: number;
   newRank: number;
 }
@@ -34,6 +50,20 @@ export const updateSongRank = async (songUpdate: SongUpdate) => {
   }
 };
 
+// Applies many rank changes in one request and one transaction, in the given order
+export const updateSongRanks = async (songUpdates: SongUpdate[], slugParam?: string) => {
+  try {
+    const slug = slugParam ?? getCurrentRankingSlug();
+    const response = await apiClient.patch(`update/rank/batch/?list=${encodeURIComponent(slug)}`, {
+      moves: songUpdates,
+    });
+    console.log("Successfully updated the songs: ", response.data);
+  } catch (error) {
+    console.error("Error updateSongRanks:", error);
+    throw error; // Re-throwing the error to be handled by the caller
+  }
+};
+
 export const addNewSong = async (newSong: Omit<Song, "id">): Promise<void> => {
   try {
     const slug = getCurrentRankingSlug();
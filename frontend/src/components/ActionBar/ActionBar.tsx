@@ -29,11 +29,11 @@ const ActionBar: React.FC<ActionBarProps> = ({ songs, setSongs, onRandomSelected
         <PlayTop50 link={top50Link} />
       </div>
       <div className="nav-item">
-        <PlayRandom50 songs={songs} onRandomSelected={onRandomSelected} />
+        <PlayRandom50 onRandomSelected={onRandomSelected} />
       </div>
       <div className="nav-item">
         {isLoggedIn ? <ImportComponent setSongs={setSongs} /> : <br />}
-        <ExportComponent songs={songs} />
+        <ExportComponent />
       </div>
       <div className="nav-item">
         <LoginForm />
@@ -1,40 +1,36 @@
 import React, { useState } from "react";
-import { Song } from "../Song";
+import { fetchSongSample } from "../../api/songService";
 
 interface PlayRandom50Props {
-  songs: Song[];
   onRandomSelected?: (selectedSongIds: number[]) => void;
 }
 
-const PlayRandom50: React.FC<PlayRandom50Props> = ({ songs, onRandomSelected }) => {
+const PlayRandom50: React.FC<PlayRandom50Props> = ({ onRandomSelected }) => {
   const [selectedSongIds, setSelectedSongIds] = useState<number[] | null>(null);
   const [playlistUrl, setPlaylistUrl] = useState<string | null>(null);
-  function shuffle(o: number[]): number[] {
-    // Fisher–Yates shuffle algorithm
-    // https://en.wikipedia.org/wiki/Fisher%E2%80%93Yates_shuffle
-    for (let i = o.length - 1; i > 0; i--) {
-      let j = Math.floor(Math.random() * (i + 1));
-      [o[i], o[j]] = [o[j], o[i]]; // ES6 array destructuring syntax for swapping elements
-    }
-    return o;
-  }
 
-  const handleClick = (e: React.MouseEvent<HTMLAnchorElement>) => {
+  const handleClick = async (e: React.MouseEvent<HTMLAnchorElement>) => {
     e.preventDefault();
-    const count = Math.min(50, songs.length);
-    const indexes: number[] = [];
-    for (let i = 0; i < songs.length; i++) indexes.push(i);
-
-    const randoms = shuffle(indexes).slice(0, count).sort((a, b) => a - b);
-    const playlistIds = randoms.map((idx) => songs[idx].s_yt_id);
-    const ids = randoms.map((idx) => songs[idx].id);
-    const url =
-      "https://www.youtube.com/watch_videos?video_ids=" + playlistIds.join(",");
+    // Open the tab before awaiting: browsers block window.open() outside of the click itself
+    const tab = window.open("about:blank", "_blank");
+    try {
+      // The server picks the songs, so the whole ranking doesn't have to be shuffled here
+      const sample = await fetchSongSample(50);
+      const playlistIds = sample.map((song) => song.s_yt_id);
+      const ids = sample.map((song) => song.id);
+      const url =
+        "https://www.youtube.com/watch_videos?video_ids=" + playlistIds.join(",");
 
-    setSelectedSongIds(ids);
-    setPlaylistUrl(url);
-    onRandomSelected?.(ids);
-    window.open(url, "_blank", "noopener,noreferrer");
+      setSelectedSongIds(ids);
+      setPlaylistUrl(url);
+      onRandomSelected?.(ids);
+      if (tab) {
+        tab.opener = null;
+        tab.location.href = url;
+      }
+    } catch (error) {
+      tab?.close();
+    }
   };
 
   return (
@@ -1,3 +1,4 @@
+import { useEffect, useRef } from "react";
 import {
   DndContext,
   closestCenter,
@@ -19,10 +20,19 @@ import {
 import "./SongList.css";
 import SongComponent, { Song } from "./Song";
 import AddSongForm from "./AddSongForm";
-import { updateSongRank, addNewSong, fetchSongs } from "../api/songService";
+import { SongUpdate, updateSongRanks, addNewSong, fetchSongs } from "../api/songService";
+import { getCurrentRankingSlug } from "../api/utilRanking";
 import { useAuth } from "../contexts/AuthContext";
 import { useRanking } from "../contexts/RankingContext";
 
+// Drags made within this long of each other are saved together, in one update/rank/batch/ request
+const MOVE_BATCH_DELAY_MS = 1000;
+
+interface PendingMoves {
+  slug: string;
+  moves: SongUpdate[];
+}
+
 interface SongListProps {
   songs: Song[];
   setSongs: React.Dispatch<React.SetStateAction<Song[]>>;
@@ -42,11 +52,47 @@ const SongList: React.FC<SongListProps> = ({ songs, setSongs, selectedRandomIds
     })
   );
 
+  const pendingMoves = useRef<PendingMoves | null>(null);
+  const flushTimer = useRef<ReturnType<typeof setTimeout> | null>(null);
+
+  const flushMoves = async () => {
+    if (flushTimer.current) {
+      clearTimeout(flushTimer.current);
+      flushTimer.current = null;
+    }
+    const pending = pendingMoves.current;
+    pendingMoves.current = null;
+    if (!pending) return;
+    try {
+      await updateSongRanks(pending.moves, pending.slug);
+    } catch (error) {
+      console.error("Error after dragging songs: ", error);
+    }
+    try {
+      // The server's order, with correct r_rank values; if saving failed this undoes the optimistic moves.
+      // Skipped if the ranking changed or more drags are waiting, which will fetch it again
+      const updated = await fetchSongs(pending.slug);
+      if (pending.slug === getCurrentRankingSlug() && !pendingMoves.current) {
+        setSongs(updated);
+      }
+    } catch (error) {
+      console.error("Error after dragging songs: ", error);
+    }
+  };
+
+  // Save the moves still waiting when the ranking changes or the list goes away
+  useEffect(() => {
+    return () => {
+      flushMoves();
+    };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [currentSlug]);
+
   const handleDragStart = (event: any) => {
     document.body.style.cursor = "grabbing";
   };
 
-  const handleDragEnd = async (event: any) => {
+  const handleDragEnd = (event: any) => {
     document.body.style.cursor = "";
     const { active, over } = event;
 
@@ -57,18 +103,17 @@ const SongList: React.FC<SongListProps> = ({ songs, setSongs, selectedRandomIds
       // 1) Optimistically move the item in the UI
       setSongs((songs) => arrayMove(songs, oldIndex, newIndex));
 
-      try {
-        // 2) Notify the backend to update all affected ranks
-        await updateSongRank({ songId: active.id, newRank: newIndex + 1 });
+      // 2) Queue the move; the moves of a curating session go to the backend together, in order
+      if (!pendingMoves.current) {
+        pendingMoves.current = { slug: currentSlug, moves: [] };
+      }
+      pendingMoves.current.moves.push({ songId: active.id, newRank: newIndex + 1 });
 
-        // 3) Fetch the updated song list with correct r_rank values from the server
-        const updated = await fetchSongs();
-        setSongs(updated);
-      } catch (error) {
-        // 4) On error, rollback the optimistic UI update
-        setSongs((songs) => arrayMove(songs, newIndex, oldIndex));
-        console.error("Error after dragging a song: ", error);
+      // 3) Save them once no drag has followed for a while (see flushMoves)
+      if (flushTimer.current) {
+        clearTimeout(flushTimer.current);
       }
+      flushTimer.current = setTimeout(flushMoves, MOVE_BATCH_DELAY_MS);
     }
   };
 